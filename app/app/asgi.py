@@ -0,0 +1,143 @@
+"""
+ASGI config for app project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+Django 2.1 has no native ASGI handler (nor async views), so the regular WSGI
+application runs on a bounded thread pool and everything around it is async:
+the request body is read and the response is written on the event loop.
+A slow client therefore never holds a thread (nor its DB connection), only
+the time spent inside Django does. Serve it with:
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker \
+        app.asgi:application
+
+ASGI_THREADS sets the size of the pool, which is also the maximum number of
+DB connections each worker process opens. Responses larger than
+ASGI_BUFFER_SIZE are streamed: a thread reads every batch.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from asgiref.wsgi import WsgiToAsgiInstance
+from django.core.wsgi import get_wsgi_application
+
+# Responses up to this size are read at once, and sent after their thread
+# is released. Larger ones (media files) are read and sent by batches of
+# this size, so only one batch per request is in memory.
+BUFFER_SIZE = int(os.environ.get('ASGI_BUFFER_SIZE', 1024 * 1024))
+
+
+class ThreadPoolWsgiToAsgiInstance(WsgiToAsgiInstance):
+    """Serve one request: async I/O, WSGI app on the pool"""
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+        self.result = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError('WSGI wrapper received a non-HTTP scope')
+        self.scope = scope
+        loop = asyncio.get_event_loop()
+        with SpooledTemporaryFile(max_size=65536) as body:
+            # Waiting for a slow upload does not use a thread.
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    # The client left: there's no one to answer.
+                    return
+                if message['type'] != 'http.request':
+                    raise ValueError(
+                        'WSGI wrapper received a non-HTTP-request message'
+                    )
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            chunks = await loop.run_in_executor(
+                self.executor, self.run_wsgi_app, body
+            )
+
+        # The thread is free again; a slow reader only costs a coroutine.
+        try:
+            await send(self.response_start)
+            while chunks:
+                for chunk in chunks:
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True
+                    })
+                if self.result is None:
+                    break
+                # A large response (f.e. a media file): one batch at a time.
+                chunks = await loop.run_in_executor(self.executor,
+                                                    self.read_chunks)
+            await send({'type': 'http.response.body'})
+        finally:
+            if self.result is not None:
+                await loop.run_in_executor(self.executor, self.close)
+
+    def run_wsgi_app(self, body):
+        """Run the WSGI app in a pool thread and read its first chunks"""
+        environ = self.build_environ(self.scope, body)
+        self.result = self.wsgi_application(environ, self.start_response)
+        self.iterator = iter(self.result)
+        try:
+            chunks = self.read_chunks()
+        except BaseException:
+            self.close()
+            raise
+        if sum(map(len, chunks)) < BUFFER_SIZE:
+            # All of it: the response is sent without the thread.
+            self.close()
+        return chunks
+
+    def read_chunks(self):
+        """The next chunks of the response, about BUFFER_SIZE bytes"""
+        # A large response is never held in memory as a whole.
+        chunks, size = [], 0
+        for chunk in self.iterator:
+            if chunk:
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= BUFFER_SIZE:
+                    break
+        return chunks
+
+    def close(self):
+        """Close the response, once"""
+        result, self.result = self.result, None
+        # Fires request_finished, which recycles the DB connection.
+        if hasattr(result, 'close'):
+            result.close()
+
+
+class ThreadPoolWsgiToAsgi:
+    """Wrap a WSGI application into an ASGI one backed by a thread pool"""
+
+    def __init__(self, wsgi_application, max_workers):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='asgi-wsgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        instance = ThreadPoolWsgiToAsgiInstance(
+            self.wsgi_application,
+            self.executor
+        )
+        await instance(scope, receive, send)
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+
+application = ThreadPoolWsgiToAsgi(
+    get_wsgi_application(),
+    max_workers=int(os.environ.get('ASGI_THREADS', 16))
+)
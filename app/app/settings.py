@@ -45,17 +45,73 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so /healthz and /readyz skip the rest of the stack.
+    'core.middleware.HealthCheckMiddleware',
+    # Disabled (and removed from the stack) unless PROFILING_ENABLED.
+    'core.middleware.ProfilingMiddleware',
+    # Disabled (and removed from the stack) unless QUERY_STATS_ENABLED.
+    'core.middleware.QueryStatsMiddleware',
+    # Before the others, so it compresses their final response.
+    'core.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # Runs SESSION_MIDDLEWARE, except for LIGHTWEIGHT_PATH_PREFIXES.
+    'core.middleware.PathRoutedMiddleware',
+]
+
+# Middleware only needed by the session-based pages (the admin).
+SESSION_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Token-authenticated paths that skip SESSION_MIDDLEWARE.
+LIGHTWEIGHT_PATH_PREFIXES = ['/api/user/', '/api/recipe/', '/api/jobs/']
+
 ROOT_URLCONF = 'app.urls'
 
+# Seconds the result of the readiness checks (/readyz) is reused for.
+HEALTH_CHECK_CACHE_SECONDS = 5
+
+# On-demand profiles of single requests (X-Profile header or ?profile=1,
+# staff tokens only), written to PROFILING_DIR.
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED') == '1'
+PROFILING_DIR = os.environ.get('PROFILING_DIR', '/tmp/profiles')
+# Older profiles are deleted.
+PROFILING_MAX_FILES = 50
+# Stack frames kept per allocation.
+PROFILING_TRACEMALLOC_FRAMES = 10
+
+# Query latency histograms and slow query plans (manage.py query_report).
+QUERY_STATS_ENABLED = os.environ.get('QUERY_STATS_ENABLED') == '1'
+# SELECTs slower than this get their plan captured...
+QUERY_STATS_EXPLAIN_MS = 100
+# ...at most once per query and process in this many seconds.
+QUERY_STATS_EXPLAIN_INTERVAL = 3600
+# Each process writes its counts to the database this often.
+QUERY_STATS_FLUSH_SECONDS = 30
+
+# Response compression: encoding -> level, in order of preference.
+# Measure other levels with `manage.py bench_compression`.
+COMPRESSION_LEVELS = {
+    'zstd': 3,
+    'br': 4,
+    'gzip': 6,
+}
+# Smaller responses aren't worth compressing.
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_CONTENT_TYPES = (
+    'application/json',
+    'application/msgpack',
+    'application/javascript',
+    'application/xml',
+    'text/',
+    'image/svg+xml',
+)
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -74,6 +130,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'app.wsgi.application'
 
+# Fast password hasher and in-memory media for the tests.
+TEST_RUNNER = 'core.testing.FastTestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/2.1/ref/settings/#databases
@@ -133,7 +192,130 @@ MEDIA_URL = '/media/'
 # We tell django where to store the media files.
 # (as per our Dockerfile).
 MEDIA_ROOT = '/vol/web/media'
+# How the media files are served:
+# 'sendfile': by Django, with zero-copy sendfile under gunicorn.
+# 'x-accel': handed off to nginx with an X-Accel-Redirect header.
+# 'x-sendfile': handed off to Apache/lighttpd with an X-Sendfile header.
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'sendfile')
+# Internal nginx location that maps to MEDIA_ROOT (x-accel mode).
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# Uploaded file names are unique, so they can be cached for a year.
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
 # We tell django where to get the static files from.
 STATIC_ROOT = '/vol/web/static'
 
-AUTH_USER_MODEL = 'core.User'
\ No newline at end of file
+# Where the media is stored: 'local' (MEDIA_ROOT, a volume of the node) or
+# 's3' (an S3-compatible bucket shared by every instance, see
+# core.storage). Copy the existing files with `manage.py copy_media`.
+MEDIA_STORAGE = os.environ.get('MEDIA_STORAGE', 'local')
+DEFAULT_FILE_STORAGE = {
+    'local': 'django.core.files.storage.FileSystemStorage',
+    's3': 'core.storage.S3Storage',
+}[MEDIA_STORAGE]
+S3_BUCKET = os.environ.get('S3_BUCKET')
+# f.e.: http://minio:9000 for MinIO. Unset: AWS.
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+S3_REGION = os.environ.get('S3_REGION')
+# Unset: boto3's own lookup (environment, instance role...).
+S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID')
+S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY')
+# Base URL of a public bucket (or its CDN). Unset: presigned URLs.
+S3_PUBLIC_URL = os.environ.get('S3_PUBLIC_URL')
+# Lifetime (seconds) of the presigned download and upload URLs.
+S3_URL_EXPIRY = 3600
+# Larger files are sent in parts, by the app and by direct uploads.
+S3_MULTIPART_THRESHOLD = 16 * 1024 * 1024
+# At least 5 MB: the minimum part size of S3.
+S3_MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+# Direct uploads (upload-url): largest image and accepted types.
+MEDIA_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+MEDIA_UPLOAD_CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+
+AUTH_USER_MODEL = 'core.User'
+
+# Recipes (tags, ingredients) deleted per statement by core.deletion.
+DELETION_BATCH_SIZE = 1000
+# DELETE /api/user/me/ only deactivates the account and a job deletes it
+# (out of the request). False: delete inline.
+ACCOUNT_DELETION_DEFERRED = True
+
+# Background jobs (core.jobs, `manage.py run_worker`).
+JOB_MAX_ATTEMPTS = 3
+# Delay before the first retry, doubled for every later one.
+JOB_RETRY_DELAY = 10
+# A job running for longer without a heartbeat (core.jobs.heartbeat) is
+# assumed lost and run again.
+JOB_VISIBILITY_TIMEOUT = 300
+# Most jobs of a queue running at the same time, across all the workers.
+JOB_QUEUE_CONCURRENCY = {'images': 2}
+
+# Uploaded images are shrunk (in a job) to fit this many pixels.
+RECIPE_IMAGE_MAX_SIZE = 2048
+
+# Similar recipes (core.similarity): default and largest number of results.
+SIMILAR_RECIPES_DEFAULT = 10
+SIMILAR_RECIPES_MAX = 50
+# The results of a recipe are cached until its user's vectors change, or
+# for this many seconds.
+SIMILAR_RECIPES_CACHE_SECONDS = 300
+# Users whose vector matrices every process keeps in memory (LRU).
+SIMILAR_RECIPES_MATRIX_CACHE_SIZE = 16
+
+# Shopping lists (core.shopping) are cached until their recipes' ingredients
+# change, or for this many seconds.
+SHOPPING_LIST_CACHE_SECONDS = 3600
+
+# How long the recipient of a shared recipe has to accept it, in seconds.
+RECIPE_SHARE_MAX_AGE = 60 * 60 * 24 * 7
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rate limiting counters. Set THROTTLE_CACHE_LOCATION (host:port of a
+    # memcached) to share them between all the workers and instances.
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ.get('THROTTLE_CACHE_LOCATION'),
+    } if os.environ.get('THROTTLE_CACHE_LOCATION') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+    },
+}
+THROTTLE_CACHE = 'throttle'
+
+REST_FRAMEWORK = {
+    # MessagePack is opt-in with `Accept: application/msgpack` (or
+    # ?format=msgpack) and `Content-Type: application/msgpack`.
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'core.renderers.MessagePackRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'core.parsers.MessagePackParser',
+    ],
+    # Views override it for login, signup and image uploads.
+    'DEFAULT_THROTTLE_CLASSES': ['core.throttling.ReadWriteThrottle'],
+    # Per user, or per IP address for anonymous requests.
+    'DEFAULT_THROTTLE_RATES': {
+        'login': '10/min',
+        'signup': '20/hour',
+        'upload': '60/hour',
+        'read': '600/min',
+        'write': '120/min',
+    },
+    # Number of reverse proxies (f.e. 1 behind nginx) in front of the app:
+    # the client IP of the throttles is the address the farthest of them
+    # appended to X-Forwarded-For. With 0 (served directly), the header is
+    # ignored, as any client can set it.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
\ No newline at end of file
@@ -0,0 +1,43 @@
+"""
+Slim settings for the processes that only serve the API: API-only
+gunicorn instances, run_worker and wait_for_db.
+
+Same as app.settings without the admin and the apps only it needs
+(sessions, messages, staticfiles), the session middleware and the
+browsable API: less to import and to check at every boot. Run migrate,
+collectstatic and the admin with app.settings.
+
+    DJANGO_SETTINGS_MODULE=app.settings_api gunicorn app.wsgi
+"""
+from app.settings import *  # noqa: F401,F403
+from app.settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK, \
+                         TEMPLATES
+
+ADMIN_ONLY_APPS = [
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+]
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in ADMIN_ONLY_APPS]
+
+# Every path is token-authenticated: no SESSION_MIDDLEWARE to route to.
+MIDDLEWARE = [path for path in MIDDLEWARE
+              if path != 'core.middleware.PathRoutedMiddleware']
+SESSION_MIDDLEWARE = []
+
+TEMPLATES = [dict(
+    TEMPLATES[0],
+    OPTIONS={'context_processors': [
+        'django.template.context_processors.request',
+        'django.contrib.auth.context_processors.auth',
+    ]},
+)]
+
+REST_FRAMEWORK = dict(
+    REST_FRAMEWORK,
+    DEFAULT_RENDERER_CLASSES=[
+        renderer for renderer in REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']
+        if renderer != 'rest_framework.renderers.BrowsableAPIRenderer'
+    ],
+)
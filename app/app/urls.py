@@ -13,16 +13,24 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
-from django.conf.urls.static import static
 from django.conf import settings
 
+from core.views import JobStatusView, serve_media
+
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('api/user/', include('user.urls')),
-    path('api/recipe/', include('recipe.urls'))
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-# We added the media root to make the files accessible to the
-# development server, without having to having them served from
-# a separate web server.
+    path('api/recipe/', include('recipe.urls')),
+    path('api/jobs/<int:pk>/', JobStatusView.as_view(), name='job-status'),
+    # The media files are handed off to the front server (X-Accel-Redirect /
+    # X-Sendfile) or sent with sendfile, depending on MEDIA_SERVE_MODE.
+    path(f'{settings.MEDIA_URL.strip("/")}/<path:path>', serve_media,
+         name='media')
+]
+
+# Not installed by the API-only settings (app.settings_api).
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.append(path('admin/', admin.site.urls))
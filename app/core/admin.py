@@ -1,5 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 # Useful for translations:
 from django.utils.translation import gettext as _
 
@@ -8,9 +11,45 @@ from core import models
 # Register your models here.
 
 
+class EstimatedCountPaginator(Paginator):
+    """Paginator using the planner's row estimate for unfiltered tables"""
+    # An exact COUNT(*) reads the whole table on PostgreSQL, the statistics
+    # are accurate enough to number the pages of a large one.
+    # Unfiltered tables smaller than this are counted exactly.
+    ESTIMATE_ABOVE = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            if row and row[0] > self.ESTIMATE_ABOVE:
+                return int(row[0])
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Admin for tables too large to count, list or render at once"""
+    paginator = EstimatedCountPaginator
+    # The "(N total)" link runs a second COUNT(*).
+    show_full_result_count = False
+    list_per_page = 50
+    list_max_show_all = 200
+
+
 class UserAdmin(BaseUserAdmin):
     ordering = ['id']
     list_display = ['email', 'name']
+    # Prefix searches use the upper(email) index (see migration 0010).
+    search_fields = ['^email']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         # (Section, fields)
         (None, {'fields': ('email', 'password')}),
@@ -29,7 +68,23 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class RecipeAttrAdmin(LargeTableAdmin):
+    list_display = ['name', 'user', 'recipe_count']
+    list_select_related = ['user']
+    search_fields = ['^name']
+    autocomplete_fields = ['user']
+
+
+class RecipeAdmin(LargeTableAdmin):
+    list_display = ['title', 'user', 'time_minutes', 'price']
+    list_select_related = ['user']
+    search_fields = ['^title']
+    # Search-as-you-type widgets that load 20 options per request, instead
+    # of selects with every tag, ingredient and user of the database.
+    autocomplete_fields = ['user', 'tags', 'ingredients']
+
+
 admin.site.register(models.User, UserAdmin)
-admin.site.register(models.Tag)
-admin.site.register(models.Ingredient)
-admin.site.register(models.Recipe)
+admin.site.register(models.Tag, RecipeAttrAdmin)
+admin.site.register(models.Ingredient, RecipeAttrAdmin)
+admin.site.register(models.Recipe, RecipeAdmin)
@@ -0,0 +1,98 @@
+"""
+Batched deletion of recipes and accounts.
+
+QuerySet.delete() and Model.delete() go through Django's collector, which
+loads every related row (and sends a signal per recipe) before deleting,
+so a large account keeps a worker, and its memory, busy for minutes.
+Here every batch of recipes costs a handful of set-based statements in
+its own transaction: the memory used and the time locks are held depend on
+the batch size, not on the size of the account.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.jobs import heartbeat
+from core.models import Ingredient, Recipe, RecipePriceBucket, RecipeStats, \
+                        RecipeVector, Tag
+from core.signals import queue_files, recipe_count_subquery, remove_recipes
+
+
+def _raw_delete(queryset):
+    """DELETE the rows of queryset, without loading them nor signals"""
+    # What the collector does for models without relations nor receivers.
+    return queryset._raw_delete(queryset.db)
+
+
+def _delete_links(recipe_ids, update_counts):
+    """Delete the tag/ingredient links of the recipes"""
+    for field in ('tags', 'ingredients'):
+        through = getattr(Recipe, field).through
+        model = getattr(Recipe, field).field.related_model
+        fk = f'{model._meta.model_name}_id'
+        links = through.objects.filter(recipe_id__in=recipe_ids)
+
+        linked = set(links.values_list(fk, flat=True)) \
+            if update_counts else ()
+        _raw_delete(links)
+        if linked:
+            model.objects.filter(pk__in=linked).update(
+                recipe_count=recipe_count_subquery(through, fk)
+            )
+
+
+def delete_recipes(recipes, batch_size=None, update_rollups=True):
+    """Delete the recipes of a queryset in batches, return their number"""
+    # The image files are queued for purge_orphaned_files.
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            batch = list(recipes.order_by('pk').values_list(
+                'pk', 'image'
+            )[:batch_size])
+            if not batch:
+                return deleted
+            ids = [pk for pk, image in batch]
+            batch_recipes = Recipe.objects.filter(pk__in=ids)
+
+            _delete_links(ids, update_rollups)
+            _raw_delete(RecipeVector.objects.filter(recipe_id__in=ids))
+            if update_rollups:
+                remove_recipes(batch_recipes)
+            deleted += _raw_delete(batch_recipes)
+            queue_files(image for pk, image in batch)
+        # In a job, it's still running: keep it from being claimed again.
+        heartbeat()
+
+
+def delete_account(user, batch_size=None):
+    """Delete a user and everything it owns, in batches"""
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    # The rollups of the user are deleted anyway.
+    delete_recipes(Recipe.objects.filter(user=user), batch_size,
+                   update_rollups=False)
+    for model in (Tag, Ingredient):
+        # Their links went with the recipes.
+        objects = model.objects.filter(user=user)
+        while True:
+            ids = list(objects.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            _raw_delete(model.objects.filter(pk__in=ids))
+            heartbeat()
+
+    with transaction.atomic():
+        RecipeStats.objects.filter(user=user).delete()
+        RecipePriceBucket.objects.filter(user=user).delete()
+        # Only the token, groups and permissions are left to collect.
+        user.delete()
+
+
+def request_account_deletion(user):
+    """Deactivate an account at once, to delete it later"""
+    user.is_active = False
+    user.deletion_requested_at = timezone.now()
+    user.save(update_fields=['is_active', 'deletion_requested_at'])
+    Token.objects.filter(user=user).delete()
@@ -0,0 +1,44 @@
+"""
+Dependency checks shared by the wait_for_db command and the readiness
+endpoint. Every check raises an exception when the dependency is down.
+"""
+import os
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.db import connections
+
+
+def check_database(alias='default'):
+    """Run a trivial query on the database"""
+    # Looking the connection up doesn't connect; the cursor does.
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+
+
+def check_cache(alias='default'):
+    """Round-trip a key through the cache"""
+    # Memcached clients don't raise when the server is down: set() fails
+    # silently and get() returns None. A unique key and value tell the
+    # round trip apart from a stale or concurrent check.
+    cache = caches[alias]
+    key = f'health_check:{uuid.uuid4().hex}'
+    cache.set(key, key, 10)
+    if cache.get(key) != key:
+        raise ConnectionError(f'cache {alias} did not return the value set')
+    cache.delete(key)
+
+
+def check_media():
+    """Check that the media volume (or bucket) is reachable and writable"""
+    # f.e.: S3Storage checks its bucket.
+    if hasattr(default_storage, 'check'):
+        default_storage.check()
+        return
+    if not os.path.isdir(settings.MEDIA_ROOT):
+        raise OSError(f'{settings.MEDIA_ROOT} does not exist')
+    if not os.access(settings.MEDIA_ROOT, os.W_OK):
+        raise OSError(f'{settings.MEDIA_ROOT} is not writable')
@@ -0,0 +1,165 @@
+"""
+Database-backed job queue.
+
+Requests enqueue slow work with enqueue() and answer at once, the
+`manage.py run_worker` processes run it. The queue is the Job table, so
+there's no broker to run (locally or in production):
+
+* Jobs are claimed with a conditional UPDATE: of two workers racing for a
+  job, only one updates the row.
+* A claimed job is locked for JOB_VISIBILITY_TIMEOUT seconds. If its
+  worker dies, the job is claimed again once the lock expires, so jobs
+  must be safe to run more than once. Jobs that can run for longer call
+  heartbeat() between their steps to extend the lock.
+* Failed jobs are retried with exponential backoff, up to max_attempts.
+* JOB_QUEUE_CONCURRENCY limits the running jobs of a queue across all
+  the workers (f.e.: to spare the CPU for image processing). It's checked
+  before claiming, so racing workers may briefly exceed it.
+"""
+import json
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.models import Job
+
+# The job run by the thread, for heartbeat().
+_current = threading.local()
+
+
+class JobLockLost(Exception):
+    """The running job was claimed by another worker"""
+
+
+def enqueue(func, *args, queue='default', priority=0, user=None,
+            max_attempts=None, delay=0, **kwargs):
+    """Schedule func(*args, **kwargs) and return its Job"""
+    # func is a module-level function (or its dotted path), and its
+    # arguments must be JSON serializable: pass ids, not model instances.
+    name = func if isinstance(func, str) else \
+        f'{func.__module__}.{func.__qualname__}'
+    return Job.objects.create(
+        name=name,
+        arguments=json.dumps({'args': args, 'kwargs': kwargs},
+                             cls=DjangoJSONEncoder),
+        queue=queue,
+        priority=priority,
+        user=user,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_at=timezone.now() + timedelta(seconds=delay)
+    )
+
+
+def _claimable(now):
+    """Pending jobs due to run, and running jobs whose lock expired"""
+    return Q(status=Job.PENDING, run_at__lte=now) | \
+        Q(status=Job.RUNNING, locked_until__lt=now)
+
+
+def _full_queues(now):
+    """Queues running as many jobs as JOB_QUEUE_CONCURRENCY allows"""
+    limits = settings.JOB_QUEUE_CONCURRENCY
+    if not limits:
+        return []
+    running = dict(Job.objects.filter(
+        status=Job.RUNNING,
+        locked_until__gte=now,
+        queue__in=limits
+    ).values('queue').annotate(n=Count('id')).values_list('queue', 'n'))
+    return [queue for queue, limit in limits.items()
+            if running.get(queue, 0) >= limit]
+
+
+def claim(worker, queues=None, candidates=10):
+    """Lock the next job for worker and return it, or None"""
+    now = timezone.now()
+    jobs = Job.objects.filter(_claimable(now)).exclude(
+        queue__in=_full_queues(now)
+    )
+    if queues:
+        jobs = jobs.filter(queue__in=queues)
+    ids = jobs.order_by('-priority', 'run_at', 'id').values_list(
+        'id', flat=True
+    )[:candidates]
+
+    for job_id in ids:
+        # Only one of the workers racing for the job updates it.
+        claimed = Job.objects.filter(_claimable(now), pk=job_id).update(
+            status=Job.RUNNING,
+            locked_by=worker,
+            locked_until=now + timedelta(
+                seconds=settings.JOB_VISIBILITY_TIMEOUT
+            ),
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def _owned(job):
+    """The job, if it's still locked by the worker that claimed it"""
+    # After a visibility timeout, another worker may own it.
+    return Job.objects.filter(pk=job.pk, locked_by=job.locked_by,
+                              status=Job.RUNNING)
+
+
+def heartbeat():
+    """Extend the lock of the job running in this thread, if any"""
+    # Raises JobLockLost if another worker claimed the job in the meantime:
+    # the job stops instead of running twice at once. A no-op out of a job
+    # (f.e. the same code called by a view).
+    job = getattr(_current, 'job', None)
+    if job is None:
+        return
+    if not _owned(job).update(locked_until=timezone.now() + timedelta(
+        seconds=settings.JOB_VISIBILITY_TIMEOUT
+    )):
+        raise JobLockLost(job.pk)
+
+
+def run(job):
+    """Run a claimed job and record its outcome"""
+    # The outcome is only saved if the job is still locked by the worker.
+    owned = _owned(job)
+    _current.job = job
+    try:
+        arguments = json.loads(job.arguments)
+        result = import_string(job.name)(*arguments['args'],
+                                         **arguments['kwargs'])
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            owned.update(
+                status=Job.PENDING,
+                run_at=timezone.now() + timedelta(seconds=delay),
+                locked_until=None,
+                error=error
+            )
+        else:
+            owned.update(status=Job.FAILED, locked_until=None, error=error,
+                         finished_at=timezone.now())
+        return False
+    finally:
+        _current.job = None
+
+    owned.update(status=Job.SUCCEEDED, locked_until=None,
+                 result=json.dumps(result, cls=DjangoJSONEncoder),
+                 finished_at=timezone.now())
+    return True
+
+
+def run_next(worker, queues=None):
+    """Claim and run one job, return False if there was none to run"""
+    job = claim(worker, queues)
+    if job is None:
+        return False
+    run(job)
+    return True
@@ -0,0 +1,72 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+
+
+def percentile(sorted_values, pct):
+    """Return the pct-th percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1,
+                int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    """Django command to load test a running server over HTTP"""
+
+    help = ('Fire concurrent requests at a URL and report throughput '
+            'and latency, f.e. to compare the dev and prod server modes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url')
+        parser.add_argument('-n', '--requests', type=int, default=500)
+        parser.add_argument('-c', '--concurrency', type=int, default=10)
+        parser.add_argument(
+            '-H', '--header', action='append', default=[],
+            help='Extra header, f.e.: -H "Authorization: Token abc"'
+        )
+
+    def _fetch(self, url, headers):
+        """Request the URL once, returning (status, seconds, bytes)"""
+        start = time.perf_counter()
+        try:
+            with urlopen(Request(url, headers=headers)) as res:
+                size = len(res.read())
+                status = res.status
+        except HTTPError as exc:
+            size, status = 0, exc.code
+        return status, time.perf_counter() - start, size
+
+    def handle(self, *args, **options):
+        headers = dict(
+            (part.strip() for part in header.split(':', 1))
+            for header in options['header']
+        )
+        url = options['url']
+        total = options['requests']
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(
+                lambda _: self._fetch(url, headers), range(total)
+            ))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(r[1] * 1000 for r in results)
+        errors = sum(1 for r in results if r[0] >= 400)
+        self.stdout.write(
+            f'{total} requests, concurrency {options["concurrency"]}, '
+            f'{elapsed:.2f}s\n'
+            f'  throughput: {total / elapsed:.1f} req/s\n'
+            f'  latency ms: mean {statistics.mean(latencies):.1f}  '
+            f'p50 {percentile(latencies, 50):.1f}  '
+            f'p95 {percentile(latencies, 95):.1f}  '
+            f'p99 {percentile(latencies, 99):.1f}\n'
+            f'  bytes/response: {sum(r[2] for r in results) // total}\n'
+            f'  errors: {errors}'
+        )
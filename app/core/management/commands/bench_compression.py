@@ -0,0 +1,64 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.middleware import Compressor
+
+LEVELS = {
+    'gzip': (1, 6, 9),
+    'br': (1, 4, 6, 11),
+    'zstd': (1, 3, 9, 19),
+}
+
+
+def sample_recipes(count):
+    """Return a recipe list payload like the one of the recipes endpoint"""
+    rng = random.Random(0)
+    words = ('chicken', 'curry', 'vegan', 'cake', 'soup', 'spicy', 'salad',
+             'chocolate', 'pasta', 'grilled', 'lemon', 'garlic')
+    return [
+        {
+            'id': pk,
+            'title': ' '.join(rng.choice(words) for _ in range(3)).title(),
+            'ingredients': sorted(rng.sample(range(1, 500), 6)),
+            'tags': sorted(rng.sample(range(1, 50), 3)),
+            'time_minutes': rng.randint(5, 120),
+            'price': f'{rng.uniform(1, 50):.2f}',
+            'link': f'https://example.com/recipes/{pk}',
+        }
+        for pk in range(1, count + 1)
+    ]
+
+
+class Command(BaseCommand):
+    """Django command to compare compression ratio and CPU cost"""
+
+    help = ('Compress a recipe list JSON payload with every encoding and '
+            'level, to pick COMPRESSION_LEVELS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def handle(self, *args, **options):
+        payload = json.dumps(sample_recipes(options['recipes'])).encode()
+        self.stdout.write(f'Payload: {len(payload) / 1024:.1f} KiB')
+        self.stdout.write(
+            f'{"encoding":>8} {"level":>5} {"ratio":>6} '
+            f'{"ms":>8} {"MB/s":>8}'
+        )
+        for encoding, levels in LEVELS.items():
+            for level in levels:
+                start = time.perf_counter()
+                for _ in range(options['rounds']):
+                    compressed = Compressor(encoding, level) \
+                        .compress_all(payload)
+                elapsed = (time.perf_counter() - start) / options['rounds']
+                self.stdout.write(
+                    f'{encoding:>8} {level:>5} '
+                    f'{len(payload) / len(compressed):>6.1f} '
+                    f'{elapsed * 1000:>8.2f} '
+                    f'{len(payload) / elapsed / 1e6:>8.1f}'
+                )
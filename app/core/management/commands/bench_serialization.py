@@ -0,0 +1,52 @@
+import io
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.management.commands.bench_compression import sample_recipes
+from core.parsers import MessagePackParser
+from core.renderers import MessagePackRenderer
+
+FORMATS = {
+    'json': (JSONRenderer(), JSONParser()),
+    'msgpack': (MessagePackRenderer(), MessagePackParser()),
+}
+
+
+class Command(BaseCommand):
+    """Django command to compare the JSON and MessagePack formats"""
+
+    help = ('Encode and decode a recipe list payload with every API '
+            'renderer/parser pair and report size and time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--rounds', type=int, default=20)
+
+    def _time(self, func, rounds):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            result = func()
+        return (time.perf_counter() - start) / rounds * 1000, result
+
+    def handle(self, *args, **options):
+        data = sample_recipes(options['recipes'])
+        rounds = options['rounds']
+        self.stdout.write(
+            f'{options["recipes"]} recipes\n'
+            f'{"format":>8} {"KiB":>8} {"encode ms":>10} {"decode ms":>10}'
+        )
+        for name, (renderer, parser) in FORMATS.items():
+            encode_ms, body = self._time(lambda: renderer.render(data),
+                                         rounds)
+            decode_ms, decoded = self._time(
+                lambda: parser.parse(io.BytesIO(body)), rounds
+            )
+            if decoded != data:
+                raise CommandError(f'{name} does not round-trip')
+            self.stdout.write(
+                f'{name:>8} {len(body) / 1024:>8.1f} '
+                f'{encode_ms:>10.2f} {decode_ms:>10.2f}'
+            )
@@ -0,0 +1,69 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.similarity import METRICS, Vectors
+
+
+def synthetic_rows(recipes, tags, ingredients, per_recipe, seed=0):
+    """(recipe id, features) of random recipes, as stored in RecipeVector"""
+    rng = random.Random(seed)
+    # Like real collections: a few tags and ingredients are everywhere.
+    tag_weights = [1 / (i + 1) for i in range(tags)]
+    ingredient_weights = [1 / (i + 1) for i in range(ingredients)]
+    for recipe_id in range(1, recipes + 1):
+        features = {2 * t for t in rng.choices(range(tags), tag_weights,
+                                               k=max(1, per_recipe // 4))}
+        features.update(2 * i + 1 for i in rng.choices(
+            range(ingredients), ingredient_weights, k=per_recipe
+        ))
+        yield recipe_id, ' '.join(map(str, sorted(features)))
+
+
+class Command(BaseCommand):
+    """Django command to time the similar recipes scoring"""
+
+    help = ('Build the similarity matrix of a synthetic user and time the '
+            'top k queries of random recipes with every metric.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--per-recipe', type=int, default=8,
+                            help='Ingredients per recipe.')
+        parser.add_argument('-n', type=int, default=200,
+                            help='Queries per metric.')
+        parser.add_argument('-k', type=int, default=10)
+
+    def handle(self, *args, **options):
+        rows = list(synthetic_rows(options['recipes'], options['tags'],
+                                   options['ingredients'],
+                                   options['per_recipe']))
+        start = time.perf_counter()
+        vectors = Vectors(rows)
+        build_ms = (time.perf_counter() - start) * 1000
+        self.stdout.write(
+            f'{options["recipes"]} recipes, '
+            f'{vectors.matrix.nnz} features: matrix built in '
+            f'{build_ms:.0f} ms\n'
+            f'{"metric":>8} {"p50 ms":>8} {"p95 ms":>8} {"max ms":>8}'
+        )
+
+        sample = random.Random(1).sample(range(1, options['recipes'] + 1),
+                                         min(options['n'],
+                                             options['recipes']))
+        for metric in METRICS:
+            timings = []
+            for recipe_id in sample:
+                start = time.perf_counter()
+                vectors.top_k(recipe_id, options['k'], metric)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{metric:>8} {timings[len(timings) // 2]:>8.2f} '
+                f'{timings[int(len(timings) * 0.95)]:>8.2f} '
+                f'{timings[-1]:>8.2f}'
+            )
+        self.stdout.write(self.style.SUCCESS('Done'))
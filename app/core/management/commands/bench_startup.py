@@ -0,0 +1,109 @@
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter: what a worker, a test run or a command pays
+# before doing anything.
+BOOT = '''
+import sys
+import time
+
+start = time.perf_counter()
+import django
+django.setup()
+if {urls}:
+    import importlib
+    from django.conf import settings
+    importlib.import_module(settings.ROOT_URLCONF)
+print((time.perf_counter() - start) * 1000)
+print(' '.join(sys.modules))
+'''
+
+
+class Command(BaseCommand):
+    """Django command to measure the boot time of a process"""
+
+    help = ('Time django.setup() (and the URLconf import) in fresh '
+            'interpreters, break the import time down per package, and '
+            'fail if the boot is slower than --max-ms or imports a '
+            '--forbid module.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--runs', type=int, default=5)
+        parser.add_argument('--top', type=int, default=15)
+        parser.add_argument('--settings-module',
+                            help='Boot with these settings (f.e.: '
+                                 'app.settings_api), default: the current.')
+        parser.add_argument('--no-urls', action='store_false', dest='urls',
+                            help='Only time django.setup().')
+        parser.add_argument('--max-ms', type=float,
+                            help='Fail if the median boot is slower.')
+        parser.add_argument('--forbid', action='append', default=[],
+                            help='Fail if the boot imports this module '
+                                 '(f.e.: PIL).')
+
+    def _boot(self, options, *flags):
+        """Boot an interpreter, return (ms, modules, stderr)"""
+        env = dict(os.environ)
+        if options['settings_module']:
+            env['DJANGO_SETTINGS_MODULE'] = options['settings_module']
+        result = subprocess.run(
+            [sys.executable, *flags, '-c', BOOT.format(urls=options['urls'])],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, universal_newlines=True
+        )
+        if result.returncode:
+            raise CommandError(f'Boot failed:\n{result.stderr}')
+        boot_ms, modules = result.stdout.splitlines()[-2:]
+        return float(boot_ms), set(modules.split()), result.stderr
+
+    def _breakdown(self, importtime):
+        """Self import time (ms) per top-level package"""
+        # Lines of -X importtime: "import time: self | cumulative | name".
+        packages = defaultdict(float)
+        for line in importtime.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            self_us, _, name = line[len('import time:'):].split('|')
+            if self_us.strip().isdigit():
+                packages[name.strip().split('.')[0]] += int(self_us) / 1000
+        return packages
+
+    def handle(self, *args, **options):
+        timings = []
+        for _ in range(options['runs']):
+            boot_ms, modules, _ = self._boot(options)
+            timings.append(boot_ms)
+        median = statistics.median(timings)
+
+        # Separately: -X importtime slows the boot down.
+        _, _, importtime = self._boot(options, '-X', 'importtime')
+        packages = self._breakdown(importtime)
+        self.stdout.write(
+            f'Boot: {median:.1f} ms median of {len(timings)} '
+            f'(min {min(timings):.1f} ms), {len(modules)} modules.\n'
+            f'Import time per package (self, ms):'
+        )
+        for package, ms in sorted(packages.items(), key=lambda item: -item[1])[
+            :options['top']
+        ]:
+            self.stdout.write(f'  {ms:8.1f}  {package}')
+
+        forbidden = sorted(
+            name for name in options['forbid']
+            if name in modules
+        )
+        if forbidden:
+            raise CommandError(
+                f'Imported at boot: {", ".join(forbidden)}. Import them '
+                'where they are used instead.'
+            )
+        if options['max_ms'] is not None and median > options['max_ms']:
+            raise CommandError(f'Boot took {median:.1f} ms, more than '
+                               f'--max-ms {options["max_ms"]:.0f} ms.')
+        self.stdout.write(self.style.SUCCESS('Boot OK.'))
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    """Django command to copy the media files to another storage"""
+
+    help = ('Copy the recipe images from a storage (default: MEDIA_ROOT) '
+            'to another (default: DEFAULT_FILE_STORAGE), f.e. before '
+            'switching MEDIA_STORAGE to s3. Files already copied are '
+            'skipped, so it can be run again to catch up.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            default='django.core.files.storage.FileSystemStorage'
+        )
+        parser.add_argument('--target',
+                            help='Dotted path of the storage class.')
+        parser.add_argument('--overwrite', action='store_true',
+                            help='Copy the files the target already has.')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        target_class = options['target'] or settings.DEFAULT_FILE_STORAGE
+        if target_class == options['source']:
+            raise CommandError('The source and the target are the same: '
+                               'set --target (or MEDIA_STORAGE).')
+        source = import_string(options['source'])()
+        target = import_string(options['target'])() \
+            if options['target'] else default_storage
+
+        copied = skipped = missing = 0
+        names = Recipe.objects.exclude(image='').order_by().values_list(
+            'image', flat=True
+        ).distinct()
+        for name in names.iterator():
+            if not source.exists(name):
+                missing += 1
+                self.stdout.write(f'file={name} status=missing')
+                continue
+            if target.exists(name):
+                if not options['overwrite']:
+                    skipped += 1
+                    continue
+                if not options['dry_run']:
+                    target.delete(name)
+            if not options['dry_run']:
+                with source.open(name) as fileobj:
+                    saved = target.save(name, fileobj)
+                if saved != name:
+                    raise CommandError(f'{name} was saved as {saved}.')
+            copied += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{copied} files copied, {skipped} already there, '
+            f'{missing} missing.'
+        ))
@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core.deletion import delete_account
+
+
+class Command(BaseCommand):
+    """Django command to delete the accounts their users deleted"""
+
+    help = ('Delete, in batches, the accounts deactivated by DELETE '
+            '/api/user/me/ (run it from cron, or after a deletion).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int)
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.filter(
+            deletion_requested_at__isnull=False
+        ).order_by('deletion_requested_at')
+        deleted = 0
+        for user in users.iterator():
+            delete_account(user, options['batch_size'])
+            deleted += 1
+            self.stdout.write(f'user={user.pk} status=deleted')
+
+        self.stdout.write(self.style.SUCCESS(f'{deleted} accounts deleted.'))
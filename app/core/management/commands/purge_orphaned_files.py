@@ -0,0 +1,44 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from core.models import OrphanedFile, Recipe
+
+
+class Command(BaseCommand):
+    """Django command to delete the queued files no recipe references"""
+
+    help = ('Delete the stored files of deleted recipes and replaced '
+            'images, unless another recipe still references them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        deleted = kept = 0
+        last_id = 0
+        while True:
+            batch = list(OrphanedFile.objects.filter(
+                id__gt=last_id
+            ).order_by('id').values_list('id', 'name')[
+                :options['batch_size']
+            ])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            names = {name for _, name in batch}
+            # f.e.: a shared recipe still uses the image.
+            in_use = set(Recipe.objects.filter(
+                image__in=names
+            ).values_list('image', flat=True))
+
+            for name in names - in_use:
+                default_storage.delete(name)
+                deleted += 1
+            kept += len(names & in_use)
+            OrphanedFile.objects.filter(
+                id__in=[pk for pk, _ in batch]
+            ).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{deleted} files deleted, {kept} still in use.'
+        ))
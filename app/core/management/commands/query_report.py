@@ -0,0 +1,87 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from core.models import QueryPlan, QueryStat
+from core.querystats import BUCKETS_MS
+
+
+def percentile(buckets, fraction):
+    """Upper bound of the latency range holding the fraction of calls"""
+    # buckets: {bucket: calls}, the bucket being an index of BUCKETS_MS.
+    threshold = sum(buckets.values()) * fraction
+    seen = 0
+    for bucket in sorted(buckets):
+        seen += buckets[bucket]
+        if seen >= threshold:
+            return BUCKETS_MS[bucket]
+    return BUCKETS_MS[-1]
+
+
+class Command(BaseCommand):
+    """Django command to print the slowest queries recorded"""
+
+    help = ('Print the queries recorded by QueryStatsMiddleware, slowest '
+            'first, with the plans captured for them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--order', choices=('total', 'calls', 'p95'),
+                            default='total')
+        parser.add_argument('--view', help='Only the queries of this view '
+                                           '(f.e.: "GET recipe:recipe-list").')
+        parser.add_argument('--plans', action='store_true',
+                            help='Print the latest plan of every query.')
+        parser.add_argument('--reset', action='store_true',
+                            help='Delete the statistics and plans.')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            QueryStat.objects.all().delete()
+            QueryPlan.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS('Query statistics reset.'))
+            return
+
+        stats = QueryStat.objects.all()
+        if options['view']:
+            stats = stats.filter(view=options['view'])
+        queries = defaultdict(lambda: {'calls': 0, 'total': 0.0,
+                                       'buckets': {}})
+        sql = {}
+        for row in stats.values_list('fingerprint', 'view', 'bucket', 'sql',
+                                     'calls', 'total_ms').iterator():
+            query_fingerprint, view, bucket, text, calls, total = row
+            query = queries[query_fingerprint, view]
+            query['calls'] += calls
+            query['total'] += total
+            query['buckets'][bucket] = calls
+            sql[query_fingerprint] = text
+        for query in queries.values():
+            query['p95'] = percentile(query['buckets'], 0.95)
+
+        ranked = sorted(queries.items(),
+                        key=lambda item: item[1][options['order']],
+                        reverse=True)[:options['top']]
+        for (query_fingerprint, view), query in ranked:
+            self.stdout.write(
+                f"{query['total']:.1f} ms total, {query['calls']} calls, "
+                f"{query['total'] / query['calls']:.2f} ms avg, "
+                f"p95 <= {query['p95']} ms  {view}"
+            )
+            self.stdout.write(f'  {sql[query_fingerprint]}')
+            if options['plans']:
+                self._write_plan(query_fingerprint, view)
+
+        if not ranked:
+            self.stdout.write('No queries recorded.')
+
+    def _write_plan(self, query_fingerprint, view):
+        plan = QueryPlan.objects.filter(
+            fingerprint=query_fingerprint, view=view
+        ).order_by('-captured_at').first()
+        if plan is None:
+            return
+        self.stdout.write(f'  Plan ({plan.duration_ms:.1f} ms, '
+                          f'{plan.captured_at:%Y-%m-%d %H:%M}):')
+        for line in plan.plan.splitlines():
+            self.stdout.write(f'    {line}')
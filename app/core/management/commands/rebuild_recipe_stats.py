@@ -0,0 +1,87 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from core.models import Ingredient, Recipe, RecipePriceBucket, RecipeStats, \
+                        RecipeVector, Tag
+from core.signals import recipe_count_subquery
+from core.similarity import features_of
+
+
+class Command(BaseCommand):
+    """Django command to recompute the recipe rollups from scratch"""
+
+    help = ('Rebuild RecipeStats, RecipePriceBucket, RecipeVector and the '
+            'recipe_count of tags and ingredients (f.e.: after a backfill '
+            'or bulk update).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            dest='users', help='Only rebuild this user id.')
+
+    def handle(self, *args, **options):
+        user_filter = {}
+        if options['users']:
+            user_filter = {'user_id__in': options['users']}
+        recipes = Recipe.objects.filter(**user_filter)
+
+        with transaction.atomic():
+            RecipeStats.objects.filter(**user_filter).delete()
+            RecipePriceBucket.objects.filter(**user_filter).delete()
+
+            totals = recipes.order_by().values('user_id').annotate(
+                count=Count('id'),
+                time=Sum('time_minutes'),
+                price=Sum('price')
+            )
+            RecipeStats.objects.bulk_create(
+                RecipeStats(user_id=row['user_id'],
+                            recipe_count=row['count'],
+                            time_minutes_total=row['time'],
+                            price_total=row['price'])
+                for row in totals
+            )
+
+            buckets = Counter(
+                (user_id, RecipePriceBucket.bucket_for(price))
+                for user_id, price in recipes.values_list(
+                    'user_id', 'price'
+                ).iterator()
+            )
+            RecipePriceBucket.objects.bulk_create(
+                RecipePriceBucket(user_id=user_id, bucket=bucket,
+                                  recipe_count=count)
+                for (user_id, bucket), count in buckets.items()
+            )
+
+            Tag.objects.filter(**user_filter).update(
+                recipe_count=recipe_count_subquery(Recipe.tags.through,
+                                                   'tag_id')
+            )
+            Ingredient.objects.filter(**user_filter).update(
+                recipe_count=recipe_count_subquery(
+                    Recipe.ingredients.through, 'ingredient_id'
+                )
+            )
+
+            RecipeVector.objects.filter(**user_filter).delete()
+            features = features_of(recipes)
+            now = timezone.now()
+            RecipeVector.objects.bulk_create(
+                (RecipeVector(recipe_id=recipe_id, user_id=user_id,
+                              features=' '.join(map(str, features.get(
+                                  recipe_id, ()
+                              ))),
+                              updated_at=now)
+                 for recipe_id, user_id in recipes.values_list(
+                     'pk', 'user_id'
+                 ).iterator()),
+                batch_size=1000
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recipe statistics rebuilt for {len(totals)} users.'
+        ))
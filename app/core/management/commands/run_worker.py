@@ -0,0 +1,76 @@
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    """Django command to run the jobs queued by the API"""
+
+    help = ('Claim and run the queued jobs (see core.jobs) with a pool of '
+            'threads, until stopped with SIGINT/SIGTERM.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue', action='append', dest='queues',
+            help='Only run the jobs of this queue (default: all).'
+        )
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Jobs run at the same time by this process.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1,
+            help='Seconds to wait when there is no job to run.'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once there is no job left to run.'
+        )
+
+    def _work(self, number, options):
+        worker = f'{socket.gethostname()}:{os.getpid()}:{number}'
+        while not self.stopping.is_set():
+            close_old_connections()
+            if not jobs.run_next(worker, options['queues']):
+                if options['burst']:
+                    return
+                self.stopping.wait(options['poll_interval'])
+
+    def _work_in_thread(self, number, options):
+        try:
+            self._work(number, options)
+        finally:
+            # Every thread has its own database connection.
+            connection.close()
+
+    def _stop(self, signum, frame):
+        self.stdout.write('Stopping after the running jobs...')
+        self.stopping.set()
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self._stop)
+            signal.signal(signal.SIGTERM, self._stop)
+
+        self.stdout.write(f'Worker started, threads={options["threads"]} '
+                          f'queues={",".join(options["queues"] or ["*"])}')
+        if options['threads'] == 1:
+            self._work(0, options)
+        else:
+            threads = [
+                threading.Thread(target=self._work_in_thread,
+                                 args=(number, options))
+                for number in range(options['threads'])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(self.style.SUCCESS('Worker stopped.'))
@@ -0,0 +1,45 @@
+import os
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """Django command to start the app in development or production mode"""
+
+    help = 'Start the development server or the production app server.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            choices=('dev', 'prod'),
+            # The container picks its mode through the environment.
+            default=os.environ.get('SERVER_MODE', 'dev'),
+            help='dev: runserver with autoreload, prod: gunicorn workers.'
+        )
+        parser.add_argument(
+            '--asgi',
+            action='store_true',
+            default=os.environ.get('SERVER_ASGI', '0') == '1',
+            help='Serve app.asgi with uvicorn workers (prod mode only).'
+        )
+        parser.add_argument('--addrport', default='0.0.0.0:8000')
+
+    def handle(self, *args, **options):
+        if options['mode'] == 'dev':
+            self.stdout.write('Starting development server...')
+            call_command('runserver', options['addrport'])
+            return
+
+        argv = ['gunicorn', '-c', 'gunicorn.conf.py',
+                '--bind', options['addrport']]
+        if options['asgi']:
+            argv += ['-k', 'uvicorn.workers.UvicornWorker',
+                     'app.asgi:application']
+        else:
+            argv.append('app.wsgi:application')
+
+        self.stdout.write('Starting production server: ' + ' '.join(argv))
+        self.stdout.flush()
+        # Replace this process, so gunicorn receives the container signals.
+        os.execvp(argv[0], argv)
@@ -1,23 +1,84 @@
+import random
 import time
 
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from django.db import connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+
+from core.health import check_cache, check_database
 
 
 # Remember to add the real wait_for_db command to the docker-compose file.
 class Command(BaseCommand):
     """Django command to pause execution until database is available"""
 
+    help = ('Wait until every configured database (and cache) accepts '
+            'queries, retrying with exponential backoff and jitter.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Database alias to wait for (default: all of DATABASES).'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='Give up (exit status 1) after this many seconds.'
+        )
+        parser.add_argument('--base-delay', type=float, default=0.1)
+        parser.add_argument('--max-delay', type=float, default=5)
+        parser.add_argument(
+            '--skip-caches', action='store_true',
+            help="Don't wait for the configured CACHES."
+        )
+
+    def _check_database(self, alias):
+        """Open a real connection, run a trivial query and close it"""
+        check_database(alias)
+        connections[alias].close()
+
+    def _wait_for(self, kind, alias, check, errors, deadline, options):
+        """Call check(alias) until it stops raising errors or time is up"""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                check(alias)
+            except errors as exc:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f'{kind}={alias} unavailable after {attempt} '
+                        f'attempts ({options["timeout"]}s): {exc}'
+                    )
+                # Exponential backoff, with jitter so that many containers
+                # starting together don't retry in lockstep.
+                delay = min(options['max_delay'],
+                            options['base_delay'] * 2 ** (attempt - 1))
+                delay = min(random.uniform(delay / 2, delay), remaining)
+                self.stdout.write(
+                    f'{kind}={alias} attempt={attempt} status=unavailable '
+                    f'retry_in={delay:.2f}s error="{str(exc).strip()}"'
+                )
+                time.sleep(delay)
+            else:
+                self.stdout.write(
+                    f'{kind}={alias} attempt={attempt} status=available'
+                )
+                return
+
     # Here we define what the Command will do when it's run.
     def handle(self, *args, **options):
         self.stdout.write('Waiting for database...')
-        db_conn = None
-        while not db_conn:
-            try:
-                db_conn = connections['default']
-            except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 second')
-                time.sleep(1)
+        deadline = time.monotonic() + options['timeout']
+
+        for alias in options['databases'] or settings.DATABASES:
+            self._wait_for('database', alias, self._check_database,
+                           OperationalError, deadline, options)
+        if not options['skip_caches']:
+            for alias in settings.CACHES:
+                # Cache backends raise their own client's exceptions.
+                self._wait_for('cache', alias, check_cache,
+                               Exception, deadline, options)
 
         self.stdout.write(self.style.SUCCESS('Database available!'))
@@ -0,0 +1,393 @@
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from contextlib import ExitStack
+from datetime import datetime
+from functools import partial
+
+import brotli
+import zstandard
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.db import connections
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.module_loading import import_string
+from rest_framework.authtoken.models import Token
+
+from core.health import check_cache, check_database, check_media
+from core.querystats import QueryRecorder, collector
+
+logger = logging.getLogger(__name__)
+
+
+class HealthCheckMiddleware:
+    """Answer the liveness and readiness probes of the orchestrator"""
+    # It runs first in MIDDLEWARE and answers before the rest of the stack
+    # (sessions, CSRF, authentication, URL resolving), so a probe costs
+    # microseconds and never needs a token.
+
+    LIVENESS_PATH = '/healthz'
+    READINESS_PATH = '/readyz'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._lock = threading.Lock()
+        # (expiry time, status code, payload) of the last readiness check.
+        self._readiness = (0, None, None)
+
+    def __call__(self, request):
+        if request.path == self.LIVENESS_PATH:
+            # The process can run Python: that's all liveness means.
+            # Don't check dependencies here, or a DB outage would make the
+            # orchestrator restart every (healthy) instance.
+            return JsonResponse({'status': 'ok'})
+        if request.path == self.READINESS_PATH:
+            status, payload = self._check_readiness()
+            return JsonResponse(payload, status=status)
+        return self.get_response(request)
+
+    def _check_readiness(self):
+        """Run the dependency checks, at most once per cache period"""
+        expires, status, payload = self._readiness
+        if time.monotonic() < expires:
+            return status, payload
+
+        with self._lock:
+            # Another thread may have refreshed it while we waited.
+            expires, status, payload = self._readiness
+            if time.monotonic() < expires:
+                return status, payload
+
+            # Every cache: 'default' is local to the process, the shared
+            # one (f.e. the memcached of the throttles) is what can fail.
+            probes = [('database', check_database)] + [
+                (f'cache:{alias}', partial(check_cache, alias))
+                for alias in settings.CACHES
+            ] + [('media', check_media)]
+            checks = {}
+            for name, check in probes:
+                try:
+                    check()
+                    checks[name] = 'ok'
+                except Exception:
+                    # The probe is unauthenticated: the details (hosts,
+                    # driver errors) only go to the logs.
+                    logger.warning('Readiness check %s failed', name,
+                                   exc_info=True)
+                    checks[name] = 'error'
+            ready = all(result == 'ok' for result in checks.values())
+            status = 200 if ready else 503
+            payload = {'status': 'ok' if ready else 'unavailable',
+                       'checks': checks}
+            self._readiness = (
+                time.monotonic() + settings.HEALTH_CHECK_CACHE_SECONDS,
+                status,
+                payload
+            )
+        return status, payload
+
+
+class ProfilingMiddleware:
+    """Profile single requests of staff users on demand"""
+    # Off unless PROFILING_ENABLED: Django then drops it from the stack.
+    # When on, a request with the X-Profile header (or ?profile=1) and the
+    # token of a staff user is run under cProfile and tracemalloc, and
+    # <id>.prof (pstats, f.e.: snakeviz) and <id>.tracemalloc
+    # (tracemalloc.Snapshot.load) are written to PROFILING_DIR.
+
+    HEADER = 'HTTP_X_PROFILE'
+    QUERY_FLAG = 'profile'
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        # tracemalloc traces every thread: one profile at a time.
+        self._lock = threading.Lock()
+
+    def _requested(self, request):
+        return self.HEADER in request.META or \
+            request.GET.get(self.QUERY_FLAG) == '1'
+
+    def _is_staff(self, request):
+        """Whether the request has the token of a staff user"""
+        # The API authenticates in the views, after the middleware.
+        auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(auth) != 2 or auth[0].lower() != 'token':
+            return False
+        return Token.objects.filter(
+            key=auth[1],
+            user__is_active=True,
+            user__is_staff=True
+        ).exists()
+
+    def __call__(self, request):
+        if not self._requested(request) or not self._is_staff(request):
+            return self.get_response(request)
+        if not self._lock.acquire(blocking=False):
+            response = self.get_response(request)
+            response['X-Profile'] = 'busy'
+            return response
+
+        # Only loaded when a profile is requested, not at boot.
+        import cProfile
+        import tracemalloc
+        try:
+            profiler = cProfile.Profile()
+            tracemalloc.start(settings.PROFILING_TRACEMALLOC_FRAMES)
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+            profile_id = self._save(request, profiler, snapshot)
+        finally:
+            self._lock.release()
+        response['X-Profile-Id'] = profile_id
+        return response
+
+    def _save(self, request, profiler, snapshot):
+        """Write the profiles and apply the retention, return their id"""
+        directory = settings.PROFILING_DIR
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-')
+        profile_id = (f'{datetime.now().strftime("%Y%m%d-%H%M%S-%f")}-'
+                      f'{request.method}-{slug[:50]}-{uuid.uuid4().hex[:8]}')
+        base = os.path.join(directory, profile_id)
+        profiler.dump_stats(base + '.prof')
+        snapshot.dump(base + '.tracemalloc')
+
+        # Keep the PROFILING_MAX_FILES newest profiles (id = timestamp).
+        profiles = sorted(name[:-len('.prof')]
+                          for name in os.listdir(directory)
+                          if name.endswith('.prof'))
+        for old in profiles[:-settings.PROFILING_MAX_FILES]:
+            for extension in ('.prof', '.tracemalloc'):
+                try:
+                    os.remove(os.path.join(directory, old + extension))
+                except FileNotFoundError:
+                    pass
+        return profile_id
+
+
+class QueryStatsMiddleware:
+    """Record the latency of the queries of every request (core.querystats)"""
+    # Off unless QUERY_STATS_ENABLED: Django then drops it from the stack.
+
+    def __init__(self, get_response):
+        if not settings.QUERY_STATS_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        def view_name():
+            # f.e.: 'GET recipe:recipe-list', once the URL is resolved.
+            match = getattr(request, 'resolver_match', None)
+            return f'{request.method} {match.view_name if match else "-"}'
+
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(
+                    QueryRecorder(alias, view_name)
+                ))
+            response = self.get_response(request)
+        # Outside of the wrappers: the flush isn't recorded.
+        try:
+            collector.flush()
+        except Exception:
+            # The counts are kept for the next flush, and the response
+            # doesn't depend on them.
+            logger.exception('Flushing the query statistics failed')
+        return response
+
+
+class PathRoutedMiddleware:
+    """Run SESSION_MIDDLEWARE for every path but the token-based API"""
+    # The session, CSRF, auth, messages and clickjacking middleware only
+    # matter for the admin, the API authenticates with tokens. Requests
+    # to LIGHTWEIGHT_PATH_PREFIXES skip them (and the session table read).
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefixes = tuple(settings.LIGHTWEIGHT_PATH_PREFIXES)
+        self._view_middleware = []
+        self._exception_middleware = []
+
+        # Same as BaseHandler.load_middleware, for the nested chain.
+        handler = get_response
+        for middleware_path in reversed(settings.SESSION_MIDDLEWARE):
+            try:
+                mw_instance = import_string(middleware_path)(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(mw_instance, 'process_template_response'):
+                raise ImproperlyConfigured(
+                    f'{middleware_path} uses process_template_response, '
+                    'add it to MIDDLEWARE instead of SESSION_MIDDLEWARE.'
+                )
+            if hasattr(mw_instance, 'process_view'):
+                self._view_middleware.insert(0, mw_instance.process_view)
+            if hasattr(mw_instance, 'process_exception'):
+                self._exception_middleware.append(
+                    mw_instance.process_exception
+                )
+            handler = convert_exception_to_response(mw_instance)
+        self.full_chain = handler
+
+    def _is_lightweight(self, request):
+        return request.path_info.startswith(self.prefixes)
+
+    def __call__(self, request):
+        if self._is_lightweight(request):
+            return self.get_response(request)
+        return self.full_chain(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self._is_lightweight(request):
+            return None
+        for process_view in self._view_middleware:
+            response = process_view(request, view_func, view_args,
+                                    view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_exception(self, request, exception):
+        if self._is_lightweight(request):
+            return None
+        for process_exception in self._exception_middleware:
+            response = process_exception(request, exception)
+            if response is not None:
+                return response
+        return None
+
+
+def parse_accept_encoding(header):
+    """Return {coding: q-value} from an Accept-Encoding header"""
+    accepted = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header, available):
+    """Pick the best encoding of available (in server preference order)"""
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class Compressor:
+    """Incremental compressor with the same interface for every encoding"""
+
+    def __init__(self, encoding, level):
+        if encoding == 'gzip':
+            # wbits=31: gzip container, no file name nor timestamp.
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self.compress, self.flush = compressor.compress, compressor.flush
+        elif encoding == 'br':
+            compressor = brotli.Compressor(quality=level)
+            self.compress, self.flush = compressor.process, compressor.finish
+        elif encoding == 'zstd':
+            zstd = zstandard.ZstdCompressor(level=level)
+            compressor = zstd.compressobj()
+            self.compress, self.flush = compressor.compress, compressor.flush
+            # One-shot frames also record the content size.
+            self.compress_all = zstd.compress
+        else:
+            raise ValueError(f'Unsupported encoding: {encoding}')
+
+    def compress_all(self, data):
+        return self.compress(data) + self.flush()
+
+    def compress_stream(self, chunks):
+        for chunk in chunks:
+            data = self.compress(chunk)
+            if data:
+                yield data
+        yield self.flush()
+
+
+class CompressionMiddleware:
+    """Compress responses with the best encoding the client accepts"""
+    # Like django.middleware.gzip.GZipMiddleware, plus brotli and zstd,
+    # a size threshold and a skip list for already compressed media.
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Server preference order: the order of COMPRESSION_LEVELS.
+        self.encodings = list(settings.COMPRESSION_LEVELS)
+
+    def _compressible(self, response):
+        if response.has_header('Content-Encoding') or \
+                response.status_code in (204, 206, 304):
+            return False
+        # X-Accel-Redirect/X-Sendfile bodies are sent by the front server.
+        if response.has_header('X-Accel-Redirect') or \
+                response.has_header('X-Sendfile'):
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0]
+        if not content_type.startswith(settings.COMPRESSION_CONTENT_TYPES):
+            # f.e.: the JPEG/PNG recipe images, compressing them again
+            # costs CPU for no gain (and blocks sendfile).
+            return False
+        if not response.streaming and \
+                len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return False
+        return True
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not self._compressible(response):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING'),
+                                   self.encodings)
+        if encoding is None:
+            return response
+
+        compressor = Compressor(encoding,
+                                settings.COMPRESSION_LEVELS[encoding])
+        if response.streaming:
+            # Compressed chunk by chunk, never held in memory as a whole.
+            response.streaming_content = compressor.compress_stream(
+                response.streaming_content
+            )
+            del response['Content-Length']
+        else:
+            compressed = compressor.compress_all(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
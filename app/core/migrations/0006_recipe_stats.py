@@ -0,0 +1,105 @@
+# Generated by Django 2.1.15 on 2026-10-19 19:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+# RecipePriceBucket.WIDTH when this migration was written.
+PRICE_BUCKET_WIDTH = 5
+
+
+def create_stats(apps, schema_editor):
+    """Compute the rollups of the existing recipes"""
+    # As the rebuild_recipe_stats command does: core.signals only keeps
+    # them current from here on.
+    Recipe = apps.get_model('core', 'Recipe')
+    RecipeStats = apps.get_model('core', 'RecipeStats')
+    RecipePriceBucket = apps.get_model('core', 'RecipePriceBucket')
+
+    RecipeStats.objects.bulk_create(
+        RecipeStats(user_id=row['user_id'], recipe_count=row['count'],
+                    time_minutes_total=row['time'],
+                    price_total=row['price'])
+        for row in Recipe.objects.order_by().values('user_id').annotate(
+            count=Count('id'), time=Sum('time_minutes'), price=Sum('price')
+        )
+    )
+
+    buckets = {}
+    for user_id, price in Recipe.objects.values_list(
+        'user_id', 'price'
+    ).iterator():
+        key = (user_id, int(price // PRICE_BUCKET_WIDTH))
+        buckets[key] = buckets.get(key, 0) + 1
+    RecipePriceBucket.objects.bulk_create(
+        (RecipePriceBucket(user_id=user_id, bucket=bucket,
+                           recipe_count=count)
+         for (user_id, bucket), count in buckets.items()),
+        batch_size=1000
+    )
+
+    for model_name, field_name in (('Tag', 'tags'),
+                                   ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = Recipe._meta.get_field(field_name).remote_field.through
+        fk = f'{model_name.lower()}_id'
+        for obj_id, count in through.objects.order_by().values_list(
+            fk
+        ).annotate(count=Count('recipe_id')).iterator():
+            model.objects.filter(id=obj_id).update(recipe_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_recipe_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipePriceBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.IntegerField()),
+                ('recipe_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecipeStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipe_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('recipe_count', models.IntegerField(default=0)),
+                ('time_minutes_total', models.BigIntegerField(default=0)),
+                ('price_total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', '-recipe_count'], name='core_ingred_user_id_dbfae2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', '-recipe_count'], name='core_tag_user_id_a7d271_idx'),
+        ),
+        migrations.AddField(
+            model_name='recipepricebucket',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='recipepricebucket',
+            unique_together={('user', 'bucket')},
+        ),
+        migrations.RunPython(create_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations
+from django.db.models.functions import Lower
+
+
+def merge_duplicates(apps, schema_editor):
+    """Merge the tags/ingredients of a user that only differ by case"""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, field_name in (('Tag', 'tags'),
+                                   ('Ingredient', 'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = Recipe._meta.get_field(field_name).remote_field.through
+        fk = f'{model_name.lower()}_id'
+
+        # The oldest object of every (user, lower(name)) is kept. lower()
+        # of the database, as in the unique index: str.lower() disagrees
+        # with it outside ASCII.
+        kept, duplicates = {}, {}
+        for obj in model.objects.annotate(
+            lower_name=Lower('name')
+        ).order_by('id').values('id', 'user_id', 'lower_name'):
+            key = (obj['user_id'], obj['lower_name'])
+            if key in kept:
+                duplicates[obj['id']] = kept[key]
+            else:
+                kept[key] = obj['id']
+        if not duplicates:
+            continue
+
+        # Move the recipe links to the kept object, once per recipe.
+        links = set(through.objects.filter(
+            **{f'{fk}__in': set(duplicates.values())}
+        ).values_list('recipe_id', fk))
+        for link in through.objects.filter(**{f'{fk}__in': duplicates}):
+            target = (link.recipe_id, duplicates[getattr(link, fk)])
+            if target in links:
+                link.delete()
+            else:
+                links.add(target)
+                through.objects.filter(pk=link.pk).update(**{fk: target[1]})
+        model.objects.filter(id__in=duplicates).delete()
+
+        for obj_id in set(duplicates.values()):
+            model.objects.filter(id=obj_id).update(
+                recipe_count=through.objects.filter(**{fk: obj_id}).count()
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        # Expression indexes can't be declared in Meta before Django 3.2.
+        migrations.RunSQL(
+            ['CREATE UNIQUE INDEX core_tag_user_lower_name_uniq '
+             'ON core_tag (user_id, lower(name))'],
+            ['DROP INDEX core_tag_user_lower_name_uniq']
+        ),
+        migrations.RunSQL(
+            ['CREATE UNIQUE INDEX core_ingredient_user_lower_name_uniq '
+             'ON core_ingredient (user_id, lower(name))'],
+            ['DROP INDEX core_ingredient_user_lower_name_uniq']
+        ),
+    ]
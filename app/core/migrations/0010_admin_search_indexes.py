@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# (table, column): searched by prefix (istartswith) in the admin.
+SEARCHED_COLUMNS = (
+    ('core_user', 'email'),
+    ('core_tag', 'name'),
+    ('core_ingredient', 'name'),
+    ('core_recipe', 'title'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    """Index UPPER(column), which the PostgreSQL i* lookups compare"""
+    # text_pattern_ops: the index also serves LIKE 'prefix%'. Expression
+    # indexes can't be declared in Meta before Django 3.2.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in SEARCHED_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX {table}_{column}_upper_like ON {table} '
+            f'(UPPER({column}::text) text_pattern_ops)'
+        )
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in SEARCHED_COLUMNS:
+        schema_editor.execute(f'DROP INDEX {table}_{column}_upper_like')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.1.15 on 2026-10-19 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryPlan',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(db_index=True, max_length=40)),
+                ('view', models.CharField(max_length=255)),
+                ('sql', models.TextField()),
+                ('duration_ms', models.FloatField()),
+                ('plan', models.TextField()),
+                ('captured_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QueryStat',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40)),
+                ('view', models.CharField(max_length=255)),
+                ('bucket', models.IntegerField()),
+                ('sql', models.TextField()),
+                ('calls', models.BigIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='querystat',
+            unique_together={('fingerprint', 'view', 'bucket')},
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 2.1.15 on 2026-10-19 20:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def create_vectors(apps, schema_editor):
+    """Compute the vectors of the existing recipes"""
+    Recipe = apps.get_model('core', 'Recipe')
+    RecipeVector = apps.get_model('core', 'RecipeVector')
+    features = {}
+    for field, fk, offset in (('tags', 'tag_id', 0),
+                              ('ingredients', 'ingredient_id', 1)):
+        through = Recipe._meta.get_field(field).remote_field.through
+        for recipe_id, pk in through.objects.values_list(
+            'recipe_id', fk
+        ).iterator():
+            features.setdefault(recipe_id, []).append(2 * pk + offset)
+
+    now = timezone.now()
+    RecipeVector.objects.bulk_create(
+        (RecipeVector(recipe_id=recipe_id, user_id=user_id,
+                      features=' '.join(map(str, sorted(
+                          features.get(recipe_id, ())
+                      ))),
+                      updated_at=now)
+         for recipe_id, user_id in Recipe.objects.values_list(
+             'id', 'user_id'
+         ).iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_query_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeVector',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vector', serialize=False, to='core.Recipe')),
+                ('features', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='recipevector',
+            index_together={('user', 'updated_at')},
+        ),
+        migrations.RunPython(create_vectors, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,10 @@
 import uuid
 import os
-from django.db import models
+from django.db import connections, models, transaction
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 from django.conf import settings
+from django.utils import timezone
 
 
 def recipe_image_file_path(instance, filename):
@@ -44,6 +45,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Set when the user deletes the account: it's deactivated at once and
+    # deleted later in batches (see core.deletion).
+    deletion_requested_at = models.DateTimeField(null=True, blank=True)
 
     objects = UserManager()
 
@@ -53,6 +57,48 @@ class User(AbstractBaseUser, PermissionsMixin):
     # DON'T FORGET TO ADD AUTH_USER_MODEL = 'core.User' (to settings.py file)
 
 
+class NamedObjectManager(models.Manager):
+    """Manager for the user-owned objects identified by their name"""
+    # (user, lower(name)) is unique: see migration 0007.
+
+    def ids_for_names(self, user, names):
+        """Return {name: id} of the user's objects, creating missing ones"""
+        # The names are compared with the lower() of the database, never
+        # str.lower(): they disagree outside ASCII (SQLite only lowers
+        # ASCII, PostgreSQL lowers a final sigma to σ, Python to ς).
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        rows = ', '.join(['(%s)'] * len(names))
+        values = ', '.join(['(%s, %s, 0)'] * len(names))
+        params = []
+        for name in names:
+            params += [user.pk, name]
+        with connection.cursor() as cursor:
+            # One statement, whatever the number of names, and no race
+            # between a lookup and an insert: a concurrent request creating
+            # the same name makes this one skip the row instead of failing.
+            # Of the names only differing by case, the first one is
+            # inserted and the others skipped the same way.
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, name, recipe_count) '
+                f'VALUES {values} '
+                f'ON CONFLICT (user_id, lower(name)) DO NOTHING',
+                params
+            )
+            cursor.execute(
+                f'SELECT names.column1, {table}.id '
+                f'FROM (VALUES {rows}) AS names '
+                f'JOIN {table} ON {table}.user_id = %s '
+                f'AND lower({table}.name) = lower(names.column1)',
+                names + [user.pk]
+            )
+            return dict(cursor.fetchall())
+
+
 class Tag(models.Model):
     """Tag to be used for a recipe"""
     name = models.CharField(max_length=255)
@@ -60,6 +106,13 @@ class Tag(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    # Number of recipes using the tag (maintained by core.signals).
+    recipe_count = models.IntegerField(default=0)
+
+    objects = NamedObjectManager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-recipe_count'])]
 
     def __str__(self):
         return self.name
@@ -72,6 +125,13 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    # Number of recipes using the ingredient (maintained by core.signals).
+    recipe_count = models.IntegerField(default=0)
+
+    objects = NamedObjectManager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-recipe_count'])]
 
     def __str__(self):
         return self.name
@@ -93,5 +153,224 @@ class Recipe(models.Model):
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
 
+    class Meta:
+        # One per ordering of the recipe list (RecipeListQuerySerializer),
+        # with the id tie-breaker of its pages. Scanned backwards for the
+        # descending orderings.
+        indexes = [
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['user', 'time_minutes', 'id']),
+            models.Index(fields=['user', 'price', 'id']),
+        ]
+
     def __str__(self):
         return self.title
+
+    def set_links(self, field, ids):
+        """Make ids the exact tags/ingredients (field) of the recipe"""
+        # Unlike .set(): one query if nothing changed, else one DELETE and
+        # one bulk INSERT. The recipe_count columns and the RecipeVector
+        # are updated here, as no m2m_changed signal is sent.
+        through = getattr(Recipe, field).through
+        model = getattr(Recipe, field).field.related_model
+        fk = f'{model._meta.model_name}_id'
+        links = through.objects.filter(recipe_id=self.pk)
+
+        current = set(links.values_list(fk, flat=True))
+        wanted = set(ids)
+        removed, added = current - wanted, wanted - current
+        if removed:
+            # .delete() would select the rows first: the m2m_changed
+            # receivers of core.signals disable its fast path.
+            removed_links = links.filter(**{f'{fk}__in': removed})
+            removed_links._raw_delete(removed_links.db)
+            model.objects.filter(pk__in=removed).update(
+                recipe_count=models.F('recipe_count') - 1
+            )
+        if added:
+            through.objects.bulk_create(
+                through(recipe_id=self.pk, **{fk: pk}) for pk in added
+            )
+            model.objects.filter(pk__in=added).update(
+                recipe_count=models.F('recipe_count') + 1
+            )
+        if removed or added:
+            getattr(self, '_prefetched_objects_cache', {}).pop(field, None)
+            # Imported here: core.similarity imports this module.
+            from core.similarity import update_vectors
+            update_vectors([self.pk])
+
+    def copy_for(self, user, **overrides):
+        """Copy the recipe, with its tags and ingredients, for a user"""
+        # The image file isn't copied: both recipes point to the same file.
+        fields = {
+            'title': self.title,
+            'time_minutes': self.time_minutes,
+            'price': self.price,
+            'link': self.link,
+            'image': self.image.name or None,
+        }
+        fields.update(overrides)
+        copy = Recipe(user=user, **fields)
+
+        with transaction.atomic():
+            copy.save()
+            for field in ('tags', 'ingredients'):
+                # Uses the prefetched objects, if any.
+                objects = getattr(self, field).all()
+                if user.pk == self.user_id:
+                    ids = [obj.pk for obj in objects]
+                else:
+                    model = getattr(Recipe, field).field.related_model
+                    ids = model.objects.ids_for_names(
+                        user, [obj.name for obj in objects]
+                    ).values()
+                if ids:
+                    getattr(copy, field).add(*ids)
+        return copy
+
+
+class RecipeStats(models.Model):
+    """Per-user rollup of the recipe statistics"""
+    # Maintained incrementally by core.signals, rebuilt with the
+    # rebuild_recipe_stats command.
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recipe_stats'
+    )
+    recipe_count = models.IntegerField(default=0)
+    time_minutes_total = models.BigIntegerField(default=0)
+    price_total = models.DecimalField(max_digits=15, decimal_places=2,
+                                      default=0)
+
+
+class RecipePriceBucket(models.Model):
+    """Per-user number of recipes in a price range"""
+    # Width of every price range (f.e.: 0-5, 5-10, ...).
+    WIDTH = 5
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    # Index of the range: bucket N holds prices in [N*WIDTH, (N+1)*WIDTH).
+    bucket = models.IntegerField()
+    recipe_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'bucket')
+
+    @classmethod
+    def bucket_for(cls, price):
+        """Return the bucket index for a price"""
+        return int(price // cls.WIDTH)
+
+
+class RecipeVector(models.Model):
+    """Tags and ingredients of a recipe, as a sparse vector"""
+    # Maintained by core.signals and Recipe.set_links, read by
+    # core.similarity. Rebuilt by the rebuild_recipe_stats command.
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='vector'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    # Feature ids, space-separated: 2 * tag id, 2 * ingredient id + 1.
+    features = models.TextField(blank=True)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        # The latest update of a user's vectors versions its caches.
+        index_together = [('user', 'updated_at')]
+
+
+class OrphanedFile(models.Model):
+    """Stored file that may no longer be referenced, to delete later"""
+    # Recipes can share an image (see Recipe.copy_for), so the file is
+    # only deleted by purge_orphaned_files once no recipe references it.
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Job(models.Model):
+    """Unit of deferred work, run by the run_worker command (core.jobs)"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+
+    # Dotted path of the function to call.
+    name = models.CharField(max_length=255)
+    # JSON encoded: no JSONField outside of PostgreSQL before Django 3.1.
+    arguments = models.TextField(default='{}')
+    queue = models.CharField(max_length=50, default='default')
+    # Higher first.
+    priority = models.IntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=PENDING)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    # A running job whose lock expired is claimed again (crashed worker).
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    # Who can poll it, if anyone.
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at']),
+            models.Index(fields=['status', 'locked_until']),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+class QueryStat(models.Model):
+    """Calls of a query, from a view, in one latency range (core.querystats)"""
+    fingerprint = models.CharField(max_length=40)
+    view = models.CharField(max_length=255)
+    # Index of the range in core.querystats.BUCKETS_MS.
+    bucket = models.IntegerField()
+    sql = models.TextField()
+    calls = models.BigIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('fingerprint', 'view', 'bucket')
+
+
+class QueryPlan(models.Model):
+    """Execution plan of a slow query, captured by core.querystats"""
+    fingerprint = models.CharField(max_length=40, db_index=True)
+    view = models.CharField(max_length=255)
+    sql = models.TextField()
+    duration_ms = models.FloatField()
+    plan = models.TextField()
+    captured_at = models.DateTimeField(auto_now_add=True)
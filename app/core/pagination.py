@@ -0,0 +1,116 @@
+"""
+Keyset ("cursor") pagination.
+
+An OFFSET page reads and skips every row before it, so page 1000 costs a
+thousand pages. Here the cursor holds the ordering values of the last row
+of the page, and the next page starts right after them:
+
+    ORDER BY price, id  ->  WHERE price > p OR (price = p AND id > i)
+
+which an index on the ordering columns (with the same prefix as the other
+filters, f.e. (user, price, id)) serves directly, whatever the depth.
+The ordering of the queryset must end with a unique field, so that no two
+rows have the same position, and its fields can't be NULL.
+
+Pagination is opt-in: lists are only paginated when `page_size` (or a
+`cursor`) is in the query string, so clients reading whole lists don't
+change.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Forward-only pages of an ordered queryset"""
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+    invalid_cursor_message = _('Invalid cursor')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def _encode(self, values):
+        data = json.dumps(values, cls=DjangoJSONEncoder)
+        return urlsafe_b64encode(data.encode()).decode()
+
+    def _decode(self, cursor, model, ordering):
+        """The ordering values of a cursor, as the model fields take them"""
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()))
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise ValueError(cursor)
+            fields = [model._meta.get_field(field.lstrip('-'))
+                      for field in ordering]
+            values = [field.to_python(value)
+                      for field, value in zip(fields, values)]
+        except (Base64Error, ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        # The ordering fields can't be NULL.
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _after(self, ordering, values):
+        """Q of the rows after the position values, in ordering"""
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        query = request.query_params
+        if self.page_size_query_param not in query and \
+                self.cursor_query_param not in query:
+            return None
+        self.request = request
+        self.ordering = queryset.query.order_by
+        self.page_size = self.get_page_size(request)
+
+        cursor = query.get(self.cursor_query_param)
+        if cursor:
+            values = self._decode(cursor, queryset.model, self.ordering)
+            queryset = queryset.filter(self._after(self.ordering, values))
+        # One more row tells whether there's a next page.
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        values = [getattr(self.last, field.lstrip('-'))
+                  for field in self.ordering]
+        url = replace_query_param(self.request.build_absolute_uri(),
+                                  self.cursor_query_param,
+                                  self._encode(values))
+        return replace_query_param(url, self.page_size_query_param,
+                                   self.page_size)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
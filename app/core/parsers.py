@@ -0,0 +1,22 @@
+import msgpack
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class MessagePackParser(BaseParser):
+    """Parse MessagePack request bodies"""
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(
+                stream.read(),
+                raw=False,
+                # Bounded like the other request bodies.
+                max_bin_len=settings.DATA_UPLOAD_MAX_MEMORY_SIZE,
+                max_str_len=settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+            )
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError,
+                msgpack.StackError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
@@ -0,0 +1,193 @@
+"""
+Per-query latency statistics and slow query plans.
+
+QueryStatsMiddleware installs a QueryRecorder on the database connection
+(connection.execute_wrapper) for every request. The recorder:
+
+* fingerprints every query: the SQL with its IN lists and literals
+  collapsed, so `id IN (1, 2)` and `id IN (3)` are the same query;
+* counts its latency in a histogram per fingerprint and view (BUCKETS_MS),
+  kept in memory and flushed to QueryStat every QUERY_STATS_FLUSH_SECONDS;
+* captures the plan of the SELECTs slower than QUERY_STATS_EXPLAIN_MS
+  (EXPLAIN (ANALYZE, BUFFERS) on PostgreSQL) in QueryPlan, at most once
+  per fingerprint every QUERY_STATS_EXPLAIN_INTERVAL seconds.
+
+`manage.py query_report` prints the slowest queries.
+"""
+import hashlib
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+
+from core.models import QueryPlan, QueryStat
+
+# Upper bounds of the latency ranges, in milliseconds.
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000,
+              float('inf'))
+
+_IN_LIST_RE = re.compile(r'\(\s*%s(\s*,\s*%s)*\s*\)')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(\.\d+)?\b')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """Return sql with the values that vary between calls collapsed"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    return _SPACES_RE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()
+
+
+def bucket_for(duration_ms):
+    """Index of the latency range of a duration"""
+    return bisect_left(BUCKETS_MS, duration_ms)
+
+
+class Collector:
+    """Latency histograms of the process, waiting to be flushed"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(lambda: [0, 0.0])
+        self._sql = {}
+        self._plans = []
+        self._explained = {}
+        self._flushed_at = time.monotonic()
+
+    def record(self, key, sql, duration_ms):
+        """Count a call of the (fingerprint, view) query in key"""
+        with self._lock:
+            counts = self._pending[key + (bucket_for(duration_ms),)]
+            counts[0] += 1
+            counts[1] += duration_ms
+            self._sql[key[0]] = sql
+
+    def should_explain(self, query_fingerprint):
+        """Whether the plan of a slow query is due for a capture"""
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained.get(query_fingerprint)
+            if last is not None and \
+                    now - last < settings.QUERY_STATS_EXPLAIN_INTERVAL:
+                return False
+            self._explained[query_fingerprint] = now
+            return True
+
+    def add_plan(self, **plan):
+        with self._lock:
+            self._plans.append(QueryPlan(**plan))
+
+    def flush(self, force=False):
+        """Add the pending counts to QueryStat, if it's time to"""
+        now = time.monotonic()
+        if not force and \
+                now - self._flushed_at < settings.QUERY_STATS_FLUSH_SECONDS:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(
+                lambda: [0, 0.0]
+            )
+            plans, self._plans = self._plans, []
+            sql = dict(self._sql)
+            self._flushed_at = now
+
+        try:
+            # All or nothing, so a failed flush can be retried as a whole.
+            with transaction.atomic():
+                self._write(pending, plans, sql)
+        except Exception:
+            # Back into the collector, for the next flush.
+            with self._lock:
+                for key, (calls, total) in pending.items():
+                    counts = self._pending[key]
+                    counts[0] += calls
+                    counts[1] += total
+                self._plans[:0] = plans
+            raise
+
+    def _write(self, pending, plans, sql):
+        for (query_fingerprint, view, bucket), (calls, total) in \
+                pending.items():
+            lookup = {'fingerprint': query_fingerprint, 'view': view,
+                      'bucket': bucket}
+            changes = {'calls': F('calls') + calls,
+                       'total_ms': F('total_ms') + total}
+            if QueryStat.objects.filter(**lookup).update(**changes):
+                continue
+            try:
+                # Savepoint: another process may create it first.
+                with transaction.atomic():
+                    QueryStat.objects.create(sql=sql[query_fingerprint],
+                                             calls=calls, total_ms=total,
+                                             **lookup)
+            except IntegrityError:
+                QueryStat.objects.filter(**lookup).update(**changes)
+        QueryPlan.objects.bulk_create(plans)
+
+
+collector = Collector()
+
+
+class QueryRecorder:
+    """connection.execute_wrapper() recording the queries of a request"""
+
+    def __init__(self, alias, view_name):
+        self.alias = alias
+        # Resolved after the middleware runs: called at query time.
+        self.view_name = view_name
+        self._explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self._explaining:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        normalized = normalize(sql)
+        query_fingerprint = fingerprint(normalized)
+        view = self.view_name()
+        collector.record((query_fingerprint, view), normalized, duration_ms)
+
+        if duration_ms >= settings.QUERY_STATS_EXPLAIN_MS and not many and \
+                sql.lstrip()[:6].upper() == 'SELECT' and \
+                collector.should_explain(query_fingerprint):
+            self._explain(sql, params, query_fingerprint, view, duration_ms)
+        return result
+
+    def _explain(self, sql, params, query_fingerprint, view, duration_ms):
+        """Capture the plan of a slow query"""
+        connection = connections[self.alias]
+        # ANALYZE runs the query again: SELECTs only.
+        options = {'analyze': True, 'buffers': True} \
+            if connection.vendor == 'postgresql' else {}
+        self._explaining = True
+        try:
+            # Savepoint: a failed EXPLAIN mustn't break the transaction.
+            # Own cursor: the caller is yet to read the rows of the query
+            # from its cursor.
+            with transaction.atomic(using=self.alias), \
+                    connection.cursor() as cursor:
+                cursor.execute(
+                    f'{connection.ops.explain_query_prefix(**options)} {sql}',
+                    params
+                )
+                plan = '\n'.join(' '.join(str(column) for column in row)
+                                 for row in cursor.fetchall())
+        except Exception as exc:
+            plan = f'EXPLAIN failed: {exc}'
+        finally:
+            self._explaining = False
+        collector.add_plan(fingerprint=query_fingerprint, view=view,
+                           sql=sql, duration_ms=duration_ms, plan=plan)
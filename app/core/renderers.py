@@ -0,0 +1,29 @@
+import decimal
+
+import msgpack
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_json_encoder = JSONEncoder()
+
+
+def encode_default(obj):
+    """Encode the types msgpack doesn't know, like the JSON renderer"""
+    if isinstance(obj, decimal.Decimal):
+        # As a string, like DRF's DecimalField output: no float rounding.
+        return str(obj)
+    # Dates, UUIDs, lazy translations, querysets...
+    return _json_encoder.default(obj)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Render the API data as MessagePack, for service-to-service calls"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
@@ -0,0 +1,54 @@
+"""
+Shopping list: the ingredients of a set of recipes, with the number of
+recipes using each.
+
+The list is computed with one grouped query over the recipe-ingredient
+links, and cached per user and recipe set. The cache key holds a version
+of the set: the number of RecipeVector rows of its recipes and their
+latest update (core.similarity keeps them current, and they're deleted
+with their recipes). So changing the ingredients of one of the recipes,
+or deleting one, gives a new key. Renaming an ingredient doesn't: the
+old name can be served for SHOPPING_LIST_CACHE_SECONDS.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from core.models import Recipe, RecipeVector
+
+
+def _version(user, recipe_ids):
+    """Version of the links of the recipes: changes with any of them"""
+    version = RecipeVector.objects.filter(
+        user=user, recipe_id__in=recipe_ids
+    ).aggregate(count=Count('recipe_id'), updated=Max('updated_at'))
+    if not version['count']:
+        return None
+    return f'{version["count"]}:{version["updated"].timestamp()}'
+
+
+def shopping_list(user, recipe_ids):
+    """[{id, name, recipe_count}] of the ingredients of the user's recipes"""
+    recipe_ids = sorted(set(recipe_ids))
+    version = _version(user, recipe_ids)
+    if version is None:
+        # None of the recipes has (or ever had) a tag or an ingredient.
+        return []
+    digest = hashlib.sha1(
+        ','.join(map(str, recipe_ids)).encode()
+    ).hexdigest()
+    key = f'shopping-list:{user.pk}:{digest}:{version}'
+    result = cache.get(key)
+    if result is None:
+        rows = Recipe.ingredients.through.objects.filter(
+            recipe__user=user,
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id', 'ingredient__name').annotate(
+            recipe_count=Count('recipe_id')
+        ).order_by('ingredient__name', 'ingredient_id')
+        result = [{'id': pk, 'name': name, 'recipe_count': count}
+                  for pk, name, count in rows]
+        cache.set(key, result, settings.SHOPPING_LIST_CACHE_SECONDS)
+    return result
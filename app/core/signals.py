@@ -0,0 +1,225 @@
+"""
+Keep the recipe rollups (RecipeStats, RecipePriceBucket and the
+recipe_count of tags and ingredients) and the recipe vectors
+(RecipeVector, see core.similarity) up to date.
+
+Every change is applied as a relative UPDATE (F() expression), so
+concurrent requests don't overwrite each other's counts. Bulk changes
+that skip the signals (QuerySet.update(), raw SQL) need a
+`manage.py rebuild_recipe_stats` afterwards, except Recipe.set_links()
+and core.deletion, which use the functions below.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, \
+                             Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, \
+                                     pre_delete, pre_save
+from django.dispatch import receiver
+
+from core.models import Ingredient, OrphanedFile, Recipe, \
+                        RecipePriceBucket, RecipeStats, Tag
+from core.similarity import update_vectors
+
+
+def _update_or_create(model, lookup, **deltas):
+    """Add the deltas to the row matching lookup, creating it if needed"""
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        # Savepoint, so a lost creation race doesn't break the transaction.
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        model.objects.filter(**lookup).update(**changes)
+
+
+def _apply_recipe(user_id, time_minutes, price, sign):
+    """Add (sign=1) or remove (sign=-1) a recipe from the user rollups"""
+    price = Decimal(str(price))
+    _update_or_create(
+        RecipeStats,
+        {'user_id': user_id},
+        recipe_count=sign,
+        time_minutes_total=sign * int(time_minutes),
+        price_total=sign * price
+    )
+    _update_or_create(
+        RecipePriceBucket,
+        {'user_id': user_id, 'bucket': RecipePriceBucket.bucket_for(price)},
+        recipe_count=sign
+    )
+
+
+def recipe_count_subquery(through, field):
+    """Number of recipes linked to the outer tag/ingredient"""
+    return Coalesce(
+        Subquery(
+            through.objects.filter(**{field: OuterRef('pk')})
+            .values(field)
+            .annotate(n=Count('recipe_id'))
+            .values('n'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def remove_recipes(recipes):
+    """Remove recipes that will be deleted without signals from the rollups"""
+    # A few queries per user and price range, not per recipe.
+    totals = recipes.order_by().values('user_id').annotate(
+        count=Count('id'),
+        time=Sum('time_minutes'),
+        price=Sum('price')
+    )
+    for row in totals:
+        _update_or_create(
+            RecipeStats,
+            {'user_id': row['user_id']},
+            recipe_count=-row['count'],
+            time_minutes_total=-row['time'],
+            price_total=-row['price']
+        )
+    buckets = Counter(
+        (user_id, RecipePriceBucket.bucket_for(price))
+        for user_id, price in recipes.values_list('user_id', 'price')
+    )
+    for (user_id, bucket), count in buckets.items():
+        _update_or_create(
+            RecipePriceBucket,
+            {'user_id': user_id, 'bucket': bucket},
+            recipe_count=-count
+        )
+
+
+def queue_files(names):
+    """Queue stored files for purge_orphaned_files"""
+    OrphanedFile.objects.bulk_create(
+        OrphanedFile(name=name) for name in names if name
+    )
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_values(sender, instance, **kwargs):
+    """Keep the stored values of an updated recipe to compute the delta"""
+    instance._stats_previous = None
+    if instance.pk and not kwargs.get('raw'):
+        instance._stats_previous = Recipe.objects.filter(
+            pk=instance.pk
+        ).values('user_id', 'time_minutes', 'price', 'image').first()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    """Update the rollups with a new or changed recipe"""
+    if kwargs.get('raw'):
+        return
+    previous = getattr(instance, '_stats_previous', None)
+    if previous:
+        if previous['image'] and previous['image'] != instance.image.name:
+            # Replaced or removed image.
+            queue_files([previous['image']])
+        if (previous['user_id'] == instance.user_id and
+                previous['time_minutes'] == int(instance.time_minutes) and
+                previous['price'] == Decimal(str(instance.price))):
+            return
+        _apply_recipe(previous['user_id'], previous['time_minutes'],
+                      previous['price'], -1)
+    _apply_recipe(instance.user_id, instance.time_minutes,
+                  instance.price, 1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    """Release the tags and ingredients of a recipe being deleted"""
+    # The m2m rows are deleted without m2m_changed signals.
+    Tag.objects.filter(recipe=instance).update(
+        recipe_count=F('recipe_count') - 1
+    )
+    Ingredient.objects.filter(recipe=instance).update(
+        recipe_count=F('recipe_count') - 1
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """Remove a deleted recipe from the rollups"""
+    _apply_recipe(instance.user_id, instance.time_minutes,
+                  instance.price, -1)
+    queue_files([instance.image.name])
+
+
+def _recipe_relation_changed(counted_model, field_name, instance, action,
+                             reverse, pk_set, **kwargs):
+    """Update recipe_count when recipes and tags/ingredients are linked"""
+    through = getattr(Recipe, field_name).through
+    counted_field = f'{counted_model._meta.model_name}_id'
+    if reverse:
+        # f.e.: tag.recipe_set.add(recipe), instance is the tag.
+        own_field, other_field = counted_field, 'recipe_id'
+    else:
+        own_field, other_field = 'recipe_id', counted_field
+
+    if action in ('pre_remove', 'pre_clear'):
+        # Only count the links that actually exist.
+        links = through.objects.filter(**{own_field: instance.pk})
+        if pk_set is not None:
+            links = links.filter(**{f'{other_field}__in': pk_set})
+        instance._stats_removed = list(
+            links.values_list(other_field, flat=True)
+        )
+        return
+
+    if action == 'post_add' and pk_set:
+        changed, sign = list(pk_set), 1
+    elif action in ('post_remove', 'post_clear'):
+        changed, sign = getattr(instance, '_stats_removed', []), -1
+    else:
+        return
+    if not changed:
+        return
+
+    if reverse:
+        counted_model.objects.filter(pk=instance.pk).update(
+            recipe_count=F('recipe_count') + sign * len(changed)
+        )
+        update_vectors(changed)
+    else:
+        counted_model.objects.filter(pk__in=changed).update(
+            recipe_count=F('recipe_count') + sign
+        )
+        update_vectors([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, **kwargs):
+    _recipe_relation_changed(Tag, 'tags', **kwargs)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_ingredients_changed(sender, **kwargs):
+    _recipe_relation_changed(Ingredient, 'ingredients', **kwargs)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def linked_object_deleting(sender, instance, **kwargs):
+    """Remember the recipes of a tag/ingredient being deleted"""
+    # Its links are deleted without m2m_changed signals.
+    instance._vector_recipes = list(
+        instance.recipe_set.values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def linked_object_deleted(sender, instance, **kwargs):
+    """Drop a deleted tag/ingredient from the vectors of its recipes"""
+    recipes = getattr(instance, '_vector_recipes', None)
+    if recipes:
+        update_vectors(recipes)
@@ -0,0 +1,164 @@
+"""
+"Recipes like this one": similarity of the tags and ingredients.
+
+Every recipe is a binary sparse vector over the tags and ingredients of its
+user, precomputed in RecipeVector and updated when its links change
+(core.signals, Recipe.set_links). For a query, the user's vectors are
+loaded into a SciPy CSR matrix, kept in memory per process (LRU of
+SIMILAR_RECIPES_MATRIX_CACHE_SIZE users) until the user's vectors change,
+and every recipe is scored at once with one sparse product:
+
+* intersections = X . x  (the shared tags and ingredients)
+* jaccard = intersections / (|X| + |x| - intersections)
+* cosine = intersections / sqrt(|X| * |x|)
+
+The top k of a recipe are then cached for SIMILAR_RECIPES_CACHE_SECONDS.
+NumPy and SciPy are imported on the first query, not at boot.
+"""
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from core.models import Recipe, RecipeVector
+
+METRICS = ('jaccard', 'cosine')
+
+
+def features_of(recipes):
+    """{recipe id: feature ids} of a Recipe queryset"""
+    # Tags and ingredients in one space: 2 * tag id, 2 * ingredient id + 1.
+    features = defaultdict(list)
+    for field, offset in (('tags', 0), ('ingredients', 1)):
+        through = getattr(Recipe, field).through
+        model = getattr(Recipe, field).field.related_model
+        fk = f'{model._meta.model_name}_id'
+        links = through.objects.filter(recipe__in=recipes).values_list(
+            'recipe_id', fk
+        )
+        for recipe_id, pk in links.iterator():
+            features[recipe_id].append(2 * pk + offset)
+    return {recipe_id: sorted(ids) for recipe_id, ids in features.items()}
+
+
+def update_vectors(recipe_ids):
+    """Recompute the vectors of the recipes from their links"""
+    recipes = Recipe.objects.filter(pk__in=list(recipe_ids))
+    features = features_of(recipes)
+    now = timezone.now()
+    for recipe_id, user_id in recipes.values_list('pk', 'user_id'):
+        values = {
+            'user_id': user_id,
+            'features': ' '.join(map(str, features.get(recipe_id, ()))),
+            'updated_at': now,
+        }
+        vectors = RecipeVector.objects.filter(recipe_id=recipe_id)
+        if vectors.update(**values):
+            continue
+        try:
+            # Savepoint, so a lost creation race doesn't break the
+            # transaction.
+            with transaction.atomic():
+                RecipeVector.objects.create(recipe_id=recipe_id, **values)
+        except IntegrityError:
+            vectors.update(**values)
+
+
+class Vectors:
+    """The recipe vectors of a user, as a CSR matrix"""
+
+    def __init__(self, rows):
+        # rows: (recipe id, space-separated feature ids).
+        import numpy as np
+        from scipy import sparse
+
+        ids, indptr, indices = [], [0], []
+        for recipe_id, features in rows:
+            ids.append(recipe_id)
+            indices.extend(map(int, features.split()))
+            indptr.append(len(indices))
+        # Columns: the features used by the user, not every tag id.
+        columns, indices = np.unique(np.array(indices, dtype=np.int64),
+                                     return_inverse=True)
+        self.ids = np.array(ids, dtype=np.int64)
+        self.rows = {recipe_id: row for row, recipe_id in enumerate(ids)}
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), indices,
+             np.array(indptr, dtype=np.int64)),
+            shape=(len(ids), len(columns))
+        )
+        self.sizes = np.diff(self.matrix.indptr).astype(np.float32)
+
+    def top_k(self, recipe_id, k, metric='jaccard'):
+        """[(recipe id, score)] of the k recipes most like recipe_id"""
+        import numpy as np
+
+        row = self.rows.get(recipe_id)
+        if row is None or not k:
+            return []
+        shared = (self.matrix @ self.matrix[row].T).toarray().ravel()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if metric == 'cosine':
+                scores = shared / np.sqrt(self.sizes * self.sizes[row])
+            else:
+                scores = shared / (self.sizes + self.sizes[row] - shared)
+        scores[row] = 0
+        scores = np.nan_to_num(scores)
+
+        k = min(k, len(scores) - 1)
+        if k <= 0:
+            return []
+        # The k best in O(n), then only those are sorted.
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((self.ids[top], -scores[top]))]
+        return [(int(self.ids[i]), float(scores[i]))
+                for i in top if scores[i] > 0]
+
+
+_matrices = OrderedDict()
+_matrices_lock = threading.Lock()
+
+
+def user_vectors(user_id, version):
+    """The Vectors of a user, from the process cache if still current"""
+    with _matrices_lock:
+        cached = _matrices.get(user_id)
+        if cached and cached[0] == version:
+            _matrices.move_to_end(user_id)
+            return cached[1]
+
+    vectors = Vectors(
+        RecipeVector.objects.filter(user_id=user_id).exclude(
+            features=''
+        ).order_by('recipe_id').values_list('recipe_id', 'features')
+        .iterator()
+    )
+    with _matrices_lock:
+        _matrices[user_id] = (version, vectors)
+        _matrices.move_to_end(user_id)
+        while len(_matrices) > settings.SIMILAR_RECIPES_MATRIX_CACHE_SIZE:
+            _matrices.popitem(last=False)
+    return vectors
+
+
+def similar_recipes(recipe, k, metric='jaccard'):
+    """[(recipe id, score)] of the k recipes of its user most like recipe"""
+    # The user's latest vector update (one index lookup) versions both
+    # caches: any change of a tag or ingredient link invalidates them.
+    updated = RecipeVector.objects.filter(
+        user_id=recipe.user_id
+    ).aggregate(updated=Max('updated_at'))['updated']
+    if updated is None:
+        return []
+    version = updated.timestamp()
+    key = f'similar-recipes:{recipe.pk}:{metric}:{k}:{version}'
+    result = cache.get(key)
+    if result is None:
+        result = user_vectors(recipe.user_id, version).top_k(recipe.pk, k,
+                                                             metric)
+        cache.set(key, result, settings.SIMILAR_RECIPES_CACHE_SECONDS)
+    return result
@@ -0,0 +1,290 @@
+"""
+File storage backends.
+
+DEFAULT_FILE_STORAGE (see MEDIA_STORAGE in the settings) is one of:
+
+* FileSystemStorage: MEDIA_ROOT, a volume of the node.
+* S3Storage: an S3-compatible bucket (AWS S3, MinIO...), shared by every
+  app instance. Clients can upload images straight to the bucket with
+  presigned requests (presigned_post, multipart uploads), so the bytes
+  never go through the app workers.
+* InMemoryStorage: the stand-in of the tests (core.testing).
+"""
+import math
+import mimetypes
+import threading
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import Storage
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from django.utils.encoding import filepath_to_uri
+from django.utils.functional import cached_property
+
+
+@deconstructible
+class InMemoryStorage(Storage):
+    """Keep the files in a dict of the process (the test runner's media)"""
+    # Like Django 4.2's InMemoryStorage: nothing written to MEDIA_ROOT,
+    # nothing to clean up, and every parallel test process has its own.
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _open(self, name, mode='rb'):
+        with self._lock:
+            content, modified = self._files[name]
+        return ContentFile(content, name=name)
+
+    def _save(self, name, content):
+        data = b''.join(content.chunks())
+        with self._lock:
+            self._files[name] = (data, timezone.now())
+        return name
+
+    def delete(self, name):
+        with self._lock:
+            self._files.pop(name, None)
+
+    def exists(self, name):
+        return name in self._files
+
+    def listdir(self, path):
+        prefix = path.rstrip('/') + '/' if path else ''
+        directories, files = set(), []
+        for name in list(self._files):
+            if not name.startswith(prefix):
+                continue
+            head, _, tail = name[len(prefix):].partition('/')
+            if tail:
+                directories.add(head)
+            else:
+                files.append(head)
+        return sorted(directories), sorted(files)
+
+    def size(self, name):
+        return len(self._files[name][0])
+
+    def url(self, name):
+        base_url = self.base_url or settings.MEDIA_URL
+        return urljoin(base_url, filepath_to_uri(name))
+
+    def get_modified_time(self, name):
+        return self._files[name][1]
+
+    get_created_time = get_accessed_time = get_modified_time
+
+
+@deconstructible
+class S3Storage(Storage):
+    """Keep the files in an S3-compatible bucket"""
+
+    def __init__(self, bucket=None, endpoint_url=None, region=None,
+                 public_url=None):
+        self.bucket = bucket or settings.S3_BUCKET
+        self.endpoint_url = endpoint_url or settings.S3_ENDPOINT_URL
+        self.region = region or settings.S3_REGION
+        # Unset: the files are private, and their URLs presigned.
+        self.public_url = public_url or settings.S3_PUBLIC_URL
+
+    @cached_property
+    def client(self):
+        # Imported here: only the processes that touch the bucket load
+        # boto3 (see bench_startup).
+        import boto3
+        from botocore.config import Config
+
+        return boto3.client(
+            's3',
+            endpoint_url=self.endpoint_url,
+            region_name=self.region,
+            # None: boto3's own lookup (environment, instance role...).
+            aws_access_key_id=settings.S3_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            config=Config(signature_version='s3v4')
+        )
+
+    @cached_property
+    def transfer_config(self):
+        """Multipart transfers for the files above S3_MULTIPART_THRESHOLD"""
+        from boto3.s3.transfer import TransferConfig
+
+        return TransferConfig(
+            multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.S3_MULTIPART_CHUNK_SIZE
+        )
+
+    def _object_headers(self, name, content_type=None):
+        # The names are unique (see recipe_image_file_path): immutable.
+        return {
+            'ContentType': content_type or mimetypes.guess_type(name)[0] or
+            'application/octet-stream',
+            'CacheControl': f'max-age={settings.MEDIA_CACHE_MAX_AGE}, '
+                            'immutable',
+        }
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode or 'a' in mode:
+            raise ValueError('S3Storage files are read-only, save() them.')
+        # Seekable (f.e.: for Pillow), on disk past the memory limit.
+        body = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        self.client.download_fileobj(self.bucket, name, body,
+                                     Config=self.transfer_config)
+        body.seek(0)
+        return File(body, name=name)
+
+    def _save(self, name, content):
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        self.client.upload_fileobj(
+            content, self.bucket, name,
+            ExtraArgs=self._object_headers(
+                name, getattr(content, 'content_type', None)
+            ),
+            Config=self.transfer_config
+        )
+        return name
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def _head(self, name):
+        """The metadata of an object, None if it doesn't exist"""
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=name)
+        except self.client.exceptions.ClientError as exc:
+            if exc.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return None
+            raise
+
+    def exists(self, name):
+        return self._head(name) is not None
+
+    def size(self, name):
+        return self.client.head_object(Bucket=self.bucket,
+                                       Key=name)['ContentLength']
+
+    def get_modified_time(self, name):
+        return self.client.head_object(Bucket=self.bucket,
+                                       Key=name)['LastModified']
+
+    def listdir(self, path):
+        prefix = path.rstrip('/') + '/' if path else ''
+        directories, files = [], []
+        pages = self.client.get_paginator('list_objects_v2').paginate(
+            Bucket=self.bucket, Prefix=prefix, Delimiter='/'
+        )
+        for page in pages:
+            directories.extend(
+                common['Prefix'][len(prefix):].rstrip('/')
+                for common in page.get('CommonPrefixes', ())
+            )
+            files.extend(obj['Key'][len(prefix):]
+                         for obj in page.get('Contents', ()))
+        return directories, files
+
+    def url(self, name):
+        if self.public_url:
+            return urljoin(self.public_url.rstrip('/') + '/',
+                           filepath_to_uri(name))
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': name},
+            ExpiresIn=settings.S3_URL_EXPIRY
+        )
+
+    def check(self):
+        """Raise if the bucket can't be reached (core.health)"""
+        self.client.head_bucket(Bucket=self.bucket)
+
+    # Direct uploads: the client sends the file to the bucket itself.
+
+    def presigned_post(self, name, content_type, max_size):
+        """URL and form fields of a POST uploading one file to name"""
+        headers = self._object_headers(name, content_type)
+        fields = {'Content-Type': headers['ContentType'],
+                  'Cache-Control': headers['CacheControl']}
+        return self.client.generate_presigned_post(
+            Bucket=self.bucket,
+            Key=name,
+            Fields=fields,
+            # The bucket rejects other names, types and larger files.
+            Conditions=[{'Content-Type': fields['Content-Type']},
+                        {'Cache-Control': fields['Cache-Control']},
+                        ['content-length-range', 1, max_size]],
+            ExpiresIn=settings.S3_URL_EXPIRY
+        )
+
+    def create_multipart_upload(self, name, content_type, size):
+        """Start a multipart upload, return its id and presigned part URLs"""
+        # Parts of S3_MULTIPART_CHUNK_SIZE, the last one smaller.
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=name,
+            **self._object_headers(name, content_type)
+        )['UploadId']
+        parts = math.ceil(size / settings.S3_MULTIPART_CHUNK_SIZE)
+        urls = [
+            self.client.generate_presigned_url(
+                'upload_part',
+                Params={'Bucket': self.bucket, 'Key': name,
+                        'UploadId': upload_id, 'PartNumber': number},
+                ExpiresIn=settings.S3_URL_EXPIRY
+            )
+            for number in range(1, parts + 1)
+        ]
+        return upload_id, urls
+
+    def _rejected(self, exc):
+        """ValueError for a request the bucket refused (4xx), else exc"""
+        status = exc.response.get('ResponseMetadata', {}).get(
+            'HTTPStatusCode', 500
+        )
+        if status >= 500:
+            return exc
+        return ValueError(exc.response['Error'].get('Message') or str(exc))
+
+    def multipart_upload_size(self, name, upload_id):
+        """Total size of the parts uploaded so far"""
+        # Raises ValueError if the upload doesn't exist (any more).
+        paginator = self.client.get_paginator('list_parts')
+        try:
+            return sum(
+                part['Size']
+                for page in paginator.paginate(Bucket=self.bucket, Key=name,
+                                               UploadId=upload_id)
+                for part in page.get('Parts', ())
+            )
+        except self.client.exceptions.ClientError as exc:
+            raise self._rejected(exc) from exc
+
+    def complete_multipart_upload(self, name, upload_id, parts):
+        """Assemble the uploaded parts: [(part number, ETag), ...]"""
+        # Raises ValueError if the bucket rejects the parts (f.e. a wrong
+        # ETag or a missing part).
+        try:
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=name, UploadId=upload_id,
+                MultipartUpload={'Parts': [
+                    {'PartNumber': number, 'ETag': etag}
+                    for number, etag in sorted(parts)
+                ]}
+            )
+        except self.client.exceptions.ClientError as exc:
+            raise self._rejected(exc) from exc
+
+    def abort_multipart_upload(self, name, upload_id):
+        """Delete the uploaded parts, which are billed until then"""
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=name,
+                                               UploadId=upload_id)
+        except self.client.exceptions.ClientError as exc:
+            # Already completed or aborted.
+            if exc.response['Error']['Code'] != 'NoSuchUpload':
+                raise
@@ -0,0 +1,55 @@
+"""
+Jobs run by the workers (see core.jobs), enqueued by the API views.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+
+from core import deletion
+from core.models import Recipe
+from core.signals import queue_files
+
+
+def delete_account(user_id):
+    """Delete an account whose deletion was requested"""
+    user = get_user_model().objects.filter(
+        pk=user_id,
+        deletion_requested_at__isnull=False
+    ).first()
+    if user is not None:
+        deletion.delete_account(user)
+    return {'deleted': user is not None}
+
+
+def resize_recipe_image(recipe_id, name):
+    """Shrink a recipe image larger than RECIPE_IMAGE_MAX_SIZE"""
+    # name: the uploaded image, a newer upload makes the job a no-op.
+    recipe = Recipe.objects.filter(pk=recipe_id, image=name).first()
+    if recipe is None:
+        return {'resized': False}
+    # Imported here: the API views import this module to enqueue jobs, and
+    # Pillow would add ~25 ms to the boot of every process.
+    from PIL import Image
+
+    with recipe.image.open('rb') as fileobj:
+        image = Image.open(fileobj)
+        image_format = image.format
+        if max(image.size) <= settings.RECIPE_IMAGE_MAX_SIZE:
+            return {'resized': False}
+        image.thumbnail((settings.RECIPE_IMAGE_MAX_SIZE,) * 2,
+                        Image.LANCZOS)
+        output = BytesIO()
+        image.save(output, format=image_format)
+
+    # A new file name: the old one may be cached as immutable by clients.
+    recipe.image.save(os.path.basename(name),
+                      ContentFile(output.getvalue()), save=False)
+    # Unless the image was replaced in the meantime.
+    replaced = Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image=recipe.image.name
+    )
+    queue_files([name if replaced else recipe.image.name])
+    return {'resized': bool(replaced), 'image': recipe.image.name}
@@ -0,0 +1,29 @@
+"""
+Test runner of `manage.py test` (TEST_RUNNER).
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class FastTestRunner(DiscoverRunner):
+    """DiscoverRunner with cheaper settings for the tests"""
+    # PBKDF2 costs ~40 ms per create_user and the tests don't need
+    # passwords that resist brute force. The media stays in memory: no
+    # files left in MEDIA_ROOT, and one storage per parallel process
+    # (`manage.py test --parallel`, each with its own test database).
+
+    TEST_SETTINGS = {
+        'PASSWORD_HASHERS': [
+            'django.contrib.auth.hashers.MD5PasswordHasher',
+        ],
+        'DEFAULT_FILE_STORAGE': 'core.storage.InMemoryStorage',
+    }
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._test_settings = override_settings(**self.TEST_SETTINGS)
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,7 +1,11 @@
+from django.db import connection
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from core.models import Ingredient, Recipe, Tag
+
 
 class AdminSiteTests(TestCase):
 
@@ -45,3 +49,51 @@ class AdminSiteTests(TestCase):
         res = self.client.get(url)
 
         self.assertEqual(res.status_code, 200)
+
+    def test_recipe_change_page_autocomplete(self):
+        """Test: the recipe page doesn't list every tag and ingredient"""
+        recipe = Recipe.objects.create(user=self.user, title='Curry',
+                                       time_minutes=10, price=5)
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Spicy'))
+        Tag.objects.create(user=self.user, name='Unused tag')
+        Ingredient.objects.create(user=self.user, name='Unused ingredient')
+
+        res = self.client.get(
+            reverse('admin:core_recipe_change', args=[recipe.id])
+        )
+
+        self.assertContains(res, 'Spicy')
+        self.assertNotContains(res, 'Unused tag')
+        self.assertNotContains(res, 'Unused ingredient')
+
+    def test_recipe_changelist_queries(self):
+        """Test: the recipe list costs the same queries for 1 or 10 rows"""
+        url = reverse('admin:core_recipe_changelist')
+        Recipe.objects.create(user=self.user, title='Recipe',
+                              time_minutes=10, price=5)
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(url)
+
+        for i in range(9):
+            user = get_user_model().objects.create_user(
+                email=f'user{i}@shevo.com',
+                password='test123'
+            )
+            Recipe.objects.create(user=user, title=f'Recipe {i}',
+                                  time_minutes=10, price=5)
+        with CaptureQueriesContext(connection) as ten:
+            res = self.client.get(url)
+
+        self.assertContains(res, 'user8@shevo.com')
+        self.assertEqual(len(ten), len(one))
+
+    def test_tag_search(self):
+        """Test: searching tags by name prefix"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Not vegan')
+
+        res = self.client.get(reverse('admin:core_tag_changelist'),
+                              {'q': 'veg'})
+
+        self.assertContains(res, 'Vegan')
+        self.assertNotContains(res, 'Not vegan')
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from app.asgi import ThreadPoolWsgiToAsgi, application
+
+
+def http_scope(path):
+    """Return a minimal ASGI HTTP scope for a GET request"""
+    return {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': 'GET',
+        'path': path,
+        'query_string': b'',
+        'headers': [(b'host', b'testserver')],
+    }
+
+
+def call_asgi(app, scope, message=None):
+    """Run a request through an ASGI app and return the sent messages"""
+    sent = []
+
+    async def receive():
+        return message or {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        await app(scope, receive, send)
+
+    return run, sent
+
+
+def slow_wsgi_app(environ, start_response):
+    """A WSGI app standing in for a slow DB call"""
+    time.sleep(0.2)
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'slow ', b'response']
+
+
+class StreamedResponse:
+    """A WSGI response of many chunks, recording how far it was read"""
+
+    def __init__(self, count):
+        self.count = count
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        for _ in range(self.count):
+            self.read += 1
+            yield b'0123456789'
+
+    def close(self):
+        self.closed = True
+
+
+class AsgiTests(TestCase):
+
+    def test_response_is_forwarded(self):
+        """Test: status, headers and body reach the ASGI server"""
+        app = ThreadPoolWsgiToAsgi(slow_wsgi_app, max_workers=1)
+        run, sent = call_asgi(app, http_scope('/'))
+        asyncio.get_event_loop().run_until_complete(run())
+
+        self.assertEqual(sent[0]['type'], 'http.response.start')
+        self.assertEqual(sent[0]['status'], 200)
+        body = b''.join(m.get('body', b'') for m in sent[1:])
+        self.assertEqual(body, b'slow response')
+        self.assertFalse(sent[-1].get('more_body', False))
+
+    def test_requests_are_served_concurrently(self):
+        """Test: slow requests run in parallel on the thread pool"""
+        app = ThreadPoolWsgiToAsgi(slow_wsgi_app, max_workers=5)
+        runs = [call_asgi(app, http_scope('/'))[0]() for _ in range(5)]
+
+        start = time.perf_counter()
+        asyncio.get_event_loop().run_until_complete(asyncio.gather(*runs))
+
+        # Serially it would take 5 * 0.2s.
+        self.assertLess(time.perf_counter() - start, 0.6)
+
+    def test_django_application(self):
+        """Test: the project's ASGI application serves the API"""
+        run, sent = call_asgi(application, http_scope('/api/recipe/tags/'))
+        asyncio.get_event_loop().run_until_complete(run())
+
+        self.assertEqual(sent[0]['status'], 401)
+
+    @patch('app.asgi.BUFFER_SIZE', 30)
+    def test_large_response_is_streamed(self):
+        """Test: a large response is read by batches as it's sent"""
+        response = StreamedResponse(10)
+        progress = []
+
+        def wsgi_app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return response
+
+        app = ThreadPoolWsgiToAsgi(wsgi_app, max_workers=1)
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            progress.append(response.read)
+            sent.append(message)
+
+        asyncio.get_event_loop().run_until_complete(
+            app(http_scope('/'), receive, send)
+        )
+
+        body = b''.join(m.get('body', b'') for m in sent[1:])
+        self.assertEqual(body, b'0123456789' * 10)
+        # The first chunk was sent before the last one was read.
+        self.assertLess(progress[1], 10)
+        self.assertTrue(response.closed)
+
+    def test_disconnect_before_body(self):
+        """Test: a client leaving during the upload ends the request"""
+        app = ThreadPoolWsgiToAsgi(slow_wsgi_app, max_workers=1)
+        run, sent = call_asgi(app, http_scope('/'),
+                              {'type': 'http.disconnect'})
+        asyncio.get_event_loop().run_until_complete(run())
+
+        self.assertEqual(sent, [])
@@ -1,9 +1,22 @@
-from unittest.mock import patch
+import gzip
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from itertools import chain, repeat
+from unittest.mock import MagicMock, patch
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 from django.test import TestCase
 
+from core.health import check_cache
+from core.models import Recipe, RecipePriceBucket, RecipeStats, \
+                        RecipeVector, Tag
+
 
 class CommandTests(TestCase):
 
@@ -13,19 +26,183 @@ class CommandTests(TestCase):
         # depending on whether the DB is available or not.
         # We will patch the behaviour of the ConnectionHandler.
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            # Overwrite the behaviour.
-            gi.return_value = True  # Available for the mock object.
-            call_command('wait_for_db')  # We will create that command later.
-            self.assertEqual(gi.call_count, 1)  # call_count -> mock object.
+            out = StringIO()
+            call_command('wait_for_db', stdout=out)
+            # A real query was run on the connection.
+            cursor = gi.return_value.cursor.return_value.__enter__
+            cursor.return_value.execute.assert_called_once_with('SELECT 1')
+            self.assertIn('database=default attempt=1 status=available',
+                          out.getvalue())
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):  # time sleep (eq. to the gi above)
         """Test: waiting for db"""
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            # It will simulate that it tries to connect to the DB 5 times,
-            # and finally connects of the 6th attempt.
+            # It will simulate a DB that accepts connections (the lookup
+            # succeeds) but fails the first 5 queries while starting up,
+            # and finally works on the 6th attempt.
             # We use the mock side_effect to define what will happen
             # each time the mock is used.
-            gi.side_effect = [OperationalError] * 5 + [True]
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 6)
+            gi.return_value.cursor.side_effect = \
+                [OperationalError('starting up')] * 5 + [MagicMock()]
+            out = StringIO()
+            call_command('wait_for_db', stdout=out)
+            self.assertEqual(gi.return_value.cursor.call_count, 6)
+            self.assertIn('attempt=6 status=available', out.getvalue())
+
+        # Exponential backoff: every delay is within [d/2, d] of 0.1 * 2^n.
+        delays = [c[0][0] for c in ts.call_args_list]
+        self.assertEqual(len(delays), 5)
+        for attempt, delay in enumerate(delays):
+            self.assertGreaterEqual(delay, 0.1 * 2 ** attempt / 2)
+            self.assertLessEqual(delay, 0.1 * 2 ** attempt)
+
+    @patch('time.sleep', return_value=True)
+    @patch('time.monotonic')
+    def test_wait_for_db_timeout(self, monotonic, ts):
+        """Test: giving up when the DB doesn't start in time"""
+        # Every attempt takes 4 seconds.
+        monotonic.side_effect = range(0, 1000, 4)
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            gi.return_value.cursor.side_effect = OperationalError('down')
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', '--timeout', '10',
+                             stdout=StringIO())
+
+        self.assertEqual(gi.return_value.cursor.call_count, 3)
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_cache(self, ts):
+        """Test: waiting for the caches too"""
+        with patch('django.db.utils.ConnectionHandler.__getitem__'), \
+                patch('django.core.cache.CacheHandler.__getitem__') as cache:
+            # Like memcached while it starts: set() fails silently, get()
+            # misses, until the third attempt.
+            store = {}
+            up = chain([False, False], repeat(True))
+            cache.return_value.set.side_effect = \
+                lambda key, value, timeout: store.__setitem__(key, value)
+            cache.return_value.get.side_effect = \
+                lambda key: store.get(key) if next(up) else None
+            out = StringIO()
+            call_command('wait_for_db', stdout=out)
+
+        self.assertIn('cache=default attempt=3 status=available',
+                      out.getvalue())
+
+    def test_check_cache_mismatch(self):
+        """Test: a cache that doesn't return what was set is down"""
+        with patch('django.core.cache.CacheHandler.__getitem__') as cache:
+            cache.return_value.get.return_value = None
+            with self.assertRaises(ConnectionError):
+                check_cache()
+
+    @patch('core.management.commands.serve.call_command')
+    def test_serve_dev_mode(self, cc):
+        """Test: dev mode starts the development server"""
+        call_command('serve', '--mode', 'dev', stdout=StringIO())
+        cc.assert_called_once_with('runserver', '0.0.0.0:8000')
+
+    @patch('os.execvp')
+    def test_serve_prod_mode(self, execvp):
+        """Test: prod mode replaces the process with gunicorn"""
+        call_command('serve', '--mode', 'prod', stdout=StringIO())
+        argv = execvp.call_args[0][1]
+        self.assertEqual(argv[0], 'gunicorn')
+        self.assertIn('gunicorn.conf.py', argv)
+        self.assertEqual(argv[-1], 'app.wsgi:application')
+
+    @patch('os.execvp')
+    def test_serve_prod_mode_asgi(self, execvp):
+        """Test: prod mode can serve the ASGI application"""
+        call_command('serve', '--mode', 'prod', '--asgi', stdout=StringIO())
+        argv = execvp.call_args[0][1]
+        self.assertIn('uvicorn.workers.UvicornWorker', argv)
+        self.assertEqual(argv[-1], 'app.asgi:application')
+
+    @patch('core.management.commands.bench.urlopen')
+    def test_bench_reports_throughput(self, urlopen):
+        """Test: the bench command reports throughput and latency"""
+        urlopen.return_value.__enter__.return_value.read.return_value = b'ok'
+        urlopen.return_value.__enter__.return_value.status = 200
+        out = StringIO()
+        call_command('bench', 'http://localhost:8000/', '-n', '20',
+                     '-c', '4', '-H', 'Authorization: Token abc', stdout=out)
+
+        self.assertEqual(urlopen.call_count, 20)
+        request = urlopen.call_args[0][0]
+        self.assertEqual(request.get_header('Authorization'), 'Token abc')
+        self.assertIn('req/s', out.getvalue())
+        self.assertIn('errors: 0', out.getvalue())
+
+    def test_compress_static(self):
+        """Test: compressible static files get a .gz sibling"""
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        with open(os.path.join(root, 'app.css'), 'w') as f:
+            f.write('body { color: red; }\n' * 50)
+        with open(os.path.join(root, 'tiny.js'), 'w') as f:
+            f.write('1;')
+        with open(os.path.join(root, 'logo.png'), 'wb') as f:
+            f.write(b'\x89PNG' * 100)
+
+        call_command('compress_static', '--root', root, stdout=StringIO())
+
+        with gzip.open(os.path.join(root, 'app.css.gz'), 'rt') as f:
+            self.assertEqual(f.read(), 'body { color: red; }\n' * 50)
+        self.assertFalse(os.path.exists(os.path.join(root, 'tiny.js.gz')))
+        self.assertFalse(os.path.exists(os.path.join(root, 'logo.png.gz')))
+
+    def test_rebuild_recipe_stats(self):
+        """Test: the rollups are rebuilt from the recipe tables"""
+        user = get_user_model().objects.create_user('test@shevo.com', 'pw')
+        tag = Tag.objects.create(user=user, name='Vegan')
+        recipe = Recipe.objects.create(user=user, title='Soup',
+                                       time_minutes=10, price=Decimal('7.5'))
+        recipe.tags.add(tag)
+        # Wipe the rollups, like a bulk change bypassing the signals would.
+        RecipeStats.objects.all().delete()
+        RecipePriceBucket.objects.all().delete()
+        Tag.objects.update(recipe_count=0)
+        RecipeVector.objects.all().delete()
+
+        call_command('rebuild_recipe_stats', stdout=StringIO())
+
+        stats = RecipeStats.objects.get(user=user)
+        self.assertEqual(stats.recipe_count, 1)
+        self.assertEqual(stats.time_minutes_total, 10)
+        self.assertEqual(stats.price_total, Decimal('7.50'))
+        self.assertEqual(
+            RecipePriceBucket.objects.get(user=user).bucket, 1
+        )
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 1)
+        self.assertEqual(RecipeVector.objects.get(recipe=recipe).features,
+                         str(2 * tag.pk))
+
+    def test_bench_similarity(self):
+        """Test: the similarity benchmark times every metric"""
+        out = StringIO()
+        call_command('bench_similarity', '--recipes', '50', '-n', '5',
+                     stdout=out)
+
+        self.assertIn('50 recipes', out.getvalue())
+        self.assertIn('jaccard', out.getvalue())
+        self.assertIn('cosine', out.getvalue())
+
+    def test_bench_startup_lazy_imports(self):
+        """Test: the boot doesn't import the modules kept off the hot path"""
+        out = StringIO()
+        call_command('bench_startup', '-n', '1', '--forbid', 'PIL',
+                     '--forbid', 'cProfile', '--forbid', 'tracemalloc',
+                     stdout=out)
+
+        self.assertIn('Boot: ', out.getvalue())
+        self.assertIn('django', out.getvalue())
+
+    def test_bench_startup_forbidden_import(self):
+        """Test: importing a forbidden module at boot fails the check"""
+        with self.assertRaisesMessage(CommandError, 'Imported at boot: '
+                                                    'rest_framework'):
+            call_command('bench_startup', '-n', '1', '--forbid',
+                         'rest_framework', stdout=StringIO())
@@ -0,0 +1,138 @@
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.deletion import delete_account, delete_recipes, \
+                          request_account_deletion
+from core.models import Ingredient, OrphanedFile, Recipe, \
+                        RecipePriceBucket, RecipeStats, Tag
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00')
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class DeletionTests(TestCase):
+    """Test: batched deletion of recipes and accounts"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@shevo.com',
+            'testing321'
+        )
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(user=self.user,
+                                                    name='Rice')
+        self.recipes = []
+        for i in range(5):
+            recipe = sample_recipe(self.user, time_minutes=10 + i,
+                                   image=f'uploads/recipe/{i}.jpg')
+            recipe.tags.add(self.tag)
+            recipe.ingredients.add(self.ingredient)
+            self.recipes.append(recipe)
+
+    def test_delete_recipes_in_batches(self):
+        """Test: deleting recipes keeps the rollups and queues the images"""
+        kept = self.recipes[0]
+
+        # 16 queries per batch (links, counts, vectors, rollups, recipes,
+        # files), whatever its size, and 3 to find that nothing is left.
+        with self.assertNumQueries(35):
+            deleted = delete_recipes(
+                Recipe.objects.exclude(pk=kept.pk), batch_size=2
+            )
+
+        self.assertEqual(deleted, 4)
+        self.assertEqual(list(Recipe.objects.all()), [kept])
+        self.tag.refresh_from_db()
+        self.assertEqual(self.tag.recipe_count, 1)
+        self.assertEqual(list(kept.ingredients.all()), [self.ingredient])
+        stats = RecipeStats.objects.get(user=self.user)
+        self.assertEqual(stats.recipe_count, 1)
+        self.assertEqual(stats.time_minutes_total, 10)
+        self.assertEqual(RecipePriceBucket.objects.get(
+            user=self.user
+        ).recipe_count, 1)
+        self.assertEqual(
+            set(OrphanedFile.objects.values_list('name', flat=True)),
+            {f'uploads/recipe/{i}.jpg' for i in range(1, 5)}
+        )
+
+    def test_delete_account(self):
+        """Test: deleting an account deletes everything it owns"""
+        other = get_user_model().objects.create_user(
+            'other@shevo.com',
+            'testing321'
+        )
+        other_recipe = sample_recipe(other)
+
+        delete_account(self.user, batch_size=2)
+
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists()
+        )
+        self.assertEqual(list(Recipe.objects.all()), [other_recipe])
+        self.assertFalse(Tag.objects.exists())
+        self.assertFalse(Ingredient.objects.exists())
+        self.assertFalse(RecipeStats.objects.filter(user_id=self.user.pk)
+                         .exists())
+        self.assertEqual(OrphanedFile.objects.count(), 5)
+
+    @patch('core.deletion.heartbeat')
+    def test_delete_account_heartbeat(self, heartbeat):
+        """Test: the job's lock is extended after every batch"""
+        delete_account(self.user, batch_size=2)
+
+        # 3 batches of recipes, 1 of tags and 1 of ingredients.
+        self.assertEqual(heartbeat.call_count, 5)
+
+    def test_purge_accounts(self):
+        """Test: purge_accounts deletes the requested accounts only"""
+        other = get_user_model().objects.create_user(
+            'other@shevo.com',
+            'testing321'
+        )
+        request_account_deletion(self.user)
+
+        call_command('purge_accounts', stdout=StringIO())
+
+        self.assertEqual(list(get_user_model().objects.all()), [other])
+
+    def test_deleted_and_replaced_images_queued(self):
+        """Test: the image of a deleted or changed recipe is queued"""
+        first, second = self.recipes[:2]
+
+        first.delete()
+        second.image = 'uploads/recipe/new.jpg'
+        second.save()
+
+        self.assertEqual(
+            set(OrphanedFile.objects.values_list('name', flat=True)),
+            {'uploads/recipe/0.jpg', 'uploads/recipe/1.jpg'}
+        )
+
+    @patch('core.management.commands.purge_orphaned_files.default_storage')
+    def test_purge_orphaned_files(self, storage):
+        """Test: queued files are deleted unless a recipe shares them"""
+        shared = self.recipes[1].copy_for(self.user)
+        delete_recipes(Recipe.objects.filter(
+            pk__in=[self.recipes[0].pk, self.recipes[1].pk]
+        ))
+
+        call_command('purge_orphaned_files', stdout=StringIO())
+
+        storage.delete.assert_called_once_with('uploads/recipe/0.jpg')
+        self.assertFalse(OrphanedFile.objects.exists())
+        self.assertEqual(shared.image.name, 'uploads/recipe/1.jpg')
@@ -0,0 +1,241 @@
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import jobs
+from core.models import Job, OrphanedFile, Recipe
+from core.tasks import resize_recipe_image
+
+
+def add(a, b):
+    return a + b
+
+
+def fail():
+    raise ValueError('Nope')
+
+
+def outlive_timeout(steps):
+    """Run for longer than the visibility timeout, with heartbeats"""
+    for _ in range(steps):
+        # As if the step had lasted until the lock expired.
+        Job.objects.filter(status=Job.RUNNING).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        jobs.heartbeat()
+        if jobs.claim('worker-2') is not None:
+            return 'claimed twice'
+    return 'done'
+
+
+def lose_lock():
+    """Be claimed by another worker while running"""
+    Job.objects.filter(status=Job.RUNNING).update(
+        locked_until=timezone.now() - timedelta(seconds=1)
+    )
+    jobs.claim('worker-2')
+    jobs.heartbeat()
+    return 'done'
+
+
+class JobQueueTests(TestCase):
+    """Test: the database-backed job queue"""
+
+    def test_run_job(self):
+        """Test: running a job records its result"""
+        job = jobs.enqueue(add, 1, b=2)
+
+        self.assertTrue(jobs.run_next('worker'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, '3')
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.finished_at)
+        self.assertFalse(jobs.run_next('worker'))
+
+    @override_settings(JOB_RETRY_DELAY=60)
+    def test_retry_then_fail(self):
+        """Test: a failing job is retried later, then marked as failed"""
+        job = jobs.enqueue(fail, max_attempts=2)
+
+        jobs.run_next('worker')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertIn('ValueError: Nope', job.error)
+        self.assertGreater(job.run_at, timezone.now())
+        # Not due yet.
+        self.assertFalse(jobs.run_next('worker'))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.run_next('worker')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_priority(self):
+        """Test: jobs with a higher priority run first"""
+        jobs.enqueue(add, 1, 1)
+        urgent = jobs.enqueue(add, 2, 2, priority=10)
+
+        self.assertEqual(jobs.claim('worker'), urgent)
+
+    def test_visibility_timeout(self):
+        """Test: a job whose worker died is claimed again"""
+        job = jobs.enqueue(add, 1, 1)
+        lost = jobs.claim('worker-1')
+        self.assertIsNone(jobs.claim('worker-2'))
+
+        Job.objects.filter(pk=job.pk).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        reclaimed = jobs.claim('worker-2')
+
+        self.assertEqual(reclaimed, job)
+        self.assertEqual(reclaimed.attempts, 2)
+        # The first worker no longer owns the job.
+        jobs.run(lost)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.RUNNING)
+
+    def test_heartbeat(self):
+        """Test: a job outliving the timeout keeps its lock with heartbeats"""
+        job = jobs.enqueue(outlive_timeout, 3)
+
+        self.assertTrue(jobs.run_next('worker-1'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, '"done"')
+        self.assertEqual(job.attempts, 1)
+
+    def test_heartbeat_lock_lost(self):
+        """Test: a job claimed again by another worker stops"""
+        job = jobs.enqueue(lose_lock)
+
+        self.assertTrue(jobs.run_next('worker-1'))
+
+        job.refresh_from_db()
+        # Still running, for the other worker.
+        self.assertEqual(job.status, Job.RUNNING)
+        self.assertEqual(job.locked_by, 'worker-2')
+        self.assertEqual(job.result, '')
+
+    def test_heartbeat_out_of_job(self):
+        """Test: heartbeat() is a no-op out of a job"""
+        jobs.heartbeat()
+
+    @override_settings(JOB_QUEUE_CONCURRENCY={'images': 1})
+    def test_queue_concurrency(self):
+        """Test: a queue runs at most JOB_QUEUE_CONCURRENCY jobs"""
+        jobs.enqueue(add, 1, 1, queue='images')
+        jobs.enqueue(add, 2, 2, queue='images')
+        other = jobs.enqueue(add, 3, 3)
+
+        self.assertEqual(jobs.claim('worker-1').queue, 'images')
+        self.assertEqual(jobs.claim('worker-2'), other)
+        self.assertIsNone(jobs.claim('worker-3'))
+
+    # It would drop the connection of the test transaction.
+    @patch('core.management.commands.run_worker.close_old_connections')
+    def test_run_worker_burst(self, close_old_connections):
+        """Test: run_worker --burst runs the queued jobs and exits"""
+        for i in range(3):
+            jobs.enqueue(add, i, i)
+
+        call_command('run_worker', '--burst', stdout=StringIO())
+
+        self.assertEqual(Job.objects.filter(status=Job.SUCCEEDED).count(), 3)
+
+
+class JobStatusApiTests(TestCase):
+    """Test: polling the status of a job"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@shevo.com',
+            'testing321'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_job_status(self):
+        """Test: the owner of a job can poll it"""
+        job = jobs.enqueue(add, 1, 1, user=self.user)
+        jobs.run_next('worker')
+
+        res = self.client.get(reverse('job-status', args=[job.id]))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['status'], Job.SUCCEEDED)
+        self.assertEqual(res.data['result'], 2)
+
+    def test_job_status_other_user(self):
+        """Test: the jobs of other users can't be polled"""
+        job = jobs.enqueue(add, 1, 1)
+
+        res = self.client.get(reverse('job-status', args=[job.id]))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ResizeRecipeImageTests(TestCase):
+    """Test: shrinking oversized recipe images"""
+
+    def setUp(self):
+        self.settings = override_settings(RECIPE_IMAGE_MAX_SIZE=10)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+        user = get_user_model().objects.create_user(
+            'test@shevo.com',
+            'testing321'
+        )
+        self.recipe = Recipe.objects.create(user=user, title='Curry',
+                                            time_minutes=10, price=5)
+
+    def save_image(self, size):
+        output = BytesIO()
+        Image.new('RGB', size).save(output, format='JPEG')
+        name = default_storage.save('uploads/recipe/curry.jpg',
+                                    ContentFile(output.getvalue()))
+        self.addCleanup(default_storage.delete, name)
+        self.recipe.image = name
+        self.recipe.save()
+        return name
+
+    def test_resize_large_image(self):
+        """Test: a large image is replaced by a smaller copy"""
+        name = self.save_image((40, 20))
+
+        result = resize_recipe_image(self.recipe.id, name)
+
+        self.recipe.refresh_from_db()
+        self.assertTrue(result['resized'])
+        self.assertNotEqual(self.recipe.image.name, name)
+        self.addCleanup(self.recipe.image.delete, save=False)
+        with self.recipe.image.open() as f, Image.open(f) as image:
+            self.assertEqual(image.size, (10, 5))
+        self.assertTrue(OrphanedFile.objects.filter(name=name).exists())
+
+    def test_keep_small_image(self):
+        """Test: a small enough image is left alone"""
+        name = self.save_image((8, 8))
+
+        result = resize_recipe_image(self.recipe.id, name)
+
+        self.assertFalse(result['resized'])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, name)
@@ -0,0 +1,232 @@
+import gzip
+import json
+import os
+import pstats
+import tempfile
+import tracemalloc
+from io import StringIO
+
+import brotli
+import zstandard
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import Client, RequestFactory, TestCase, \
+                        override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.middleware import CompressionMiddleware, ProfilingMiddleware, \
+                            choose_encoding
+from core.models import Tag
+
+
+def zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+class PathRoutedMiddlewareTests(TestCase):
+
+    def test_api_skips_session_middleware(self):
+        """Test: API requests don't run the session-based middleware"""
+        res = self.client.get(reverse('recipe:tag-list'))
+
+        self.assertEqual(res.status_code, 401)
+        self.assertFalse(hasattr(res.wsgi_request, 'session'))
+        self.assertNotIn('X-Frame-Options', res)
+
+    def test_admin_keeps_full_stack(self):
+        """Test: admin requests still run sessions and clickjacking"""
+        res = self.client.get(reverse('admin:login'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(hasattr(res.wsgi_request, 'session'))
+        self.assertEqual(res['X-Frame-Options'], 'SAMEORIGIN')
+
+    def test_admin_enforces_csrf(self):
+        """Test: the nested CSRF middleware still protects the admin"""
+        get_user_model().objects.create_superuser('admin@shevo.com', 'pw')
+        client = Client(enforce_csrf_checks=True)
+        res = client.post(reverse('admin:login'), {
+            'username': 'admin@shevo.com',
+            'password': 'pw'
+        })
+
+        self.assertEqual(res.status_code, 403)
+
+    def test_bench_middleware(self):
+        """Test: the middleware overhead benchmark runs"""
+        out = StringIO()
+        call_command('bench_middleware', '-n', '5', stdout=out)
+
+        self.assertIn('path-routed stack', out.getvalue())
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """Test: on-demand profiles of single requests"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.settings = override_settings(
+            PROFILING_ENABLED=True,
+            PROFILING_DIR=self.directory.name,
+            PROFILING_MAX_FILES=2
+        )
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+        staff = get_user_model().objects.create_superuser('admin@shevo.com',
+                                                          'pw')
+        user = get_user_model().objects.create_user('test@shevo.com', 'pw')
+        self.staff_token = Token.objects.create(user=staff).key
+        self.user_token = Token.objects.create(user=user).key
+        self.middleware = ProfilingMiddleware(
+            lambda request: HttpResponse(b'x' * 100)
+        )
+
+    def request(self, token, **extra):
+        return RequestFactory().get('/api/recipe/recipes/', {'profile': 1},
+                                    HTTP_AUTHORIZATION=f'Token {token}',
+                                    **extra)
+
+    def files(self):
+        return sorted(os.listdir(self.directory.name))
+
+    def test_disabled_by_default(self):
+        """Test: the middleware leaves the stack unless enabled"""
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: HttpResponse())
+
+    def test_profile_staff_request(self):
+        """Test: a staff request is profiled on demand"""
+        res = self.middleware(self.request(self.staff_token))
+
+        profile_id = res['X-Profile-Id']
+        self.assertEqual(self.files(), [f'{profile_id}.prof',
+                                        f'{profile_id}.tracemalloc'])
+        base = os.path.join(self.directory.name, profile_id)
+        pstats.Stats(base + '.prof')
+        tracemalloc.Snapshot.load(base + '.tracemalloc')
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_no_profile_for_users(self):
+        """Test: the requests of non-staff users aren't profiled"""
+        res = self.middleware(self.request(self.user_token))
+
+        self.assertNotIn('X-Profile-Id', res)
+        self.assertEqual(self.files(), [])
+
+    def test_no_profile_unless_requested(self):
+        """Test: staff requests without the flag aren't profiled"""
+        request = RequestFactory().get(
+            '/api/recipe/recipes/',
+            HTTP_AUTHORIZATION=f'Token {self.staff_token}'
+        )
+
+        with self.assertNumQueries(0):
+            res = self.middleware(request)
+
+        self.assertNotIn('X-Profile-Id', res)
+
+    def test_retention(self):
+        """Test: only the PROFILING_MAX_FILES newest profiles are kept"""
+        ids = [self.middleware(self.request(self.staff_token))['X-Profile-Id']
+               for _ in range(3)]
+
+        self.assertEqual(len(self.files()), 4)
+        self.assertNotIn(f'{ids[0]}.prof', self.files())
+
+
+def big_response(content_type='application/json', streaming=False):
+    """Return a get_response callable producing a large response"""
+    body = b'{"title": "Sample recipe"}, ' * 200
+
+    def get_response(request):
+        if streaming:
+            return StreamingHttpResponse([body, body],
+                                         content_type=content_type)
+        return HttpResponse(body, content_type=content_type)
+    return get_response, body
+
+
+class CompressionMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_choose_encoding(self):
+        """Test: negotiating the encoding from Accept-Encoding"""
+        available = ['zstd', 'br', 'gzip']
+        self.assertEqual(choose_encoding('gzip, deflate, br', available),
+                         'br')
+        self.assertEqual(choose_encoding('gzip;q=1.0, br;q=0.5', available),
+                         'gzip')
+        self.assertEqual(choose_encoding('zstd, br, gzip', available), 'zstd')
+        self.assertEqual(choose_encoding('*', available), 'zstd')
+        self.assertIsNone(choose_encoding('gzip;q=0, deflate', available))
+        self.assertIsNone(choose_encoding('', available))
+
+    def test_compress_json(self):
+        """Test: large JSON responses are compressed"""
+        get_response, body = big_response()
+        for encoding, decompress in (('gzip', gzip.decompress),
+                                     ('br', brotli.decompress),
+                                     ('zstd', zstd_decompress)):
+            request = self.factory.get('/', HTTP_ACCEPT_ENCODING=encoding)
+            res = CompressionMiddleware(get_response)(request)
+
+            self.assertEqual(res['Content-Encoding'], encoding)
+            self.assertEqual(res['Vary'], 'Accept-Encoding')
+            self.assertEqual(int(res['Content-Length']), len(res.content))
+            self.assertEqual(decompress(res.content), body)
+
+    def test_compress_streaming(self):
+        """Test: streaming responses are compressed chunk by chunk"""
+        get_response, body = big_response(streaming=True)
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        res = CompressionMiddleware(get_response)(request)
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertFalse(res.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(res.streaming_content)),
+                         body + body)
+
+    def test_skip_small_and_media(self):
+        """Test: small responses and images are sent as they are"""
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        small = CompressionMiddleware(
+            lambda r: HttpResponse(b'{}', content_type='application/json')
+        )(request)
+        get_response, body = big_response(content_type='image/jpeg')
+        image = CompressionMiddleware(get_response)(request)
+
+        self.assertFalse(small.has_header('Content-Encoding'))
+        self.assertFalse(image.has_header('Content-Encoding'))
+        self.assertEqual(image.content, body)
+
+    def test_api_response_compressed(self):
+        """Test: the recipe API responses go out compressed"""
+        user = get_user_model().objects.create_user('test@shevo.com', 'pw')
+        for i in range(100):
+            Tag.objects.create(user=user, name=f'Tag number {i}')
+        client = APIClient()
+        client.force_authenticate(user)
+
+        res = client.get(reverse('recipe:tag-list'),
+                         HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(res.content))), 100)
+
+    def test_bench_compression(self):
+        """Test: the compression benchmark runs"""
+        out = StringIO()
+        call_command('bench_compression', '--recipes', '10', '--rounds', '1',
+                     stdout=out)
+
+        self.assertIn('zstd', out.getvalue())
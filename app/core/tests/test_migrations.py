@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MigrationTests(TransactionTestCase):
+    """Test: the data migrations on pre-existing rows"""
+    before = [('core', '0005_recipe_image')]
+    after = [('core', '0006_recipe_stats')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.addCleanup(self.migrate, executor.loader.graph.leaf_nodes())
+        self.apps = self.migrate(self.before)
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_recipe_stats_backfilled(self):
+        """Test: the rollups count the recipes created before 0006"""
+        User = self.apps.get_model('core', 'User')
+        Tag = self.apps.get_model('core', 'Tag')
+        Ingredient = self.apps.get_model('core', 'Ingredient')
+        Recipe = self.apps.get_model('core', 'Recipe')
+        user = User.objects.create(email='test@shevo.com')
+        vegan = Tag.objects.create(user=user, name='Vegan')
+        Tag.objects.create(user=user, name='Unused')
+        salt = Ingredient.objects.create(user=user, name='Salt')
+        for price in ('2.00', '4.50', '12.00'):
+            recipe = Recipe.objects.create(user=user, title='Soup',
+                                           time_minutes=10, price=price)
+            recipe.tags.add(vegan)
+        recipe.ingredients.add(salt)
+
+        apps = self.migrate(self.after)
+
+        stats = apps.get_model('core', 'RecipeStats').objects.get(
+            user_id=user.pk
+        )
+        self.assertEqual(stats.recipe_count, 3)
+        self.assertEqual(stats.time_minutes_total, 30)
+        self.assertEqual(stats.price_total, Decimal('18.50'))
+        self.assertEqual(
+            dict(apps.get_model('core', 'RecipePriceBucket').objects.filter(
+                user_id=user.pk
+            ).values_list('bucket', 'recipe_count')),
+            {0: 2, 2: 1}
+        )
+        self.assertEqual(
+            dict(apps.get_model('core', 'Tag').objects.values_list(
+                'name', 'recipe_count'
+            )),
+            {'Vegan': 3, 'Unused': 0}
+        )
+        self.assertEqual(apps.get_model('core', 'Ingredient').objects.get(
+            pk=salt.pk
+        ).recipe_count, 1)
@@ -0,0 +1,185 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import querystats
+from core.middleware import QueryStatsMiddleware
+from core.models import QueryPlan, QueryStat, Tag
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class NormalizeTests(TestCase):
+    """Test: the fingerprints of queries"""
+
+    def test_normalize_values(self):
+        """Test: literals and IN lists are collapsed"""
+        self.assertEqual(
+            querystats.normalize(
+                "SELECT *  FROM core_tag\n WHERE name = 'it''s' "
+                "AND id IN (%s, %s, %s) LIMIT 21"
+            ),
+            'SELECT * FROM core_tag WHERE name = ? AND id IN (...) LIMIT ?'
+        )
+
+    def test_same_fingerprint(self):
+        """Test: the same query with other values has the same fingerprint"""
+        first, second = (
+            querystats.fingerprint(querystats.normalize(
+                f'SELECT * FROM core_tag WHERE id IN ({params})'
+            ))
+            for params in ('%s', '%s, %s')
+        )
+
+        self.assertEqual(first, second)
+
+    def test_bucket_for(self):
+        """Test: durations fall in the range of their upper bound"""
+        self.assertEqual(querystats.bucket_for(0.3), 0)
+        self.assertEqual(querystats.bucket_for(1), 0)
+        self.assertEqual(querystats.bucket_for(7), 3)
+        self.assertEqual(querystats.bucket_for(10 ** 6),
+                         len(querystats.BUCKETS_MS) - 1)
+
+
+@override_settings(QUERY_STATS_ENABLED=True, QUERY_STATS_FLUSH_SECONDS=0)
+class QueryStatsMiddlewareTests(TestCase):
+    """Test: recording the queries of requests"""
+
+    def setUp(self):
+        # A fresh collector: nothing pending or explained by other tests.
+        collector = querystats.Collector()
+        for target in ('core.querystats.collector',
+                       'core.middleware.collector'):
+            patcher = patch(target, collector)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.user = get_user_model().objects.create_user('test@shevo.com',
+                                                         'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_disabled_by_default(self):
+        """Test: the middleware leaves the stack unless enabled"""
+        with override_settings(QUERY_STATS_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                QueryStatsMiddleware(lambda request: HttpResponse())
+
+    @override_settings(QUERY_STATS_EXPLAIN_MS=10 ** 6)
+    def test_record_request(self):
+        """Test: the queries of a request are counted per view"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(RECIPES_URL)
+        self.client.get(RECIPES_URL)
+
+        stats = QueryStat.objects.filter(view='GET recipe:recipe-list')
+        self.assertTrue(stats.exists())
+        query = stats.filter(sql__contains='FROM "core_recipe"').first()
+        self.assertEqual(sum(stats.filter(
+            fingerprint=query.fingerprint
+        ).values_list('calls', flat=True)), 2)
+        self.assertFalse(QueryPlan.objects.exists())
+
+    @override_settings(QUERY_STATS_EXPLAIN_MS=0)
+    def test_capture_plans(self):
+        """Test: the plans of slow SELECTs are captured once per interval"""
+        self.client.get(RECIPES_URL)
+        self.client.get(RECIPES_URL)
+
+        plans = QueryPlan.objects.filter(view='GET recipe:recipe-list')
+        self.assertTrue(plans.exists())
+        self.assertEqual(plans.count(),
+                         plans.values('fingerprint').distinct().count())
+        for plan in plans:
+            self.assertTrue(plan.sql.lstrip().upper().startswith('SELECT'))
+            self.assertNotIn('EXPLAIN failed', plan.plan)
+
+    @override_settings(QUERY_STATS_EXPLAIN_MS=0)
+    def test_capture_plan_keeps_rows(self):
+        """Test: explaining a query doesn't consume its rows"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        recorder = querystats.QueryRecorder('default', lambda: 'test')
+
+        with connection.execute_wrapper(recorder):
+            names = list(Tag.objects.values_list('name', flat=True))
+
+        self.assertEqual(names, ['Vegan'])
+        querystats.collector.flush(force=True)
+        self.assertTrue(QueryPlan.objects.filter(view='test').exists())
+
+    def test_flush_interval(self):
+        """Test: the counts are kept in memory until it's time to flush"""
+        with override_settings(QUERY_STATS_FLUSH_SECONDS=3600):
+            self.client.get(RECIPES_URL)
+        self.assertFalse(QueryStat.objects.exists())
+
+        querystats.collector.flush(force=True)
+        self.assertTrue(QueryStat.objects.exists())
+
+    def test_flush_failure(self):
+        """Test: a failed flush neither fails the request nor loses counts"""
+        with patch.object(querystats.QueryStat.objects, 'filter',
+                          side_effect=DatabaseError('locked')), \
+                self.assertLogs('core.middleware', 'ERROR'):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, 200)
+        self.assertFalse(QueryStat.objects.exists())
+
+        querystats.collector.flush(force=True)
+        self.assertTrue(QueryStat.objects.filter(
+            view='GET recipe:recipe-list'
+        ).exists())
+
+
+class QueryReportTests(TestCase):
+    """Test: the query_report command"""
+
+    def setUp(self):
+        for bucket, calls in ((0, 90), (6, 10)):
+            QueryStat.objects.create(fingerprint='a', view='GET tags',
+                                     bucket=bucket, sql='SELECT a',
+                                     calls=calls, total_ms=calls * 50)
+        QueryStat.objects.create(fingerprint='b', view='GET tags', bucket=2,
+                                 sql='SELECT b', calls=1000, total_ms=3000)
+        QueryPlan.objects.create(fingerprint='a', view='GET tags',
+                                 sql='SELECT a', duration_ms=80,
+                                 plan='Seq Scan on core_tag')
+
+    def report(self, *args):
+        out = StringIO()
+        call_command('query_report', *args, stdout=out)
+        return out.getvalue()
+
+    def test_report(self):
+        """Test: queries are ranked, with their p95 and plans"""
+        out = self.report('--plans')
+
+        self.assertLess(out.index('SELECT a'), out.index('SELECT b'))
+        self.assertIn('5000.0 ms total, 100 calls, 50.00 ms avg, '
+                      'p95 <= 100 ms  GET tags', out)
+        self.assertIn('Seq Scan on core_tag', out)
+
+    def test_order_by_calls(self):
+        """Test: --order calls ranks the most frequent queries first"""
+        out = self.report('--order', 'calls', '--top', '1')
+
+        self.assertIn('SELECT b', out)
+        self.assertNotIn('SELECT a', out)
+
+    def test_reset(self):
+        """Test: --reset deletes the statistics and plans"""
+        self.report('--reset')
+
+        self.assertFalse(QueryStat.objects.exists())
+        self.assertFalse(QueryPlan.objects.exists())
@@ -0,0 +1,98 @@
+import io
+import json
+from decimal import Decimal
+from io import StringIO
+
+import msgpack
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+from core.parsers import MessagePackParser
+from core.renderers import MessagePackRenderer
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+MSGPACK = 'application/msgpack'
+
+
+class MessagePackTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@shevo.com',
+            'testing321'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_decimal_survives_exactly(self):
+        """Test: Decimal values are encoded without float rounding"""
+        body = MessagePackRenderer().render({'price': Decimal('0.10')})
+
+        self.assertEqual(msgpack.unpackb(body, raw=False), {'price': '0.10'})
+
+    def test_parse_error(self):
+        """Test: invalid bodies raise a ParseError (400)"""
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(io.BytesIO(b'\xc1'))
+
+    def test_list_recipes_round_trips_with_json(self):
+        """Test: the MessagePack and JSON forms hold the same data"""
+        recipe = Recipe.objects.create(user=self.user, title='Soup',
+                                       time_minutes=10,
+                                       price=Decimal('12.34'))
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+
+        res_json = self.client.get(RECIPES_URL)
+        res_msgpack = self.client.get(RECIPES_URL, HTTP_ACCEPT=MSGPACK)
+
+        self.assertEqual(res_msgpack['Content-Type'], MSGPACK)
+        self.assertEqual(msgpack.unpackb(res_msgpack.content, raw=False),
+                         json.loads(res_json.content))
+
+    def test_create_recipe_msgpack(self):
+        """Test: creating a recipe from a MessagePack body"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        payload = {
+            'title': 'Mint cake',
+            'tags': [tag.id],
+            'ingredients': [],
+            'time_minutes': 60,
+            'price': '5.55'
+        }
+        res = self.client.post(RECIPES_URL, msgpack.packb(payload),
+                               content_type=MSGPACK, HTTP_ACCEPT=MSGPACK)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        data = msgpack.unpackb(res.content, raw=False)
+        recipe = Recipe.objects.get(id=data['id'])
+        self.assertEqual(recipe.price, Decimal('5.55'))
+        self.assertEqual(data['price'], '5.55')
+
+    def test_token_msgpack(self):
+        """Test: the token endpoint speaks MessagePack too"""
+        res = APIClient().post(
+            reverse('user:token'),
+            msgpack.packb({'email': 'test@shevo.com',
+                           'password': 'testing321'}),
+            content_type=MSGPACK,
+            HTTP_ACCEPT=MSGPACK
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('token', msgpack.unpackb(res.content, raw=False))
+
+    def test_bench_serialization(self):
+        """Test: the serialization benchmark runs"""
+        out = StringIO()
+        call_command('bench_serialization', '--recipes', '10',
+                     '--rounds', '1', stdout=out)
+
+        self.assertIn('msgpack', out.getvalue())
@@ -0,0 +1,102 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from core.models import Ingredient, Recipe, RecipePriceBucket, RecipeStats, \
+                        Tag
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00')
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeRollupTests(TestCase):
+    """Test: the recipe rollups follow the recipe changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            'test@shevo.com',
+            'testing321'
+        )
+
+    def stats(self):
+        return RecipeStats.objects.get(user=self.user)
+
+    def buckets(self):
+        return dict(RecipePriceBucket.objects.filter(
+            user=self.user
+        ).values_list('bucket', 'recipe_count'))
+
+    def test_create_recipe(self):
+        """Test: creating recipes adds them to the rollups"""
+        sample_recipe(self.user, time_minutes=10, price=Decimal('4.50'))
+        sample_recipe(self.user, time_minutes=20, price=Decimal('12.00'))
+
+        stats = self.stats()
+        self.assertEqual(stats.recipe_count, 2)
+        self.assertEqual(stats.time_minutes_total, 30)
+        self.assertEqual(stats.price_total, Decimal('16.50'))
+        self.assertEqual(self.buckets(), {0: 1, 2: 1})
+
+    def test_update_recipe(self):
+        """Test: updating a recipe applies the difference"""
+        recipe = sample_recipe(self.user, time_minutes=10,
+                               price=Decimal('4.50'))
+        recipe.time_minutes = 25
+        recipe.price = Decimal('7.00')
+        recipe.save()
+
+        stats = self.stats()
+        self.assertEqual(stats.recipe_count, 1)
+        self.assertEqual(stats.time_minutes_total, 25)
+        self.assertEqual(stats.price_total, Decimal('7.00'))
+        self.assertEqual(self.buckets(), {0: 0, 1: 1})
+
+    def test_delete_recipe(self):
+        """Test: deleting a recipe removes it from the rollups"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(tag)
+        recipe.delete()
+
+        tag.refresh_from_db()
+        self.assertEqual(self.stats().recipe_count, 0)
+        self.assertEqual(self.stats().price_total, 0)
+        self.assertEqual(tag.recipe_count, 0)
+
+    def test_tag_and_ingredient_counts(self):
+        """Test: linking and unlinking updates recipe_count"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        other = Tag.objects.create(user=self.user, name='Dessert')
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        recipe = sample_recipe(self.user)
+        recipe2 = sample_recipe(self.user)
+
+        recipe.tags.add(tag, other)
+        recipe.tags.add(tag)  # Already linked, not counted twice.
+        tag.recipe_set.add(recipe2)  # Reverse side.
+        recipe.ingredients.add(ingredient)
+        recipe.tags.remove(other, other)
+        recipe2.tags.remove(other)  # Not linked, not counted.
+
+        tag.refresh_from_db()
+        other.refresh_from_db()
+        ingredient.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 2)
+        self.assertEqual(other.recipe_count, 0)
+        self.assertEqual(ingredient.recipe_count, 1)
+
+        recipe.tags.clear()
+        tag.recipe_set.clear()
+        tag.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 0)
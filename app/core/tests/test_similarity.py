@@ -0,0 +1,140 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+
+from core import similarity
+from core.models import Ingredient, Recipe, RecipeVector, Tag
+
+
+def features(recipe):
+    return RecipeVector.objects.get(recipe=recipe).features
+
+
+class RecipeVectorTests(TestCase):
+    """Test: the recipe vectors follow the tag/ingredient links"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('test@shevo.com',
+                                                        'testing321')
+        cls.vegan = Tag.objects.create(user=cls.user, name='Vegan')
+        cls.salt = Ingredient.objects.create(user=cls.user, name='Salt')
+
+    def setUp(self):
+        self.recipe = Recipe.objects.create(user=self.user, title='Soup',
+                                            time_minutes=5, price=5)
+
+    def test_add_links(self):
+        """Test: adding tags and ingredients updates the vector"""
+        self.recipe.tags.add(self.vegan)
+        self.recipe.ingredients.add(self.salt)
+
+        self.assertEqual(
+            features(self.recipe),
+            ' '.join(map(str, sorted([2 * self.vegan.pk,
+                                      2 * self.salt.pk + 1])))
+        )
+
+    def test_remove_links(self):
+        """Test: removing links, from either side, updates the vector"""
+        self.recipe.tags.add(self.vegan)
+        self.vegan.recipe_set.remove(self.recipe)
+
+        self.assertEqual(features(self.recipe), '')
+
+    def test_set_links(self):
+        """Test: Recipe.set_links updates the vector"""
+        self.recipe.set_links('ingredients', [self.salt.pk])
+
+        self.assertEqual(features(self.recipe), str(2 * self.salt.pk + 1))
+
+    def test_delete_tag(self):
+        """Test: deleting a tag removes it from the vectors"""
+        tag = Tag.objects.create(user=self.user, name='Quick')
+        self.recipe.tags.add(tag, self.vegan)
+
+        tag.delete()
+
+        self.assertEqual(features(self.recipe), str(2 * self.vegan.pk))
+
+
+class SimilarRecipesTests(TestCase):
+    """Test: the recipes with the most links in common are found"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('test@shevo.com',
+                                                        'testing321')
+        cls.tags = [Tag.objects.create(user=cls.user, name=name)
+                    for name in ('Vegan', 'Quick', 'Dinner')]
+
+    def setUp(self):
+        cache.clear()
+
+    def recipe(self, *tags, user=None):
+        recipe = Recipe.objects.create(user=user or self.user, title='Soup',
+                                       time_minutes=5, price=5)
+        recipe.tags.add(*tags)
+        return recipe
+
+    def test_jaccard(self):
+        """Test: the results are sorted by Jaccard similarity"""
+        vegan, quick, dinner = self.tags
+        recipe = self.recipe(vegan, quick)
+        same = self.recipe(vegan, quick)
+        close = self.recipe(vegan, quick, dinner)
+        far = self.recipe(vegan, dinner)
+        self.recipe(dinner)
+
+        results = similarity.similar_recipes(recipe, 10)
+
+        self.assertEqual([recipe_id for recipe_id, _ in results],
+                         [same.pk, close.pk, far.pk])
+        for (_, score), expected in zip(results, (1, 2 / 3, 1 / 3)):
+            self.assertAlmostEqual(score, expected, places=5)
+
+    def test_cosine(self):
+        """Test: the cosine metric scores by the sizes' geometric mean"""
+        vegan, quick, dinner = self.tags
+        recipe = self.recipe(vegan, quick)
+        close = self.recipe(vegan, quick, dinner)
+
+        (recipe_id, score), = similarity.similar_recipes(recipe, 10,
+                                                         'cosine')
+
+        self.assertEqual(recipe_id, close.pk)
+        self.assertAlmostEqual(score, 2 / 6 ** 0.5, places=5)
+
+    def test_top_k(self):
+        """Test: only the k best are returned"""
+        vegan, quick, dinner = self.tags
+        recipe = self.recipe(vegan, quick)
+        best = self.recipe(vegan, quick)
+        self.recipe(vegan)
+        self.recipe(quick, dinner)
+
+        self.assertEqual(similarity.similar_recipes(recipe, 1),
+                         [(best.pk, 1.0)])
+
+    def test_other_users(self):
+        """Test: the recipes of other users aren't compared"""
+        other = get_user_model().objects.create_user('other@shevo.com',
+                                                     'testing321')
+        tag = Tag.objects.create(user=other, name='Vegan')
+        recipe = self.recipe(self.tags[0])
+        self.recipe(tag, user=other)
+
+        self.assertEqual(similarity.similar_recipes(recipe, 10), [])
+
+    def test_changes_invalidate_cache(self):
+        """Test: changing a link gives new results at once"""
+        vegan, quick, dinner = self.tags
+        recipe = self.recipe(vegan)
+        first = self.recipe(vegan)
+        self.assertEqual(similarity.similar_recipes(recipe, 10),
+                         [(first.pk, 1.0)])
+
+        second = self.recipe(vegan)
+
+        self.assertEqual(similarity.similar_recipes(recipe, 10),
+                         [(first.pk, 1.0), (second.pk, 1.0)])
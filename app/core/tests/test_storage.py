@@ -0,0 +1,243 @@
+import os
+import tempfile
+from datetime import datetime
+from io import StringIO
+from unittest.mock import MagicMock, sentinel
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from core.models import Recipe
+from core.storage import InMemoryStorage, S3Storage
+
+
+class ClientError(Exception):
+    """botocore's ClientError, as the S3 client raises it"""
+
+    def __init__(self, code, status=400):
+        self.response = {'Error': {'Code': code, 'Message': code},
+                         'ResponseMetadata': {'HTTPStatusCode': status}}
+
+
+def s3_storage(**kwargs):
+    """An S3Storage with a mock S3 client"""
+    storage = S3Storage(bucket='recipes', **kwargs)
+    storage.client = MagicMock()
+    storage.client.exceptions.ClientError = ClientError
+    storage.transfer_config = sentinel.transfer_config
+    return storage
+
+
+class InMemoryStorageTests(TestCase):
+    """Test: the storage of the tests"""
+
+    def test_save_open_delete(self):
+        """Test: files are kept in memory"""
+        storage = InMemoryStorage()
+
+        name = storage.save('uploads/recipe/a.jpg', ContentFile(b'abc'))
+
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(storage.size(name), 3)
+        with storage.open(name) as f:
+            self.assertEqual(f.read(), b'abc')
+        self.assertEqual(storage.url(name), '/media/uploads/recipe/a.jpg')
+        self.assertEqual(storage.listdir('uploads'), (['recipe'], []))
+        self.assertEqual(storage.listdir('uploads/recipe'), ([], ['a.jpg']))
+        storage.delete(name)
+        self.assertFalse(storage.exists(name))
+
+    def test_available_name(self):
+        """Test: an existing name isn't overwritten"""
+        storage = InMemoryStorage()
+        first = storage.save('a.jpg', ContentFile(b'1'))
+
+        second = storage.save('a.jpg', ContentFile(b'2'))
+
+        self.assertNotEqual(first, second)
+
+
+class S3StorageTests(TestCase):
+    """Test: the S3-compatible storage (with a mock client)"""
+
+    def test_save(self):
+        """Test: files are uploaded with their type, as immutable"""
+        storage = s3_storage()
+        storage.client.head_object.side_effect = ClientError('404')
+
+        name = storage.save('uploads/recipe/a.png', ContentFile(b'png'))
+
+        self.assertEqual(name, 'uploads/recipe/a.png')
+        args, kwargs = storage.client.upload_fileobj.call_args
+        self.assertEqual(args[1:], ('recipes', 'uploads/recipe/a.png'))
+        self.assertEqual(kwargs['ExtraArgs']['ContentType'], 'image/png')
+        self.assertIn('immutable', kwargs['ExtraArgs']['CacheControl'])
+        self.assertIs(kwargs['Config'], sentinel.transfer_config)
+
+    def test_exists(self):
+        """Test: a missing object doesn't exist, other errors raise"""
+        storage = s3_storage()
+        self.assertTrue(storage.exists('a.jpg'))
+
+        storage.client.head_object.side_effect = ClientError('404')
+        self.assertFalse(storage.exists('a.jpg'))
+
+        storage.client.head_object.side_effect = ClientError('403')
+        with self.assertRaises(ClientError):
+            storage.exists('a.jpg')
+
+    def test_open(self):
+        """Test: files are downloaded to a seekable file"""
+        storage = s3_storage()
+        storage.client.download_fileobj.side_effect = \
+            lambda bucket, key, body, Config: body.write(b'abc')
+
+        with storage.open('a.jpg') as f:
+            self.assertEqual(f.read(), b'abc')
+        with self.assertRaises(ValueError):
+            storage.open('a.jpg', 'wb')
+
+    def test_url(self):
+        """Test: private buckets get presigned URLs, public ones plain"""
+        storage = s3_storage()
+        storage.client.generate_presigned_url.return_value = 'https://signed'
+
+        self.assertEqual(storage.url('a b.jpg'), 'https://signed')
+        self.assertEqual(
+            s3_storage(public_url='https://cdn.example.com/media').url(
+                'a b.jpg'
+            ),
+            'https://cdn.example.com/media/a%20b.jpg'
+        )
+
+    def test_listdir(self):
+        """Test: listdir splits the objects and the "directories" """
+        storage = s3_storage()
+        storage.client.get_paginator.return_value.paginate.return_value = [{
+            'CommonPrefixes': [{'Prefix': 'uploads/recipe/'}],
+            'Contents': [{'Key': 'uploads/a.jpg',
+                          'LastModified': datetime.now()}],
+        }]
+
+        self.assertEqual(storage.listdir('uploads'),
+                         (['recipe'], ['a.jpg']))
+
+    def test_presigned_post(self):
+        """Test: direct uploads are limited to the name, type and size"""
+        storage = s3_storage()
+
+        storage.presigned_post('uploads/recipe/a.jpg', 'image/jpeg', 100)
+
+        kwargs = storage.client.generate_presigned_post.call_args[1]
+        self.assertEqual(kwargs['Key'], 'uploads/recipe/a.jpg')
+        self.assertEqual(kwargs['Fields']['Content-Type'], 'image/jpeg')
+        self.assertIn(['content-length-range', 1, 100],
+                      kwargs['Conditions'])
+
+    @override_settings(S3_MULTIPART_CHUNK_SIZE=10)
+    def test_multipart_upload(self):
+        """Test: a URL is presigned for every part"""
+        storage = s3_storage()
+        storage.client.create_multipart_upload.return_value = {
+            'UploadId': 'up'
+        }
+
+        upload_id, urls = storage.create_multipart_upload('a.jpg',
+                                                          'image/jpeg', 25)
+        storage.complete_multipart_upload('a.jpg', upload_id,
+                                          [(2, 'e2'), (1, 'e1')])
+
+        self.assertEqual(upload_id, 'up')
+        self.assertEqual(len(urls), 3)
+        kwargs = storage.client.complete_multipart_upload.call_args[1]
+        self.assertEqual(kwargs['MultipartUpload']['Parts'],
+                         [{'PartNumber': 1, 'ETag': 'e1'},
+                          {'PartNumber': 2, 'ETag': 'e2'}])
+
+    def test_multipart_upload_rejected(self):
+        """Test: parts refused by the bucket raise ValueError"""
+        storage = s3_storage()
+        storage.client.complete_multipart_upload.side_effect = \
+            ClientError('InvalidPart')
+        with self.assertRaisesMessage(ValueError, 'InvalidPart'):
+            storage.complete_multipart_upload('a.jpg', 'up', [(1, 'bad')])
+
+        # Errors of the bucket itself aren't the client's fault.
+        storage.client.complete_multipart_upload.side_effect = \
+            ClientError('InternalError', status=500)
+        with self.assertRaises(ClientError):
+            storage.complete_multipart_upload('a.jpg', 'up', [(1, 'e1')])
+
+    def test_multipart_upload_size(self):
+        """Test: the parts uploaded so far are summed"""
+        storage = s3_storage()
+        storage.client.get_paginator.return_value.paginate.return_value = [
+            {'Parts': [{'Size': 50}, {'Size': 50}]}, {'Parts': [{'Size': 7}]}
+        ]
+
+        self.assertEqual(storage.multipart_upload_size('a.jpg', 'up'), 107)
+
+    def test_abort_multipart_upload_twice(self):
+        """Test: aborting an upload that's already gone is a no-op"""
+        storage = s3_storage()
+        storage.client.abort_multipart_upload.side_effect = \
+            ClientError('NoSuchUpload', status=404)
+
+        storage.abort_multipart_upload('a.jpg', 'up')
+
+
+class CopyMediaTests(TestCase):
+    """Test: the copy_media command"""
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.settings = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+        user = get_user_model().objects.create_user('test@shevo.com', 'pw')
+        for name in ('uploads/recipe/a.jpg', 'uploads/recipe/b.jpg',
+                     'uploads/recipe/gone.jpg'):
+            Recipe.objects.create(user=user, title='Curry', time_minutes=10,
+                                  price=5, image=name)
+        os.makedirs(os.path.join(self.media_root.name, 'uploads/recipe'))
+        for name in ('a.jpg', 'b.jpg'):
+            path = os.path.join(self.media_root.name, 'uploads/recipe', name)
+            with open(path, 'wb') as f:
+                f.write(name.encode())
+        default_storage.save('uploads/recipe/b.jpg', ContentFile(b'old'))
+        self.addCleanup(default_storage.delete, 'uploads/recipe/a.jpg')
+        self.addCleanup(default_storage.delete, 'uploads/recipe/b.jpg')
+
+    def copy_media(self, *args):
+        out = StringIO()
+        call_command('copy_media', *args, stdout=out)
+        return out.getvalue()
+
+    def test_copy_media(self):
+        """Test: the missing files are copied to the default storage"""
+        out = self.copy_media()
+
+        self.assertIn('1 files copied, 1 already there, 1 missing.', out)
+        with default_storage.open('uploads/recipe/a.jpg') as f:
+            self.assertEqual(f.read(), b'a.jpg')
+        with default_storage.open('uploads/recipe/b.jpg') as f:
+            self.assertEqual(f.read(), b'old')
+
+    def test_overwrite(self):
+        """Test: --overwrite copies the files the target has too"""
+        out = self.copy_media('--overwrite')
+
+        self.assertIn('2 files copied', out)
+        with default_storage.open('uploads/recipe/b.jpg') as f:
+            self.assertEqual(f.read(), b'b.jpg')
+
+    def test_same_storage(self):
+        """Test: copying a storage to itself fails"""
+        with self.assertRaises(CommandError):
+            self.copy_media('--source', 'core.storage.InMemoryStorage')
@@ -0,0 +1,137 @@
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.throttling import SlidingWindowThrottle, parse_rate
+
+
+TOKEN_URL = reverse('user:token')
+TAGS_URL = reverse('recipe:tag-list')
+
+# The start of a minute, in seconds since the epoch.
+MINUTE = 60 * 1000000
+
+
+def rates(**scopes):
+    """Return REST_FRAMEWORK settings with the given throttle rates"""
+    return dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=scopes)
+
+
+class ThrottlingTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        caches[settings.THROTTLE_CACHE].clear()
+
+    def tearDown(self):
+        # Don't throttle the other tests.
+        caches[settings.THROTTLE_CACHE].clear()
+
+    def test_parse_rate(self):
+        """Test: parsing DRF rates"""
+        self.assertEqual(parse_rate('10/min'), (10, 60))
+        self.assertEqual(parse_rate('5/hour'), (5, 3600))
+        self.assertEqual(parse_rate('1/s'), (1, 1))
+
+    @patch('time.time', return_value=MINUTE + 15)
+    @override_settings(REST_FRAMEWORK=rates(login='2/min'))
+    def test_login_throttled(self, mock_time):
+        """Test: too many login attempts get a 429 with Retry-After"""
+        payload = {'email': 'test@shevo.com', 'password': 'wrong'}
+        for _ in range(2):
+            res = self.client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # 45s until the next minute, then 30s until the 2 requests of this
+        # minute weigh 1 (half of the window): 75s.
+        self.assertEqual(res['Retry-After'], '75')
+
+    @patch('time.time')
+    @override_settings(REST_FRAMEWORK=rates(read='2/min'))
+    def test_sliding_window(self, mock_time):
+        """Test: the previous window counts in proportion to its overlap"""
+        user = get_user_model().objects.create_user('test@shevo.com', 'pw')
+        self.client.force_authenticate(user)
+
+        mock_time.return_value = MINUTE + 50
+        for _ in range(2):
+            self.assertEqual(self.client.get(TAGS_URL).status_code, 200)
+
+        # 15s into the next minute the 2 requests still weigh 1.5.
+        mock_time.return_value = MINUTE + 75
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '15')
+
+        mock_time.return_value = MINUTE + 90
+        self.assertEqual(self.client.get(TAGS_URL).status_code, 200)
+
+    @override_settings(REST_FRAMEWORK=rates(login='1/min'))
+    def test_spoofed_forwarded_for(self):
+        """Test: a client can't reset its window with X-Forwarded-For"""
+        payload = {'email': 'test@shevo.com', 'password': 'wrong'}
+        self.client.post(TOKEN_URL, payload, HTTP_X_FORWARDED_FOR='1.1.1.1')
+
+        res = self.client.post(TOKEN_URL, payload,
+                               HTTP_X_FORWARDED_FOR='2.2.2.2')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(REST_FRAMEWORK=dict(rates(login='1/min'),
+                                           NUM_PROXIES=1))
+    def test_forwarded_for_behind_proxy(self):
+        """Test: behind a proxy, the address it appended identifies clients"""
+        payload = {'email': 'test@shevo.com', 'password': 'wrong'}
+        self.client.post(TOKEN_URL, payload,
+                         HTTP_X_FORWARDED_FOR='1.1.1.1, 10.0.0.1')
+
+        res = self.client.post(TOKEN_URL, payload,
+                               HTTP_X_FORWARDED_FOR='2.2.2.2, 10.0.0.1')
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        res = self.client.post(TOKEN_URL, payload,
+                               HTTP_X_FORWARDED_FOR='10.0.0.2')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(REST_FRAMEWORK=rates(read='0/min'))
+    def test_zero_rate(self):
+        """Test: a 0/min rate rejects every request, without Retry-After"""
+        user = get_user_model().objects.create_user('test@shevo.com', 'pw')
+        self.client.force_authenticate(user)
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertNotIn('Retry-After', res)
+
+    def test_wait_without_previous_window(self):
+        """Test: no previous requests to wait for, when counts raced"""
+        throttle = SlidingWindowThrottle()
+
+        self.assertEqual(throttle._wait(5, 60, 10, 0, 2), 0)
+
+    @override_settings(REST_FRAMEWORK=rates(read='1/min', write='1/min'))
+    def test_read_and_write_scopes(self):
+        """Test: reads and writes have separate limits per user"""
+        user = get_user_model().objects.create_user('test@shevo.com', 'pw')
+        other = get_user_model().objects.create_user('other@shevo.com', 'pw')
+        self.client.force_authenticate(user)
+
+        self.assertEqual(self.client.get(TAGS_URL).status_code, 200)
+        self.assertEqual(self.client.get(TAGS_URL).status_code, 429)
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        # The limits are per user.
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(TAGS_URL).status_code, 200)
@@ -0,0 +1,203 @@
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.views import RangeNotSatisfiable, parse_range
+
+
+def media_url(path):
+    """Return the URL for a media file"""
+    return reverse('media', args=[path])
+
+
+class ParseRangeTests(TestCase):
+
+    def test_parse_range(self):
+        """Test: parsing single byte range headers"""
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=50-500', 100), (50, 99))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range(None, 100))
+
+    def test_parse_range_malformed(self):
+        """Test: malformed headers are ignored"""
+        for header in ('bytes=-', 'bytes=abc', 'items=0-9', 'bytes=9-2'):
+            self.assertIsNone(parse_range(header, 100))
+
+    def test_parse_range_not_satisfiable(self):
+        """Test: ranges out of the file raise RangeNotSatisfiable"""
+        for header, size in (('bytes=200-', 100), ('bytes=100-150', 100),
+                             ('bytes=-0', 100), ('bytes=-10', 0)):
+            with self.assertRaises(RangeNotSatisfiable):
+                parse_range(header, size)
+
+
+class ServeMediaTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root
+        )
+        self.settings_override.enable()
+        os.makedirs(os.path.join(self.media_root, 'uploads/recipe'))
+        self.path = 'uploads/recipe/test.jpg'
+        with open(os.path.join(self.media_root, self.path), 'wb') as f:
+            f.write(b'0123456789')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_serve_full_file(self):
+        """Test: serving a file with long-lived cache headers"""
+        res = self.client.get(media_url(self.path))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), b'0123456789')
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', res['Cache-Control'])
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_serve_range(self):
+        """Test: serving part of a file"""
+        res = self.client.get(media_url(self.path), HTTP_RANGE='bytes=2-5')
+
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b''.join(res.streaming_content), b'2345')
+        self.assertEqual(res['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(res['Content-Length'], '4')
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_serve_range_not_satisfiable(self):
+        """Test: a range starting after the end of the file gets a 416"""
+        res = self.client.get(media_url(self.path), HTTP_RANGE='bytes=10-')
+
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res['Content-Range'], 'bytes */10')
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_serve_malformed_range(self):
+        """Test: a malformed range gets the whole file"""
+        res = self.client.get(media_url(self.path), HTTP_RANGE='bytes=5-2')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), b'0123456789')
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_not_modified(self):
+        """Test: conditional requests get a 304"""
+        res = self.client.get(media_url(self.path))
+        res = self.client.get(
+            media_url(self.path),
+            HTTP_IF_MODIFIED_SINCE=res['Last-Modified']
+        )
+
+        self.assertEqual(res.status_code, 304)
+
+    @override_settings(MEDIA_SERVE_MODE='x-accel',
+                       MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_x_accel_redirect(self):
+        """Test: the file is handed off to nginx"""
+        res = self.client.get(media_url(self.path))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['X-Accel-Redirect'],
+                         '/protected-media/' + self.path)
+        self.assertEqual(res.content, b'')
+
+    @override_settings(MEDIA_SERVE_MODE='x-sendfile')
+    def test_x_sendfile(self):
+        """Test: the file is handed off with X-Sendfile"""
+        res = self.client.get(media_url(self.path))
+
+        self.assertEqual(res['X-Sendfile'],
+                         os.path.join(self.media_root, self.path))
+
+    def test_missing_file(self):
+        """Test: missing files and paths outside MEDIA_ROOT are rejected"""
+        res = self.client.get(media_url('uploads/recipe/nope.jpg'))
+        self.assertEqual(res.status_code, 404)
+
+        res = self.client.get(media_url('../../etc/passwd'))
+        self.assertEqual(res.status_code, 400)
+
+
+@override_settings(HEALTH_CHECK_CACHE_SECONDS=0)
+class HealthCheckTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_liveness(self):
+        """Test: the liveness probe answers without touching the DB"""
+        with self.assertNumQueries(0):
+            res = self.client.get('/healthz')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), {'status': 'ok'})
+
+    def test_readiness(self):
+        """Test: the readiness probe checks the dependencies"""
+        res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['checks'], {
+            'database': 'ok',
+            'cache:default': 'ok',
+            'cache:throttle': 'ok',
+            'media': 'ok'
+        })
+
+    def test_readiness_shared_cache_down(self):
+        """Test: not ready when the shared cache is down, without details"""
+        def check_cache(alias):
+            if alias == settings.THROTTLE_CACHE:
+                raise ConnectionError('memcached at 10.0.0.5:11211 is down')
+
+        with patch('core.middleware.check_cache', check_cache), \
+                self.assertLogs('core.middleware', 'WARNING') as logs:
+            res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['checks']['cache:throttle'], 'error')
+        self.assertEqual(res.json()['checks']['cache:default'], 'ok')
+        self.assertNotIn('10.0.0.5', res.content.decode())
+        self.assertIn('10.0.0.5', '\n'.join(logs.output))
+
+    def test_readiness_missing_media(self):
+        """Test: not ready when the media volume is missing"""
+        with override_settings(MEDIA_ROOT='/does/not/exist'), \
+                self.assertLogs('core.middleware', 'WARNING'):
+            res = self.client.get('/readyz')
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['status'], 'unavailable')
+        self.assertEqual(res.json()['checks']['media'], 'error')
+        self.assertNotIn('/does/not/exist', res.content.decode())
+
+    @patch('core.middleware.check_database')
+    def test_readiness_cached(self, check_database):
+        """Test: the checks run at most once per cache period"""
+        with override_settings(HEALTH_CHECK_CACHE_SECONDS=60):
+            self.client.get('/readyz')
+            self.client.get('/readyz')
+
+        self.assertEqual(check_database.call_count, 1)
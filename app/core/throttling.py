@@ -0,0 +1,120 @@
+"""
+Sliding-window rate limiting for the API.
+
+The counters live in the cache named by THROTTLE_CACHE: local memory in
+development and tests, memcached (shared by every worker and instance) in
+production. A request first takes its slot with cache.add()/incr(), which
+are atomic in memcached, and gives it back if it was over the limit, so
+concurrent requests can't both take the last slot.
+"""
+import time
+
+from django.core.cache import caches
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+def parse_rate(rate):
+    """Parse a DRF rate ('100/min', '5/hour', ...) into (requests, seconds)"""
+    num, period = rate.split('/')
+    return int(num), {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """Limit requests per scope with a sliding window counter"""
+    # The window is approximated with the counts of the current and the
+    # previous fixed windows, weighted by their overlap with the sliding
+    # one: two cache keys per client instead of a list of timestamps.
+
+    # Key of the rate in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].
+    scope = None
+
+    def get_scope(self, request, view):
+        return self.scope
+
+    def get_ident(self, request):
+        """Identify the client: its user id, or its IP when anonymous"""
+        if request.user and request.user.is_authenticated:
+            return f'user-{request.user.pk}'
+        return f'ip-{super().get_ident(request)}'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if scope is None or rate is None:
+            return True
+        limit, window = parse_rate(rate)
+        cache = caches[settings.THROTTLE_CACHE]
+
+        now = time.time()
+        current = int(now // window)
+        elapsed = now - current * window
+        key = f'throttle:{scope}:{self.get_ident(request)}:'
+        current_key = key + str(current)
+        previous_count = cache.get(key + str(current - 1), 0)
+
+        # The key outlives its window, as the next window still reads it.
+        if cache.add(current_key, 1, 2 * window):
+            current_count = 1
+        else:
+            try:
+                current_count = cache.incr(current_key)
+            except ValueError:
+                # Expired between add() and incr().
+                cache.add(current_key, 1, 2 * window)
+                current_count = 1
+
+        weight = 1 - elapsed / window
+        if previous_count * weight + current_count > limit:
+            try:
+                cache.decr(current_key)
+            except ValueError:
+                pass
+            self.wait_seconds = self._wait(limit, window, elapsed,
+                                           previous_count, current_count - 1)
+            return False
+        return True
+
+    def _wait(self, limit, window, elapsed, previous_count, current_count):
+        """Seconds until one more request fits in the window"""
+        if limit <= 0:
+            # A 0/min rate: no request ever fits.
+            return None
+        if current_count < limit:
+            if not previous_count:
+                # Only when racing requests counted at once: retry now.
+                return 0
+            # The previous window's weight must shrink enough.
+            weight = (limit - current_count - 1) / previous_count
+            return max((1 - weight) * window - elapsed, 0)
+        # Wait for the next window, then for the current count (which
+        # becomes the previous one) to weigh little enough.
+        weight = (limit - 1) / current_count
+        return (window - elapsed) + (1 - weight) * window
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+
+class LoginThrottle(SlidingWindowThrottle):
+    """Token creation: every attempt costs a password hash"""
+    scope = 'login'
+
+
+class SignupThrottle(SlidingWindowThrottle):
+    """User creation"""
+    scope = 'signup'
+
+
+class ImageUploadThrottle(SlidingWindowThrottle):
+    """Recipe image uploads"""
+    scope = 'upload'
+
+
+class ReadWriteThrottle(SlidingWindowThrottle):
+    """General API use: separate limits for reads and writes"""
+
+    def get_scope(self, request, view):
+        return 'read' if request.method in ('GET', 'HEAD', 'OPTIONS') \
+            else 'write'
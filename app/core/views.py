@@ -0,0 +1,145 @@
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.urls import reverse
+from django.http import FileResponse, Http404, HttpResponse, \
+                        HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+from rest_framework import generics, status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from core.models import Job
+from core.serializers import JobSerializer
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(ValueError):
+    """A valid byte range that doesn't overlap the file"""
+
+
+def parse_range(header, size):
+    """Return (start, end) for a single byte range header, or None"""
+    # Multiple ranges (f.e.: bytes=0-1,5-6) are answered with the full file,
+    # which is allowed by the RFC, and so are malformed headers. A range
+    # starting after the end of the file raises RangeNotSatisfiable (416).
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        # Suffix range: the last N bytes.
+        if int(end) == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    end = min(int(end), size - 1) if end else size - 1
+    return start, end
+
+
+def _read_range(fileobj, start, length, block_size=64 * 1024):
+    """Yield length bytes of fileobj starting at start"""
+    with fileobj:
+        fileobj.seek(start)
+        while length > 0:
+            chunk = fileobj.read(min(block_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve an uploaded media file without tying up the app process"""
+    path = posixpath.normpath(path).lstrip('/')
+    # Raises SuspiciousFileOperation (400) for paths outside MEDIA_ROOT.
+    fullpath = safe_join(settings.MEDIA_ROOT, path)
+    if not os.path.isfile(fullpath):
+        raise Http404(f'"{path}" does not exist')
+
+    mode = settings.MEDIA_SERVE_MODE
+    content_type = mimetypes.guess_type(fullpath)[0] or \
+        'application/octet-stream'
+
+    if mode in ('x-accel', 'x-sendfile'):
+        # The front server streams the file (and handles ranges and
+        # conditional requests), we only answer with a header.
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel':
+            response['X-Accel-Redirect'] = \
+                settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+        else:
+            response['X-Sendfile'] = fullpath
+    else:
+        statobj = os.stat(fullpath)
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                                  statobj.st_mtime, statobj.st_size):
+            return HttpResponseNotModified()
+
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'),
+                                     statobj.st_size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(
+                status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+            )
+            response['Content-Range'] = f'bytes */{statobj.st_size}'
+            response['Accept-Ranges'] = 'bytes'
+            return response
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _read_range(open(fullpath, 'rb'), start, end - start + 1),
+                status=206,
+                content_type=content_type
+            )
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = \
+                f'bytes {start}-{end}/{statobj.st_size}'
+        else:
+            # FileResponse lets the WSGI server use its file wrapper, which
+            # under gunicorn is a zero-copy os.sendfile().
+            response = FileResponse(open(fullpath, 'rb'),
+                                    content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+        response['Last-Modified'] = http_date(statobj.st_mtime)
+
+    # Uploaded files get a new uuid name, so a given URL never changes.
+    response['Cache-Control'] = \
+        f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable'
+    return response
+
+
+class JobStatusView(generics.RetrieveAPIView):
+    """Status of a job enqueued by the authenticated user"""
+    serializer_class = JobSerializer
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+
+
+def job_accepted(request, job, **data):
+    """Response to a request whose work was left to a job"""
+    return Response(
+        {'job': job.id,
+         'status_url': request.build_absolute_uri(
+             reverse('job-status', args=[job.id])
+         ),
+         **data},
+        status=status.HTTP_202_ACCEPTED
+    )
@@ -0,0 +1,57 @@
+"""
+Gunicorn configuration for the production serving mode.
+
+Every setting can be tuned through an environment variable, so the same
+image can be sized differently per host (see docker-compose.yml).
+"""
+import multiprocessing
+import os
+
+
+def _env_int(name, default):
+    """Read an integer from the environment, falling back to default"""
+    return int(os.environ.get(name, default))
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Two processes per core, plus one (gunicorn's recommended 2 * cores + 1),
+# so we are no longer capped at a single CPU like the development server:
+# while one process waits on I/O, the other keeps its core busy.
+workers = _env_int('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1)
+# Threads let a worker keep serving while another request waits on the DB.
+threads = _env_int('GUNICORN_THREADS', 4)
+worker_class = os.environ.get(
+    'GUNICORN_WORKER_CLASS',
+    'gthread' if threads > 1 else 'sync'
+)
+
+# Import the Django app once in the master and fork the workers from it.
+# Workers start faster and share the read-only memory pages.
+# Note: with preload, `kill -HUP` restarts the workers gracefully but does
+# not pick up new code; use `kill -USR2` + `kill -WINCH` for a code upgrade.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Recycle each worker after a number of requests to cap memory growth.
+# The jitter stops all the workers from restarting at the same time.
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+# Seconds a worker may stay silent before being killed and restarted.
+timeout = _env_int('GUNICORN_TIMEOUT', 30)
+# Seconds the workers get to finish in-flight requests on a reload/stop.
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+
+def post_fork(server, worker):
+    """Drop DB connections inherited from the master after a fork"""
+    # With preload_app the master may have opened a connection while
+    # importing the app; sharing that socket between processes is unsafe.
+    from django.db import connections
+    for conn in connections.all():
+        conn.close()
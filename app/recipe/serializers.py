@@ -1,9 +1,33 @@
+import re
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils.translation import ugettext_lazy as _
+
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 
 from core.models import Tag, Ingredient, Recipe
+from core.similarity import METRICS
+
+ID_RE = re.compile(r'^[0-9]+\Z')
+
 
+class UniqueNameMixin:
+    """Reject a name the user already has, whatever its case"""
 
-class TagSerializer(serializers.ModelSerializer):
+    def validate_name(self, value):
+        user = self.context['request'].user
+        if self.Meta.model.objects.filter(user=user,
+                                          name__iexact=value).exists():
+            raise serializers.ValidationError(
+                _('An object with this name already exists.')
+            )
+        return value
+
+
+class TagSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """Serializer for Tag objects"""
 
     class Meta:
@@ -12,7 +36,15 @@ class TagSerializer(serializers.ModelSerializer):
         raad_only_fields = ('id',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class TagCountSerializer(TagSerializer):
+    """Serializer for Tag objects with their number of recipes"""
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ('recipe_count',)
+        read_only_fields = ('id', 'recipe_count')
+
+
+class IngredientSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """Serializer for Ingredient object"""
 
     class Meta:
@@ -21,18 +53,94 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class IngredientCountSerializer(IngredientSerializer):
+    """Serializer for Ingredient objects with their number of recipes"""
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ('recipe_count',)
+        read_only_fields = ('id', 'recipe_count')
+
+
+class NamesSerializer(serializers.Serializer):
+    """Serializer for the names of tags/ingredients to get or create"""
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        allow_empty=False,
+        max_length=100
+    )
+
+
+class NamesOrPrimaryKeysField(serializers.ManyRelatedField):
+    """List of ids and names, with all the ids checked by one query"""
+    # ManyRelatedField runs one query per id.
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        values = [child.to_name_or_pk(item) for item in data]
+        pks = {value for value in values if not isinstance(value, str)}
+        if pks:
+            found = set(child.get_queryset().filter(
+                pk__in=pks
+            ).values_list('pk', flat=True))
+            for pk in sorted(pks - found):
+                child.fail('does_not_exist', pk_value=pk)
+        return values
+
+
+class NameOrPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Accept an id, or the name of an object to get or create"""
+    # Names are returned as is, RecipeSerializer resolves all of them
+    # at once. Digit-only strings are ids.
+    default_error_messages = {
+        'invalid_name': _('Names must have 1 to 255 characters.'),
+    }
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return NamesOrPrimaryKeysField(**list_kwargs)
+
+    def to_name_or_pk(self, data):
+        """Return the name, or the (unchecked) id, in data"""
+        # ASCII digits only: str.isdigit() is true for '²', which int()
+        # rejects.
+        if isinstance(data, str) and not ID_RE.match(data.strip()):
+            name = data.strip()
+            if not name or len(name) > 255:
+                self.fail('invalid_name')
+            return name
+        if isinstance(data, bool) or not isinstance(data, (int, str)):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        return int(data)
+
+    def to_internal_value(self, data):
+        value = self.to_name_or_pk(data)
+        if isinstance(value, str):
+            return value
+        return super().to_internal_value(value)
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Serializer for Recipe object"""
 
     # The ID's of the ingredients will be listed.
     # The detail (name) of the ingredient won't be shown.
     # (that will be taken care of later).
-    ingredients = serializers.PrimaryKeyRelatedField(
+    # Names are accepted too, missing ones are created.
+    ingredients = NameOrPrimaryKeyRelatedField(
         many=True,
         queryset=Ingredient.objects.all()
     )
 
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = NameOrPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
@@ -43,6 +151,41 @@ class RecipeSerializer(serializers.ModelSerializer):
                   'price', 'link')
         raad_only_fields = ('id',)  # So it can't be updated by the user.
 
+    def _pop_links(self, validated_data, recipe=None):
+        """Pop the tag/ingredient ids, creating the missing names"""
+        links = {}
+        for field in ('tags', 'ingredients'):
+            if field not in validated_data:
+                continue
+            values = validated_data.pop(field)
+            names = [value for value in values if isinstance(value, str)]
+            if names:
+                model = self.fields[field].child_relation.queryset.model
+                user = recipe.user if recipe else validated_data['user']
+                ids = model.objects.ids_for_names(user, names)
+                values = [ids[value] if isinstance(value, str) else value
+                          for value in values]
+            links[field] = values
+        return links
+
+    # The links are diffed by Recipe.set_links instead of the .set() of
+    # ModelSerializer, and a PATCH without tags/ingredients skips them.
+    def create(self, validated_data):
+        links = self._pop_links(validated_data)
+        with transaction.atomic():
+            recipe = super().create(validated_data)
+            for field, ids in links.items():
+                recipe.set_links(field, ids)
+        return recipe
+
+    def update(self, instance, validated_data):
+        links = self._pop_links(validated_data, instance)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            for field, ids in links.items():
+                instance.set_links(field, ids)
+        return instance
+
 
 # We are gonna re-use the RecipeSerializer:
 class RecipeDetailSerializer(RecipeSerializer):
@@ -60,3 +203,144 @@ class RecipeImageSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'image')
         read_only_fields = ('id',)
+
+
+class RecipeShareSerializer(serializers.Serializer):
+    """Serializer for sharing a recipe with another user"""
+    email = serializers.EmailField()
+
+
+class RecipeShareAcceptSerializer(serializers.Serializer):
+    """Serializer for accepting a recipe shared with the user"""
+    # Signed by the share action: the recipe can't be forged, and only the
+    # user with the e-mail it was shared with can accept it.
+    SALT = 'recipe-share'
+
+    token = serializers.CharField()
+
+    @classmethod
+    def sign(cls, recipe, email):
+        return signing.dumps(
+            {'recipe': recipe.pk, 'owner': recipe.user_id, 'email': email},
+            salt=cls.SALT
+        )
+
+    def validate_token(self, value):
+        try:
+            share = signing.loads(value, salt=self.SALT,
+                                  max_age=settings.RECIPE_SHARE_MAX_AGE)
+        except signing.BadSignature:
+            raise serializers.ValidationError(_('Invalid or expired share.'))
+        if share['email'].lower() != \
+                self.context['request'].user.email.lower():
+            raise serializers.ValidationError(_('Invalid or expired share.'))
+        return share
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Serializer for a list of recipe ids (to delete, to shop for)"""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=1000
+    )
+
+
+class RecipeUploadUrlSerializer(serializers.Serializer):
+    """Serializer for requesting a direct upload of a recipe image"""
+    content_type = serializers.CharField()
+    size = serializers.IntegerField(min_value=1)
+
+    def validate_content_type(self, value):
+        if value not in settings.MEDIA_UPLOAD_CONTENT_TYPES:
+            raise serializers.ValidationError(_('Unsupported image type.'))
+        return value
+
+    def validate_size(self, value):
+        if value > settings.MEDIA_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(_('The image is too large.'))
+        return value
+
+
+class UploadPartSerializer(serializers.Serializer):
+    """A part of a multipart upload, as the bucket acknowledged it"""
+    part_number = serializers.IntegerField(min_value=1)
+    etag = serializers.CharField()
+
+
+class RecipeUploadCompleteSerializer(serializers.Serializer):
+    """Serializer for finishing the direct upload of a recipe image"""
+    # Signed by the upload-url action: the file name and upload id can't
+    # be forged, nor used for another recipe.
+    SALT = 'recipe-image-upload'
+
+    upload = serializers.CharField()
+    parts = UploadPartSerializer(many=True, required=False)
+
+    @classmethod
+    def sign(cls, recipe, name, upload_id=None):
+        return signing.dumps(
+            {'recipe': recipe.pk, 'name': name, 'upload_id': upload_id},
+            salt=cls.SALT
+        )
+
+    def validate_upload(self, value):
+        try:
+            upload = signing.loads(value, salt=self.SALT,
+                                   max_age=settings.S3_URL_EXPIRY)
+        except signing.BadSignature:
+            raise serializers.ValidationError(_('Invalid or expired upload.'))
+        if upload['recipe'] != self.context['recipe'].pk:
+            raise serializers.ValidationError(_('Invalid or expired upload.'))
+        return upload
+
+    def validate(self, attrs):
+        if attrs['upload']['upload_id'] and not attrs.get('parts'):
+            raise serializers.ValidationError(
+                {'parts': _('The parts of the multipart upload are required.')}
+            )
+        return attrs
+
+
+class RecipeStatsQuerySerializer(serializers.Serializer):
+    """Query parameters of the recipe statistics"""
+    # Maximum number of most-used tags/ingredients that can be requested.
+    MAX_TOP = 50
+
+    top = serializers.IntegerField(min_value=0, max_value=MAX_TOP,
+                                   default=5)
+
+
+class RecipeListQuerySerializer(serializers.Serializer):
+    """Query parameters filtering and ordering the recipe list"""
+    # Each ordering has an index: see Recipe.Meta.
+    ORDERINGS = ('-id', 'id', 'time_minutes', '-time_minutes', 'price',
+                 '-price')
+
+    min_time_minutes = serializers.IntegerField(min_value=0, required=False)
+    max_time_minutes = serializers.IntegerField(min_value=0, required=False)
+    min_price = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                         min_value=0, required=False)
+    max_price = serializers.DecimalField(max_digits=5, decimal_places=2,
+                                         min_value=0, required=False)
+    ordering = serializers.ChoiceField(choices=ORDERINGS, default='-id')
+
+    def validate(self, attrs):
+        for field in ('time_minutes', 'price'):
+            low = attrs.get(f'min_{field}')
+            high = attrs.get(f'max_{field}')
+            if low is not None and high is not None and low > high:
+                raise serializers.ValidationError(
+                    {f'max_{field}': _('Must be at least min_%s.') % field}
+                )
+        return attrs
+
+
+class SimilarRecipesQuerySerializer(serializers.Serializer):
+    """Query parameters of the similar recipes"""
+    k = serializers.IntegerField(
+        min_value=1,
+        max_value=settings.SIMILAR_RECIPES_MAX,
+        default=settings.SIMILAR_RECIPES_DEFAULT
+    )
+    metric = serializers.ChoiceField(choices=METRICS, default='jaccard')
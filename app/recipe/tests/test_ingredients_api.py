@@ -10,6 +10,7 @@ from core.models import Ingredient, Recipe
 from recipe.serializers import IngredientSerializer
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+INGREDIENTS_BULK_URL = reverse('recipe:ingredient-bulk')
 
 
 class PublicIngredientsAPITest(TestCase):
@@ -28,12 +29,15 @@ class PublicIngredientsAPITest(TestCase):
 class PrivateIngredientsAPITests(TestCase):
     """Test: private ingredients API"""
 
-    def setUp(self):
-        self.client = APIClient()
-        self.user = get_user_model().objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
             'test@shevo.com',
             'testing321'
         )
+
+    def setUp(self):
+        self.client = APIClient()
         self.client.force_authenticate(self.user)
 
     def test_retrieve_ingredient_list(self):
@@ -138,3 +142,39 @@ class PrivateIngredientsAPITests(TestCase):
         res = self.client.get(INGREDIENTS_URL, {'assigned_only': 1})
 
         self.assertEqual(len(res.data), 1)
+
+    def test_retrieve_ingredients_with_counts(self):
+        """Test: listing ingredients with their number of recipes"""
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        unused = Ingredient.objects.create(user=self.user, name='Pepper')
+        for title in ('Soup', 'Stew'):
+            recipe = Recipe.objects.create(
+                title=title,
+                time_minutes=5,
+                price=5,
+                user=self.user
+            )
+            recipe.ingredients.add(ingredient)
+
+        # A single query, whatever the number of ingredients.
+        with self.assertNumQueries(1):
+            res = self.client.get(INGREDIENTS_URL, {'with_counts': 1})
+
+        self.assertEqual(res.data, [
+            {'id': ingredient.id, 'name': 'Salt', 'recipe_count': 2},
+            {'id': unused.id, 'name': 'Pepper', 'recipe_count': 0},
+        ])
+
+    def test_bulk_get_or_create_ingredients(self):
+        """Test: getting the ids of ingredients by name"""
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.post(INGREDIENTS_BULK_URL,
+                               {'names': ['SALT', 'Pepper']}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        pepper = Ingredient.objects.get(user=self.user, name='Pepper')
+        self.assertEqual(res.data, [
+            {'id': salt.id, 'name': 'SALT'},
+            {'id': pepper.id, 'name': 'Pepper'},
+        ])
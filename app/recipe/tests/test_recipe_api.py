@@ -1,21 +1,31 @@
+import json
 import tempfile
-import os
+from base64 import urlsafe_b64encode
+from unittest.mock import patch
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from core.models import Recipe, Tag, Ingredient
+from core.models import Job, OrphanedFile, Recipe, Tag, Ingredient
+from core.storage import InMemoryStorage
+from core.tests.test_storage import ClientError, s3_storage
 
-from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe.serializers import RecipeSerializer, RecipeDetailSerializer, \
+                               RecipeShareAcceptSerializer
 
 # The URL will end-up looking like: /api/recipe/recipes
 RECIPES_URL = reverse('recipe:recipe-list')  # app:urlId
+BULK_DELETE_URL = reverse('recipe:recipe-bulk-delete')
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
+ACCEPT_SHARE_URL = reverse('recipe:recipe-accept-share')
 
 
 def image_upload_url(recipe_id):
@@ -23,6 +33,31 @@ def image_upload_url(recipe_id):
     return reverse('recipe:recipe-upload-image', args=[recipe_id])
 
 
+def upload_url_url(recipe_id):
+    """Return URL for presigning a direct image upload"""
+    return reverse('recipe:recipe-upload-url', args=[recipe_id])
+
+
+def upload_complete_url(recipe_id):
+    """Return URL for finishing a direct image upload"""
+    return reverse('recipe:recipe-upload-complete', args=[recipe_id])
+
+
+def clone_url(recipe_id):
+    """Return recipe clone URL"""
+    return reverse('recipe:recipe-clone', args=[recipe_id])
+
+
+def share_url(recipe_id):
+    """Return recipe share URL"""
+    return reverse('recipe:recipe-share', args=[recipe_id])
+
+
+def similar_url(recipe_id):
+    """Return similar recipes URL"""
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
 # The URL will end-up looking like: /api/recipe/recipes/id
 def detail_url(recipe_id):
     """Return recipe detail URL"""
@@ -67,12 +102,15 @@ class PublicRecipeAPITests(TestCase):
 
 class PrivateRecipeAPITests(TestCase):
     """Test: authenticated recipe API access"""
-    def setUp(self):
-        self.client = APIClient()
-        self.user = get_user_model().objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
             'test@shevo.com',
             'testing321'
         )
+
+    def setUp(self):
+        self.client = APIClient()
         self.client.force_authenticate(self.user)
 
     def test_retrieve_recipes(self):
@@ -143,6 +181,22 @@ class PrivateRecipeAPITests(TestCase):
 
         self.assertEqual(res.data, serializer.data)
 
+    def test_list_recipes_query_count(self):
+        """Test: listing recipes doesn't run queries per recipe"""
+        tag = sample_tag(user=self.user)
+        ingredient = sample_ingredient(user=self.user)
+        for _ in range(3):
+            recipe = sample_recipe(user=self.user)
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+
+        # Recipes + prefetched tags + prefetched ingredients.
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 3)
+        self.assertEqual(res.data[0]['tags'], [tag.id])
+
     def test_create_basic_recipe(self):
         """Test: creating recipe"""
         payload = {
@@ -179,6 +233,36 @@ class PrivateRecipeAPITests(TestCase):
         self.assertIn(tag, tags)
         self.assertIn(tag2, tags)
 
+    def test_create_recipe_with_names(self):
+        """Test: creating a recipe with tag and ingredient names"""
+        tag = sample_tag(self.user, name='Dessert')
+        payload = {
+            'title': 'Apple pie',
+            'tags': [tag.id, 'dessert', 'Baked'],
+            'ingredients': ['Apple', 'Flour'],
+            'time_minutes': 60,
+            'price': 5.00
+        }
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual({t.name for t in recipe.tags.all()},
+                         {'Dessert', 'Baked'})
+        self.assertEqual({i.name for i in recipe.ingredients.all()},
+                         {'Apple', 'Flour'})
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_create_recipe_with_digit_like_name(self):
+        """Test: non-ASCII digits are names, not ids"""
+        payload = {'title': 'Squared', 'tags': ['²'], 'ingredients': [],
+                   'time_minutes': 5, 'price': 5.00}
+        res = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual([t.name for t in recipe.tags.all()], ['²'])
+
     def test_create_recipe_with_ingredients(self):
         ingredient = sample_ingredient(user=self.user, name='Cheese')
         ingredient2 = sample_ingredient(user=self.user, name='Cake')
@@ -250,6 +334,367 @@ class PrivateRecipeAPITests(TestCase):
         tags = recipe.tags.all()
         self.assertEqual(len(tags), 0)
 
+    def test_partial_update_without_links(self):
+        """Test: a PATCH without tags/ingredients doesn't touch the links"""
+        recipe = sample_recipe(user=self.user)
+        recipe.tags.add(sample_tag(user=self.user))
+
+        # Recipe, previous values (stats), savepoint, UPDATE, release and
+        # the tags/ingredients of the response.
+        with self.assertNumQueries(7):
+            res = self.client.patch(detail_url(recipe.id),
+                                    {'title': 'Chipotle chicken'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(recipe.tags.count(), 1)
+
+    def test_partial_update_unchanged_links(self):
+        """Test: unchanged tags cost one query to check, none to write"""
+        recipe = sample_recipe(user=self.user)
+        tag = sample_tag(user=self.user)
+        recipe.tags.add(tag)
+
+        # Plus the id check and the read of the current links.
+        with self.assertNumQueries(9):
+            self.client.patch(detail_url(recipe.id),
+                              {'title': 'Chipotle chicken', 'tags': [tag.id]},
+                              format='json')
+
+        self.assertEqual(list(recipe.tags.all()), [tag])
+
+    def test_partial_update_links_diff(self):
+        """Test: changed links cost the same queries, whatever their number"""
+        recipe = sample_recipe(user=self.user)
+        kept = sample_tag(user=self.user, name='Kept')
+        removed = [sample_tag(user=self.user, name=f'Removed {i}')
+                   for i in range(5)]
+        added = [sample_tag(user=self.user, name=f'Added {i}')
+                 for i in range(5)]
+        recipe.tags.add(kept, *removed)
+
+        # Plus a DELETE, a bulk INSERT, both count updates and the
+        # RecipeVector update (tag and ingredient links, owner, UPDATE).
+        with self.assertNumQueries(17):
+            self.client.patch(
+                detail_url(recipe.id),
+                {'tags': [kept.id] + [tag.id for tag in added]},
+                format='json'
+            )
+
+        self.assertEqual(set(recipe.tags.all()), {kept, *added})
+        counts = dict(Tag.objects.values_list('name', 'recipe_count'))
+        self.assertEqual(counts['Kept'], 1)
+        self.assertEqual(counts['Removed 0'], 0)
+        self.assertEqual(counts['Added 4'], 1)
+
+    def test_bulk_delete_recipes(self):
+        """Test: deleting many recipes of the user at once"""
+        recipes = [sample_recipe(user=self.user) for _ in range(3)]
+        other_user = get_user_model().objects.create_user(
+            'other@shevo.com',
+            'testing321'
+        )
+        other_recipe = sample_recipe(user=other_user)
+
+        res = self.client.post(
+            BULK_DELETE_URL,
+            {'ids': [recipes[0].id, recipes[1].id, other_recipe.id]},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {'deleted': 2})
+        self.assertEqual(set(Recipe.objects.all()),
+                         {recipes[2], other_recipe})
+
+    def test_shopping_list(self):
+        """Test: the ingredients of the recipes, counted once per recipe"""
+        salt = sample_ingredient(self.user, name='Salt')
+        rice = sample_ingredient(self.user, name='Rice')
+        kale = sample_ingredient(self.user, name='Kale')
+        recipes = [sample_recipe(self.user) for _ in range(3)]
+        recipes[0].ingredients.add(salt, rice)
+        recipes[1].ingredients.add(salt)
+        recipes[2].ingredients.add(kale)
+        other_user = get_user_model().objects.create_user(
+            'other@shevo.com',
+            'testing321'
+        )
+        other_recipe = sample_recipe(user=other_user)
+        other_recipe.ingredients.add(
+            sample_ingredient(other_user, name='Salt')
+        )
+
+        res = self.client.post(
+            SHOPPING_LIST_URL,
+            {'ids': [recipes[0].id, recipes[1].id, other_recipe.id]},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': rice.id, 'name': 'Rice', 'recipe_count': 1},
+            {'id': salt.id, 'name': 'Salt', 'recipe_count': 2},
+        ])
+
+    def test_shopping_list_cache(self):
+        """Test: a repeated list is cached until its recipes change"""
+        salt = sample_ingredient(self.user, name='Salt')
+        recipes = [sample_recipe(self.user) for _ in range(2)]
+        recipes[0].ingredients.add(salt)
+        payload = {'ids': [recipe.id for recipe in recipes]}
+        self.client.post(SHOPPING_LIST_URL, payload, format='json')
+
+        # The version lookup only.
+        with self.assertNumQueries(1):
+            res = self.client.post(SHOPPING_LIST_URL, payload,
+                                   format='json')
+        self.assertEqual(res.data[0]['recipe_count'], 1)
+
+        recipes[1].ingredients.add(salt)
+        res = self.client.post(SHOPPING_LIST_URL, payload, format='json')
+        self.assertEqual(res.data[0]['recipe_count'], 2)
+
+    def test_similar_recipes(self):
+        """Test: the recipes with the most tags in common are listed"""
+        vegan = sample_tag(self.user, name='Vegan')
+        quick = sample_tag(self.user, name='Quick')
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(vegan, quick)
+        close = sample_recipe(self.user, title='Close')
+        close.tags.add(vegan, quick)
+        far = sample_recipe(self.user, title='Far')
+        far.tags.add(vegan)
+        sample_recipe(self.user, title='Unrelated')
+
+        res = self.client.get(similar_url(recipe.id), {'k': 5})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([(r['id'], r['score']) for r in res.data],
+                         [(close.id, 1.0), (far.id, 0.5)])
+        self.assertEqual(res.data[0]['title'], 'Close')
+
+    def test_similar_recipes_invalid_params(self):
+        """Test: an unknown metric or a too large k is rejected"""
+        recipe = sample_recipe(self.user)
+
+        res = self.client.get(similar_url(recipe.id), {'metric': 'euclid'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get(similar_url(recipe.id), {'k': 1000})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_recipes_by_ranges(self):
+        """Test: returning recipes within time and price ranges"""
+        quick = sample_recipe(user=self.user, time_minutes=15, price=4)
+        sample_recipe(user=self.user, time_minutes=15, price=12)
+        sample_recipe(user=self.user, time_minutes=45, price=4)
+
+        res = self.client.get(RECIPES_URL, {'max_time_minutes': 20,
+                                            'min_price': '1.50',
+                                            'max_price': '5.00'})
+
+        self.assertEqual([recipe['id'] for recipe in res.data], [quick.id])
+
+    def test_order_recipes(self):
+        """Test: ordering the recipes, ties by id"""
+        cheap = sample_recipe(user=self.user, price=3)
+        first = sample_recipe(user=self.user, price=8)
+        second = sample_recipe(user=self.user, price=8)
+
+        res = self.client.get(RECIPES_URL, {'ordering': 'price'})
+        self.assertEqual([recipe['id'] for recipe in res.data],
+                         [cheap.id, first.id, second.id])
+        res = self.client.get(RECIPES_URL, {'ordering': '-price'})
+        self.assertEqual([recipe['id'] for recipe in res.data],
+                         [second.id, first.id, cheap.id])
+
+    def test_invalid_list_params(self):
+        """Test: unknown orderings and empty ranges are rejected"""
+        res = self.client.get(RECIPES_URL, {'ordering': 'title'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get(RECIPES_URL, {'min_price': 10,
+                                            'max_price': 5})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_paginate_recipes(self):
+        """Test: walking the pages of a filtered and ordered list"""
+        for time_minutes in (30, 10, 20, 10, 20, 60):
+            sample_recipe(user=self.user, time_minutes=time_minutes)
+        expected = list(Recipe.objects.filter(
+            user=self.user, time_minutes__lte=30
+        ).order_by('-time_minutes', '-id').values_list('id', flat=True))
+
+        ids, url = [], RECIPES_URL
+        params = {'max_time_minutes': 30, 'ordering': '-time_minutes',
+                  'page_size': 2}
+        while url:
+            res = self.client.get(url, params)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(res.data['results']), 2)
+            ids.extend(recipe['id'] for recipe in res.data['results'])
+            # The next link carries the parameters.
+            url, params = res.data['next'], None
+
+        self.assertEqual(ids, expected)
+
+    def test_paginate_invalid_cursor(self):
+        """Test: a tampered cursor is rejected"""
+        res = self.client.get(RECIPES_URL, {'cursor': 'garbage'})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+        for ordering, values in (('-id', ['x']),
+                                 ('price', [{'a': 1}, 2]),
+                                 ('price', [None, 2]),
+                                 ('time_minutes', [10])):
+            cursor = urlsafe_b64encode(json.dumps(values).encode()).decode()
+            res = self.client.get(RECIPES_URL, {'cursor': cursor,
+                                                'ordering': ordering})
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecipeCopyTests(TestCase):
+    """Test: cloning and sharing recipes"""
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            'test@shevo.com',
+            'testing321'
+        )
+        cls.other = get_user_model().objects.create_user(
+            'other@shevo.com',
+            'testing321'
+        )
+        cls.recipe = sample_recipe(user=cls.user, title='Curry',
+                                   link='https://example.com/curry')
+        cls.recipe.image = 'uploads/recipe/curry.jpg'
+        cls.recipe.save()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_relations(self, count, start=0):
+        """Add count tags and ingredients to the recipe"""
+        for i in range(start, start + count):
+            self.recipe.tags.add(sample_tag(self.user, name=f'Tag {i}'))
+            self.recipe.ingredients.add(
+                sample_ingredient(self.user, name=f'Ingredient {i}')
+            )
+
+    def test_clone_recipe(self):
+        """Test: cloning a recipe reuses its tags, ingredients and image"""
+        self.add_relations(2)
+
+        res = self.client.post(clone_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        copy = Recipe.objects.get(id=res.data['id'])
+        self.assertNotEqual(copy.id, self.recipe.id)
+        self.assertEqual(copy.title, 'Curry')
+        self.assertEqual(copy.link, self.recipe.link)
+        self.assertEqual(copy.image.name, 'uploads/recipe/curry.jpg')
+        # Serialized like the detail endpoint does.
+        self.assertEqual(res.data,
+                         self.client.get(detail_url(copy.id)).data)
+        self.assertEqual(set(copy.tags.all()), set(self.recipe.tags.all()))
+        self.assertEqual(set(copy.ingredients.all()),
+                         set(self.recipe.ingredients.all()))
+
+    def share(self, email):
+        """Share the recipe, returning the token of the share"""
+        res = self.client.post(share_url(self.recipe.id), {'email': email})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data['token']
+
+    def accept(self, token, user=None):
+        """Accept a share as user (the recipient by default)"""
+        client = APIClient()
+        client.force_authenticate(user or self.other)
+        return client.post(ACCEPT_SHARE_URL, {'token': token})
+
+    def test_share_recipe(self):
+        """Test: sharing maps tags/ingredients by name for the target"""
+        self.add_relations(2)
+        existing = sample_tag(self.other, name='Tag 0')
+
+        token = self.share('OTHER@shevo.com')
+        # Opt-in: nothing is copied until the recipient accepts.
+        self.assertFalse(Recipe.objects.filter(user=self.other).exists())
+        res = self.accept(token)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        copy = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(copy.user, self.other)
+        self.assertEqual(copy.image.name, self.recipe.image.name)
+        tags = copy.tags.all()
+        self.assertEqual({tag.name for tag in tags}, {'Tag 0', 'Tag 1'})
+        # The target's existing tag is reused, the missing one created.
+        self.assertIn(existing, tags)
+        self.assertTrue(all(tag.user == self.other for tag in tags))
+        self.assertEqual(
+            {i.name for i in copy.ingredients.filter(user=self.other)},
+            {'Ingredient 0', 'Ingredient 1'}
+        )
+
+    def test_share_query_count_constant(self):
+        """Test: sharing costs the same queries for 1 or 10 relations"""
+        def queries_to_share():
+            # The target starts without any tag or ingredient.
+            Tag.objects.filter(user=self.other).delete()
+            Ingredient.objects.filter(user=self.other).delete()
+            token = self.share(self.other.email)
+            with CaptureQueriesContext(connection) as ctx:
+                self.accept(token)
+            return len(ctx)
+
+        self.add_relations(1)
+        # The first share also creates the target's stats rows.
+        queries_to_share()
+        few = queries_to_share()
+        self.add_relations(10, start=1)
+
+        self.assertEqual(queries_to_share(), few)
+
+    def test_share_unknown_user(self):
+        """Test: sharing doesn't tell whether an e-mail has an account"""
+        known = self.client.post(share_url(self.recipe.id),
+                                 {'email': self.other.email})
+        unknown = self.client.post(share_url(self.recipe.id),
+                                   {'email': 'nobody@shevo.com'})
+
+        self.assertEqual(unknown.status_code, known.status_code)
+        self.assertEqual(set(unknown.data), set(known.data))
+
+    def test_accept_share_other_user(self):
+        """Test: only the recipient can accept a share"""
+        third = get_user_model().objects.create_user('third@shevo.com',
+                                                     'testing321')
+        token = self.share(self.other.email)
+
+        res = self.accept(token, user=third)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.filter(user=third).exists())
+
+    def test_accept_share_invalid(self):
+        """Test: forged tokens and deleted recipes can't be accepted"""
+        res = self.accept('forged')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        recipe = sample_recipe(user=self.user)
+        token = RecipeShareAcceptSerializer.sign(recipe, self.other.email)
+        recipe.delete()
+        self.assertEqual(self.accept(token).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_cannot_copy_others_recipe(self):
+        """Test: only the owner can clone or share a recipe"""
+        recipe = sample_recipe(user=self.other)
+
+        res = self.client.post(clone_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
 
 class RecipeImageUploadTests(TestCase):
     """Test the image uploading feature"""
@@ -279,7 +724,14 @@ class RecipeImageUploadTests(TestCase):
         self.recipe.refresh_from_db()
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertIn('image', res.data)  # The response contains an image.
-        self.assertTrue(os.path.exists(self.recipe.image.path))
+        # Shrunk if needed by a job, without changing the answer.
+        self.assertEqual(set(res.data), {'id', 'image'})
+        self.assertTrue(Job.objects.filter(
+            name='core.tasks.resize_recipe_image'
+        ).exists())
+        self.assertTrue(self.recipe.image.storage.exists(
+            self.recipe.image.name
+        ))
 
     def test_upload_image_bad_request(self):
         """Test: uploading an invalid image"""
@@ -349,3 +801,165 @@ class RecipeImageUploadTests(TestCase):
         self.assertIn(serializer.data, res.data)
         self.assertIn(serializer2.data, res.data)
         self.assertNotIn(serializer3.data, res.data)
+
+
+@override_settings(S3_MULTIPART_THRESHOLD=100, S3_MULTIPART_CHUNK_SIZE=50,
+                   MEDIA_UPLOAD_MAX_SIZE=1000)
+class RecipeDirectUploadTests(TestCase):
+    """Test: uploading images straight to the bucket"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            'test@shevo.com',
+            'testing321'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user,
+                                    image='uploads/recipe/old.jpg')
+        self.storage = s3_storage()
+        self.storage.client.head_object.return_value = {'ContentLength': 10}
+        self.storage.client.generate_presigned_post.return_value = {
+            'url': 'https://bucket', 'fields': {'key': 'k'}
+        }
+        self.storage.client.create_multipart_upload.return_value = {
+            'UploadId': 'up'
+        }
+        self.storage.client.generate_presigned_url.return_value = \
+            'https://signed'
+        patcher = patch.object(Recipe._meta.get_field('image'), 'storage',
+                               self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request_upload(self, size=10, content_type='image/jpeg'):
+        return self.client.post(upload_url_url(self.recipe.id),
+                                {'content_type': content_type, 'size': size})
+
+    def test_direct_upload(self):
+        """Test: a presigned POST, then the image is set on the recipe"""
+        res = self.request_upload()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['post']['url'], 'https://bucket')
+        key = self.storage.client.generate_presigned_post.call_args[1]['Key']
+        self.assertTrue(key.startswith('uploads/recipe/'))
+        self.assertTrue(key.endswith('.jpg'))
+
+        res = self.client.post(upload_complete_url(self.recipe.id),
+                               {'upload': res.data['upload']}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, key)
+        self.assertTrue(Job.objects.filter(
+            name='core.tasks.resize_recipe_image'
+        ).exists())
+        self.assertTrue(OrphanedFile.objects.filter(
+            name='uploads/recipe/old.jpg'
+        ).exists())
+
+    def test_multipart_upload(self):
+        """Test: large images are uploaded in presigned parts"""
+        res = self.request_upload(size=120)
+
+        self.assertEqual(res.data['multipart'], {
+            'part_size': 50, 'urls': ['https://signed'] * 3
+        })
+
+        res = self.client.post(upload_complete_url(self.recipe.id), {
+            'upload': res.data['upload'],
+            'parts': [{'part_number': n, 'etag': f'e{n}'} for n in (1, 2, 3)]
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        kwargs = self.storage.client.complete_multipart_upload.call_args[1]
+        self.assertEqual(kwargs['UploadId'], 'up')
+        self.assertEqual(len(kwargs['MultipartUpload']['Parts']), 3)
+
+    def test_multipart_upload_rejected_parts(self):
+        """Test: parts refused by the bucket answer 400 and are aborted"""
+        upload = self.request_upload(size=120).data['upload']
+        self.storage.client.complete_multipart_upload.side_effect = \
+            ClientError('InvalidPart')
+
+        res = self.client.post(upload_complete_url(self.recipe.id), {
+            'upload': upload,
+            'parts': [{'part_number': 1, 'etag': 'wrong'}]
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.storage.client.abort_multipart_upload.assert_called_once()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, 'uploads/recipe/old.jpg')
+
+    def test_multipart_upload_too_large(self):
+        """Test: too large parts are aborted, not assembled"""
+        upload = self.request_upload(size=120).data['upload']
+        self.storage.client.get_paginator.return_value.paginate.\
+            return_value = [{'Parts': [{'Size': 600}, {'Size': 600}]}]
+
+        res = self.client.post(upload_complete_url(self.recipe.id), {
+            'upload': upload,
+            'parts': [{'part_number': n, 'etag': f'e{n}'} for n in (1, 2)]
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.storage.client.abort_multipart_upload.assert_called_once()
+        self.storage.client.complete_multipart_upload.assert_not_called()
+
+    def test_multipart_upload_requires_parts(self):
+        """Test: completing a multipart upload needs its parts"""
+        upload = self.request_upload(size=120).data['upload']
+
+        res = self.client.post(upload_complete_url(self.recipe.id),
+                               {'upload': upload}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('parts', res.data)
+
+    def test_too_large_upload_deleted(self):
+        """Test: an uploaded file over the limit is deleted"""
+        upload = self.request_upload().data['upload']
+        self.storage.client.head_object.return_value = {
+            'ContentLength': 2000
+        }
+
+        res = self.client.post(upload_complete_url(self.recipe.id),
+                               {'upload': upload}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.storage.client.delete_object.assert_called_once()
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image.name, 'uploads/recipe/old.jpg')
+
+    def test_invalid_requests(self):
+        """Test: unsupported types and sizes are rejected"""
+        self.assertEqual(self.request_upload(content_type='text/html')
+                         .status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.request_upload(size=2000).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_of_other_recipe(self):
+        """Test: an upload can't be completed for another recipe"""
+        upload = self.request_upload().data['upload']
+        other = sample_recipe(user=self.user)
+
+        res = self.client.post(upload_complete_url(other.id),
+                               {'upload': upload}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_local_storage(self):
+        """Test: direct uploads need an object storage"""
+        patcher = patch.object(Recipe._meta.get_field('image'), 'storage',
+                               InMemoryStorage())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        res = self.request_upload()
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,102 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+
+
+STATS_URL = reverse('recipe:stats')
+
+
+def sample_recipe(user, **params):
+    """Create and return a sample recipe"""
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': Decimal('5.00')
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class PublicStatsApiTests(TestCase):
+    """Test: unauthenticated statistics API access"""
+
+    def test_auth_required(self):
+        """Test: authentication is required"""
+        res = APIClient().get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateStatsApiTests(TestCase):
+    """Test: authenticated statistics API access"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            'test@shevo.com',
+            'testing321'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_no_recipes(self):
+        """Test: statistics of a user without recipes"""
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 0)
+        self.assertIsNone(res.data['average_price'])
+        self.assertEqual(res.data['price_distribution'], [])
+
+    def test_statistics(self):
+        """Test: retrieving the recipe statistics"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        dessert = Tag.objects.create(user=self.user, name='Dessert')
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+        recipe1 = sample_recipe(self.user, time_minutes=10,
+                                price=Decimal('3.00'))
+        recipe2 = sample_recipe(self.user, time_minutes=20,
+                                price=Decimal('4.00'))
+        recipe3 = sample_recipe(self.user, time_minutes=60,
+                                price=Decimal('11.00'))
+        recipe1.tags.add(vegan, dessert)
+        recipe2.tags.add(vegan)
+        recipe3.ingredients.add(salt)
+        # Another user's recipes are not counted.
+        other = get_user_model().objects.create_user('other@shevo.com', 'pw')
+        sample_recipe(other, price=Decimal('100.00'))
+
+        # Constant number of queries, whatever the number of recipes.
+        with self.assertNumQueries(4):
+            res = self.client.get(STATS_URL, {'top': 1})
+
+        self.assertEqual(res.data['recipe_count'], 3)
+        self.assertEqual(res.data['average_time_minutes'], 30)
+        self.assertEqual(res.data['average_price'], Decimal('6.00'))
+        self.assertEqual(res.data['price_distribution'], [
+            {'min_price': 0, 'max_price': 5, 'recipe_count': 2},
+            {'min_price': 10, 'max_price': 15, 'recipe_count': 1},
+        ])
+        self.assertEqual(res.data['most_used_tags'], [
+            {'id': vegan.id, 'name': 'Vegan', 'recipe_count': 2}
+        ])
+        self.assertEqual(res.data['most_used_ingredients'], [
+            {'id': salt.id, 'name': 'Salt', 'recipe_count': 1}
+        ])
+
+    def test_invalid_top(self):
+        """Test: a non-numeric, negative or too large top is rejected"""
+        for top in ('abc', -1, 1000):
+            res = self.client.get(STATS_URL, {'top': top})
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
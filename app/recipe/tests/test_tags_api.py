@@ -11,6 +11,7 @@ from recipe.serializers import TagSerializer
 
 
 TAGS_URL = reverse('recipe:tag-list')
+TAGS_BULK_URL = reverse('recipe:tag-bulk')
 
 
 class PublicTagsApiTest(TestCase):
@@ -28,11 +29,14 @@ class PublicTagsApiTest(TestCase):
 
 class PrivateTagsApiTest(TestCase):
     """Test the authorized user tags API"""
-    def setUp(self):
-        self.user = get_user_model().objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
             'test@shevo.com',
             'testing321'
         )
+
+    def setUp(self):
         self.client = APIClient()
         self.client.force_authenticate(self.user)
 
@@ -136,3 +140,88 @@ class PrivateTagsApiTest(TestCase):
         # We check that, even though a tag has been assigned to 2 recipes,
         # the result will bring back the tag only once.
         self.assertEqual(len(res.data), 1)
+
+    def test_retrieve_tags_with_counts(self):
+        """Test: listing tags with their number of recipes"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        unused = Tag.objects.create(user=self.user, name='Dessert')
+        recipe = Recipe.objects.create(
+            title='Recipe 1',
+            time_minutes=5,
+            price=3.00,
+            user=self.user
+        )
+        recipe.tags.add(tag)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(TAGS_URL, {'with_counts': 1})
+
+        self.assertEqual(res.data, [
+            {'id': tag.id, 'name': 'Vegan', 'recipe_count': 1},
+            {'id': unused.id, 'name': 'Dessert', 'recipe_count': 0},
+        ])
+
+    def test_retrieve_tags_without_counts(self):
+        """Test: the counts are only returned when requested"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertNotIn('recipe_count', res.data[0])
+
+    def test_create_tag_duplicate_name(self):
+        """Test: a tag name can't be created twice, whatever its case"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(TAGS_URL, {'name': 'VEGAN'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_get_or_create_tags(self):
+        """Test: getting the ids of tags by name, creating missing ones"""
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        other_user = get_user_model().objects.create_user(
+            'other@shevo.com',
+            'testing123'
+        )
+        Tag.objects.create(user=other_user, name='Dessert')
+
+        with self.assertNumQueries(2):
+            res = self.client.post(
+                TAGS_BULK_URL,
+                {'names': ['Dessert', 'vegan', 'Dessert']},
+                format='json'
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        dessert = Tag.objects.get(user=self.user, name='Dessert')
+        self.assertEqual(res.data, [
+            {'id': dessert.id, 'name': 'Dessert'},
+            {'id': vegan.id, 'name': 'vegan'},
+            {'id': dessert.id, 'name': 'Dessert'},
+        ])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_bulk_tags_non_ascii_names(self):
+        """Test: names are matched like the database lowers them"""
+        eclair = Tag.objects.create(user=self.user, name='Éclair')
+
+        res = self.client.post(
+            TAGS_BULK_URL,
+            {'names': ['Éclair', 'ΟΔΟΣ', 'οδος', 'Crème']},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = {tag['name']: tag['id'] for tag in res.data}
+        self.assertEqual(ids['Éclair'], eclair.id)
+        self.assertEqual(
+            Tag.objects.filter(user=self.user, pk__in=ids.values()).count(),
+            len(set(ids.values()))
+        )
+
+    def test_bulk_tags_invalid(self):
+        """Test: bulk get-or-create needs a list of names"""
+        res = self.client.post(TAGS_BULK_URL, {'names': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,15 +1,40 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.urls import reverse
 from rest_framework.decorators import action  # For custom actions!
 from rest_framework.response import Response  # For a custom response"
 from rest_framework import viewsets, mixins, status
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 
-from core.models import Tag, Ingredient, Recipe
+from core.deletion import delete_recipes
+from core.jobs import enqueue
+from core.models import Tag, Ingredient, Recipe, RecipeStats, \
+                        RecipePriceBucket, recipe_image_file_path
+from core.pagination import KeysetPagination
+from core.shopping import shopping_list
+from core.similarity import similar_recipes
+from core.tasks import resize_recipe_image
+from core.throttling import ImageUploadThrottle, ReadWriteThrottle
 from recipe.serializers import (TagSerializer,
+                                TagCountSerializer,
                                 IngredientSerializer,
+                                IngredientCountSerializer,
+                                NamesSerializer,
                                 RecipeSerializer,
                                 RecipeDetailSerializer,
-                                RecipeImageSerializer)
+                                RecipeImageSerializer,
+                                RecipeShareSerializer,
+                                RecipeShareAcceptSerializer,
+                                RecipeIdsSerializer,
+                                RecipeUploadUrlSerializer,
+                                RecipeUploadCompleteSerializer,
+                                RecipeListQuerySerializer,
+                                RecipeStatsQuerySerializer,
+                                SimilarRecipesQuerySerializer)
 
 
 class BaseRecipeAttrViewset(viewsets.GenericViewSet,
@@ -19,22 +44,45 @@ class BaseRecipeAttrViewset(viewsets.GenericViewSet,
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
+    # Serializer that also returns recipe_count (?with_counts=1).
+    count_serializer_class = None
+
+    def _query_flag(self, name):
+        """Return the boolean value of a 0/1 query parameter"""
+        # Passing 0 as default value.
+        return bool(int(self.request.query_params.get(name, 0)))
+
     # We overwrite the get_queryset() function.
     def get_queryset(self):
         """Returning objects for the current authenticated user only"""
         # Here we implement the filtering feature.
-        assigned_only = bool(
-            # Passing 0 as default value.
-            int(self.request.query_params.get('assigned_only', 0))
-        )
         queryset = self.queryset
-        if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
+        if self._query_flag('assigned_only'):
+            # EXISTS stops at the first recipe found and returns each row
+            # once, unlike a join that needs a distinct().
+            through = getattr(Recipe, self.recipe_field).through
+            model_name = self.queryset.model._meta.model_name
+            links = through.objects.filter(
+                **{f'{model_name}_id': OuterRef('pk')}
+            )
+            queryset = queryset.annotate(
+                assigned=Exists(links)
+            ).filter(assigned=True)
 
         # The following line will work because authentication is required.
         return queryset.filter(
             user=self.request.user
-            ).order_by('-name').distinct()
+            ).order_by('-name')
+
+    def get_serializer_class(self):
+        """Return the serializer with the usage counts if requested"""
+        if self.action == 'list' and self._query_flag('with_counts'):
+            # recipe_count is a column maintained by core.signals,
+            # so no per-row (nor aggregate) query is needed.
+            return self.count_serializer_class
+        if self.action == 'bulk':
+            return NamesSerializer
+        return self.serializer_class
 
     # We overwrite the create function.
     # The user will be the authenticated user.
@@ -42,17 +90,33 @@ class BaseRecipeAttrViewset(viewsets.GenericViewSet,
         """Create a new object"""
         serializer.save(user=self.request.user)
 
+    @action(methods=['POST'], detail=False)
+    def bulk(self, request):
+        """Return the ids of the given names, creating the missing ones"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        names = serializer.validated_data['names']
+        ids = self.queryset.model.objects.ids_for_names(request.user, names)
+
+        # In the order of the request.
+        return Response([{'id': ids[name], 'name': name} for name in names])
+
 
 class TagViewSet(BaseRecipeAttrViewset):
     queryset = Tag.objects.all()
 
     serializer_class = TagSerializer
+    count_serializer_class = TagCountSerializer
+    # Name of the Recipe field that links to the objects.
+    recipe_field = 'tags'
 
 
 class IngredientViewSet(BaseRecipeAttrViewset):
     queryset = Ingredient.objects.all()
 
     serializer_class = IngredientSerializer
+    count_serializer_class = IngredientCountSerializer
+    recipe_field = 'ingredients'
 
 
 # We provide all the CRUD functionalities with the ModelViewset.
@@ -67,6 +131,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     permission_classes = (IsAuthenticated,)
 
+    # Opt-in with ?page_size=: deep pages cost as much as the first one.
+    pagination_class = KeysetPagination
+
     def _params_to_ints(self, qs):
         # (The _ indicates that the function is intended to be private).
         """Convert a list of string IDs to a list of integers"""
@@ -93,7 +160,42 @@ class RecipeViewSet(viewsets.ModelViewSet):
             ingredients_ids = self._params_to_ints(ingredients)
             queryset = queryset.filter(ingredients__id__in=ingredients_ids)
 
-        return queryset.filter(user=self.request.user).order_by('-id')
+        queryset = queryset.filter(user=self.request.user)
+        if self.action == 'list':
+            queryset = self._filter_list(queryset)
+        else:
+            queryset = queryset.order_by('-id')
+        if self.action in ('list', 'retrieve', 'clone'):
+            # Load the tags and ingredients of all the recipes in 2 queries,
+            # instead of 2 per recipe. Read requests hold a thread (and a
+            # DB connection) for much less time.
+            queryset = queryset.prefetch_related('tags', 'ingredients')
+
+        return queryset
+
+    def _filter_list(self, queryset):
+        """Apply the time/price ranges and the ordering of the query"""
+        params = RecipeListQuerySerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+        for field in ('time_minutes', 'price'):
+            if f'min_{field}' in params:
+                queryset = queryset.filter(
+                    **{f'{field}__gte': params[f'min_{field}']}
+                )
+            if f'max_{field}' in params:
+                queryset = queryset.filter(
+                    **{f'{field}__lte': params[f'max_{field}']}
+                )
+
+        ordering = params['ordering']
+        if ordering.lstrip('-') != 'id':
+            # The id, in the same direction, makes the order total (for
+            # the pagination) and matches the index.
+            return queryset.order_by(
+                ordering, '-id' if ordering.startswith('-') else 'id'
+            )
+        return queryset.order_by(ordering)
 
     def get_serializer_class(self):
         """Return appropriate serializer class"""
@@ -102,6 +204,16 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeDetailSerializer
         elif self.action == 'upload_image':
             return RecipeImageSerializer
+        elif self.action == 'share':
+            return RecipeShareSerializer
+        elif self.action == 'accept_share':
+            return RecipeShareAcceptSerializer
+        elif self.action in ('bulk_delete', 'shopping_list'):
+            return RecipeIdsSerializer
+        elif self.action == 'upload_url':
+            return RecipeUploadUrlSerializer
+        elif self.action == 'upload_complete':
+            return RecipeUploadCompleteSerializer
         # Else, we return the normal serializer class
         return self.serializer_class
 
@@ -111,8 +223,107 @@ class RecipeViewSet(viewsets.ModelViewSet):
         # (determined according to the get_serializer_class function).
         serializer.save(user=self.request.user)
 
+    @action(methods=['POST'], detail=True)
+    def clone(self, request, pk=None):
+        """Duplicate a recipe, reusing its tags, ingredients and image"""
+        copy = self.get_object().copy_for(request.user)
+
+        return Response(
+            # With the request, like the serializers of the other actions.
+            RecipeDetailSerializer(
+                copy, context=self.get_serializer_context()
+            ).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(methods=['POST'], detail=True)
+    def share(self, request, pk=None):
+        """Offer a copy of a recipe to another user"""
+        recipe = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # Nothing is written to the recipient's account until they accept
+        # the token, and the answer is the same whether the e-mail has an
+        # account or not.
+        token = RecipeShareAcceptSerializer.sign(
+            recipe, serializer.validated_data['email']
+        )
+
+        return Response({
+            'token': token,
+            'accept_url': request.build_absolute_uri(
+                reverse('recipe:recipe-accept-share')
+            ),
+        })
+
+    @action(methods=['POST'], detail=False, url_path='accept-share')
+    def accept_share(self, request):
+        """Copy a recipe shared with the user to their account"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        share = serializer.validated_data['token']
+        # Unless the owner deleted the recipe since.
+        recipe = get_object_or_404(
+            Recipe.objects.prefetch_related('tags', 'ingredients'),
+            pk=share['recipe'],
+            user_id=share['owner']
+        )
+        # Tags and ingredients are matched by name in the target account.
+        copy = recipe.copy_for(request.user)
+
+        return Response(
+            RecipeDetailSerializer(
+                copy, context=self.get_serializer_context()
+            ).data,
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(methods=['GET'], detail=True)
+    def similar(self, request, pk=None):
+        """The recipes of the user with the most tags/ingredients in common"""
+        recipe = self.get_object()
+        params = SimilarRecipesQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        scores = similar_recipes(recipe, **params.validated_data)
+
+        recipes = Recipe.objects.filter(
+            user=request.user
+        ).prefetch_related('tags', 'ingredients').in_bulk(
+            [recipe_id for recipe_id, _ in scores]
+        )
+        context = self.get_serializer_context()
+        return Response([
+            {**RecipeSerializer(recipes[recipe_id], context=context).data,
+             'score': round(score, 4)}
+            for recipe_id, score in scores
+            # Unless deleted since the results were cached.
+            if recipe_id in recipes
+        ])
+
+    @action(methods=['POST'], detail=False, url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """Delete many recipes of the user in batched statements"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        deleted = delete_recipes(Recipe.objects.filter(
+            user=request.user,
+            pk__in=serializer.validated_data['ids']
+        ))
+
+        return Response({'deleted': deleted})
+
+    @action(methods=['POST'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """The ingredients of many recipes, with the recipes using each"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        return Response(shopping_list(request.user,
+                                      serializer.validated_data['ids']))
+
     # The detail URL (the one that contains the recipie id) is used.
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    @action(methods=['POST'], detail=True, url_path='upload-image',
+            throttle_classes=(ImageUploadThrottle, ReadWriteThrottle))
     def upload_image(self, request, pk=None):
         """Upload an image to a recipe"""
         # Get the object (based on the ID in URL).
@@ -124,12 +335,157 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         if serializer.is_valid():
             serializer.save()
-            return Response(
-                serializer.data,
-                status=status.HTTP_200_OK
-            )
+            return self._image_saved(recipe)
         # If it doesn't work:
         return Response(
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    def _image_saved(self, recipe):
+        """Answer an image upload, once the recipe references the image"""
+        # Oversized images are shrunk by a worker, not in the request. The
+        # answer doesn't wait for it, nor change: the image is already set.
+        enqueue(resize_recipe_image, recipe.id, recipe.image.name,
+                queue='images', user=self.request.user)
+        return Response(
+            RecipeImageSerializer(
+                recipe, context=self.get_serializer_context()
+            ).data,
+            status=status.HTTP_200_OK
+        )
+
+    def _direct_upload_storage(self):
+        """The image storage, if clients can upload to it directly"""
+        storage = Recipe._meta.get_field('image').storage
+        if not hasattr(storage, 'presigned_post'):
+            raise ValidationError({'detail': 'Direct uploads need an object '
+                                             'storage, use upload-image.'})
+        return storage
+
+    @action(methods=['POST'], detail=True, url_path='upload-url',
+            throttle_classes=(ImageUploadThrottle, ReadWriteThrottle))
+    def upload_url(self, request, pk=None):
+        """Presign the upload of an image straight to the bucket"""
+        # The client sends the file to the bucket, then calls
+        # upload-complete with the returned `upload`.
+        recipe = self.get_object()
+        storage = self._direct_upload_storage()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        content_type = serializer.validated_data['content_type']
+        size = serializer.validated_data['size']
+        extension = settings.MEDIA_UPLOAD_CONTENT_TYPES[content_type]
+        name = recipe_image_file_path(recipe, f'image.{extension}')
+
+        if size <= settings.S3_MULTIPART_THRESHOLD:
+            return Response({
+                'upload': RecipeUploadCompleteSerializer.sign(recipe, name),
+                'post': storage.presigned_post(name, content_type, size),
+            })
+        # Large images: PUT every part to its URL, and send the ETag
+        # headers of the responses to upload-complete.
+        upload_id, urls = storage.create_multipart_upload(name,
+                                                          content_type, size)
+        return Response({
+            'upload': RecipeUploadCompleteSerializer.sign(recipe, name,
+                                                          upload_id),
+            'multipart': {'part_size': settings.S3_MULTIPART_CHUNK_SIZE,
+                          'urls': urls},
+        })
+
+    @action(methods=['POST'], detail=True, url_path='upload-complete',
+            throttle_classes=(ImageUploadThrottle, ReadWriteThrottle))
+    def upload_complete(self, request, pk=None):
+        """Set the image uploaded to the bucket as the recipe image"""
+        recipe = self.get_object()
+        storage = self._direct_upload_storage()
+        serializer = self.get_serializer_class()(
+            data=request.data,
+            context={**self.get_serializer_context(), 'recipe': recipe}
+        )
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.validated_data['upload']
+        name = upload['name']
+
+        upload_id = upload['upload_id']
+        if upload_id:
+            # Multipart uploads can't be limited by the presigned URLs:
+            # the parts are checked before they're assembled. A rejected
+            # upload is aborted, its parts are billed until then.
+            try:
+                if storage.multipart_upload_size(name, upload_id) > \
+                        settings.MEDIA_UPLOAD_MAX_SIZE:
+                    storage.abort_multipart_upload(name, upload_id)
+                    return Response({'upload': ['The image is too large.']},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                storage.complete_multipart_upload(
+                    name, upload_id,
+                    [(part['part_number'], part['etag'])
+                     for part in serializer.validated_data['parts']]
+                )
+            except ValueError as exc:
+                storage.abort_multipart_upload(name, upload_id)
+                return Response({'upload': [str(exc)]},
+                                status=status.HTTP_400_BAD_REQUEST)
+        if not storage.exists(name):
+            return Response({'upload': ['The file was not uploaded.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if storage.size(name) > settings.MEDIA_UPLOAD_MAX_SIZE:
+            storage.delete(name)
+            return Response({'upload': ['The image is too large.']},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # The replaced image is queued for deletion by the signals.
+        recipe.image = name
+        recipe.save()
+        return self._image_saved(recipe)
+
+
+class RecipeStatsView(APIView):
+    """Recipe statistics of the authenticated user"""
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def _most_used(self, model, top):
+        """Return the most used tags/ingredients of the user"""
+        # Served by the (user, -recipe_count) index.
+        return list(
+            model.objects.filter(user=self.request.user, recipe_count__gt=0)
+            .order_by('-recipe_count', 'name')
+            .values('id', 'name', 'recipe_count')[:top]
+        )
+
+    def get(self, request):
+        """Read the precomputed rollups, whatever the number of recipes"""
+        params = RecipeStatsQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        top = params.validated_data['top']
+        stats = RecipeStats.objects.filter(user=request.user).first()
+        count = stats.recipe_count if stats else 0
+
+        buckets = RecipePriceBucket.objects.filter(
+            user=request.user,
+            recipe_count__gt=0
+        ).order_by('bucket').values_list('bucket', 'recipe_count')
+        width = RecipePriceBucket.WIDTH
+        average_time = average_price = None
+        if count:
+            average_time = round(stats.time_minutes_total / count, 2)
+            average_price = round(stats.price_total / count, 2)
+
+        return Response({
+            'recipe_count': count,
+            'average_time_minutes': average_time,
+            'average_price': average_price,
+            'price_distribution': [
+                {
+                    'min_price': bucket * width,
+                    'max_price': (bucket + 1) * width,
+                    'recipe_count': bucket_count
+                }
+                for bucket, bucket_count in buckets
+            ],
+            'most_used_tags': self._most_used(Tag, top),
+            'most_used_ingredients': self._most_used(Ingredient, top)
+        })
@@ -1,10 +1,15 @@
-from django.test import TestCase
+import json
+
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core.models import Job
+
 
 CREATE_USER_URL = reverse('user:create')
 TOKEN_URL = reverse('user:token')
@@ -178,3 +183,27 @@ class PrivateUserApiTests(TestCase):
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_delete_account_deferred(self):
+        """Test: deleting the account deactivates it at once"""
+        Token.objects.create(user=self.user)
+
+        res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertIsNotNone(self.user.deletion_requested_at)
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+        job = Job.objects.get(name='core.tasks.delete_account')
+        self.assertEqual(json.loads(job.arguments)['args'], [self.user.pk])
+
+    @override_settings(ACCOUNT_DELETION_DEFERRED=False)
+    def test_delete_account_inline(self):
+        """Test: deleting the account in the request"""
+        res = self.client.delete(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists()
+        )
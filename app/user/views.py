@@ -1,7 +1,13 @@
-from rest_framework import generics, authentication, permissions
+from django.conf import settings
+from rest_framework import generics, authentication, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
+from core import tasks
+from core.deletion import delete_account, request_account_deletion
+from core.jobs import enqueue
+from core.throttling import LoginThrottle, SignupThrottle
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
@@ -9,17 +15,23 @@ from user.serializers import UserSerializer, AuthTokenSerializer
 class CreateUserView(generics.CreateAPIView):
     """Create a new user in the system"""
     serializer_class = UserSerializer
+    # Every new user costs a password hash.
+    throttle_classes = (SignupThrottle,)
 
 
 class CreateTokenView(ObtainAuthToken):
     """Create a new auth token for user"""
     serializer_class = AuthTokenSerializer
+    # Limits password hashing (and guessing) per IP address.
+    throttle_classes = (LoginThrottle,)
 
     # We set the endpoint so the view is rendered in the browser.
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    # ObtainAuthToken only accepts form and JSON bodies.
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(generics.RetrieveUpdateDestroyAPIView):
     """Manage the authenticated user"""
     serializer_class = UserSerializer
     # We just as the user to have a token.
@@ -31,3 +43,15 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
         # The authentication has already been taken for
         # (thanks to the authentication_classes).
         return self.request.user
+
+    def destroy(self, request, *args, **kwargs):
+        """Delete the account, or deactivate it and queue its deletion"""
+        user = self.get_object()
+        if settings.ACCOUNT_DELETION_DEFERRED:
+            # The recipes may take a while to delete: a job of the
+            # deletion queue does it (purge_accounts catches any left).
+            request_account_deletion(user)
+            enqueue(tasks.delete_account, user.pk, queue='deletion')
+            return Response(status=status.HTTP_202_ACCEPTED)
+        delete_account(user)
+        return Response(status=status.HTTP_204_NO_CONTENT)